@@ -0,0 +1,109 @@
+"""
+Messages and bytes sent to the broker with and without batched value
+publication.
+
+Every run hosts simulated devices with every sensor and joystick node
+subscribed, in a fresh process, and counts the subscription update
+messages, the value updates they carry and their serialised size. The
+per-update mode puts back the dslink subscription manager, which sends one
+message per set_value.
+
+    python benchmarks/batching.py --devices 4 --duration 10
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from inprocess import create_link, subscribe
+
+# Name, flush window and max update rate of each mode
+MODES = (
+    ("per-update", None, 0.0),
+    ("tick", 0.0, 0.0),
+    ("window-50ms", 0.05, 0.0),
+    ("window-50ms-cap-5", 0.05, 5.0)
+)
+
+
+def run_mode(mode, count, duration, warmup):
+    from dslink.Responder import LocalSubscriptionManager
+    from twisted.internet import reactor
+    from backend import SimulatedBackend
+    from device import Device
+
+    _, flush_window, max_rate = [m for m in MODES if m[0] == mode][0]
+    devices = [Device(SimulatedBackend(stick_interval=0.1), "device%d" % i) for i in range(count)]
+    link = create_link(devices, flush_window or 0.0, max_rate)
+    link.start()
+    if flush_window is None:
+        manager = LocalSubscriptionManager(link)
+        manager.path_subs = link.subscriptions.path_subs
+        manager.sids_path = link.subscriptions.sids_path
+        link.responder.subscription_manager = manager
+
+    root = link.responder.get_super_root()
+    for device in devices:
+        for nodes in device.sensor_nodes.values():
+            for node in nodes:
+                subscribe(link, node)
+        for node in root.get("/%s/stick" % device.name).children.values():
+            subscribe(link, node)
+
+    result = {}
+
+    def begin():
+        result["times"] = os.times()
+        result["wall"] = time.time()
+        result["messages"] = link.wsp.messages
+        result["bytes"] = link.wsp.bytes
+        result["published"] = sum(device.publisher.published for device in devices)
+
+    def finish():
+        times = os.times()
+        wall = time.time() - result["wall"]
+        cpu = (times[0] + times[1]) - (result["times"][0] + result["times"][1])
+        print(json.dumps({
+            "cpu": cpu / wall * 100,
+            "messages": (link.wsp.messages - result["messages"]) / wall,
+            "bytes": (link.wsp.bytes - result["bytes"]) / wall,
+            "published": (sum(device.publisher.published for device in devices) - result["published"]) / wall
+        }))
+        sys.stdout.flush()
+        os._exit(0)
+
+    reactor.callLater(warmup, begin)
+    reactor.callLater(warmup + duration, finish)
+    reactor.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="Seconds to measure each mode for")
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--run", choices=[mode[0] for mode in MODES], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        run_mode(args.run, args.devices, args.duration, args.warmup)
+        return
+
+    print("%-18s %8s %11s %10s %10s" % ("mode", "cpu %", "values/s", "msgs/s", "KB/s"))
+    for mode, _, _ in MODES:
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__), "--run", mode, "--devices", str(args.devices),
+            "--duration", str(args.duration), "--warmup", str(args.warmup)
+        ])
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        print("%-18s %8.1f %11.0f %10.0f %10.1f" % (
+            mode, result["cpu"], result["published"], result["messages"], result["bytes"] / 1024.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+CPU and memory cost of hosting simulated devices in one link process.
+
+Every run hosts N simulated devices in a fresh process with every sensor
+and joystick node subscribed. The link runs against an in-process
+responder instead of a broker connection, and the process CPU time and
+RSS are reported in total and per device.
+
+    python benchmarks/device_scaling.py --devices 1 2 4 8 16 --duration 10
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from inprocess import create_link, rss_kb, subscribe
+
+
+def run_devices(count, duration, warmup, latency):
+    from twisted.internet import reactor
+    from backend import SimulatedBackend
+    from device import Device
+
+    baseline = rss_kb()
+    devices = [Device(SimulatedBackend(latency=latency), "device%d" % i) for i in range(count)]
+    link = create_link(devices)
+    link.start()
+
+    root = link.responder.get_super_root()
+    for device in devices:
+        for nodes in device.sensor_nodes.values():
+            for node in nodes:
+                subscribe(link, node)
+        for node in root.get("/%s/stick" % device.name).children.values():
+            subscribe(link, node)
+
+    result = {}
+
+    def begin():
+        result["times"] = os.times()
+        result["wall"] = time.time()
+        result["messages"] = link.wsp.messages
+
+    def finish():
+        times = os.times()
+        wall = time.time() - result["wall"]
+        cpu = (times[0] + times[1]) - (result["times"][0] + result["times"][1])
+        result.update({
+            "devices": count,
+            "cpu": cpu / wall * 100,
+            "rss": rss_kb(),
+            "baseline": baseline,
+            "threads": threading.active_count(),
+            "messages": (link.wsp.messages - result["messages"]) / wall
+        })
+        del result["times"], result["wall"]
+        for device in devices:
+            device.stop()
+        reactor.stop()
+
+    reactor.callLater(warmup, begin)
+    reactor.callLater(warmup + duration, finish)
+    reactor.run()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="Seconds to measure each run for")
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds each simulated sensor read blocks for")
+    parser.add_argument("--run", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        run_devices(args.run, args.duration, args.warmup, args.latency)
+        return
+
+    print("%8s %8s %10s %9s %10s %9s %10s" % (
+        "devices", "cpu %", "cpu %/dev", "rss MB", "added MB", "MB/dev", "msgs/s"))
+    for count in args.devices:
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__), "--run", str(count),
+            "--duration", str(args.duration), "--warmup", str(args.warmup),
+            "--latency", str(args.latency)
+        ])
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        added = (result["rss"] - result["baseline"]) / 1024.0
+        print("%8d %8.1f %10.2f %9.1f %10.1f %9.2f %10.0f" % (
+            count, result["cpu"], result["cpu"] / count, result["rss"] / 1024.0,
+            added, added / count, result["messages"]))
+
+
+if __name__ == "__main__":
+    main()
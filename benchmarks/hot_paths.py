@@ -0,0 +1,390 @@
+"""
+Throughput, latency percentiles and allocations of the hot paths of the
+link, compared against a saved baseline.
+
+Every path runs in process against the simulated backend and a stub
+responder that only holds the node tree and the subscriptions, so neither a
+broker nor the request handling of dslink is involved. The display commands
+are drawn synchronously, down to the in-memory framebuffer, instead of on
+the display thread. Allocations are measured with tracemalloc, on Python 2
+only when the pytracemalloc backport is installed.
+
+    python benchmarks/hot_paths.py
+    python benchmarks/hot_paths.py --save
+
+The baseline in hot_paths.json was saved with --save. A run exits with
+status 1 when a path got slower or allocates more than the threshold
+percentage, or when there is no baseline to compare against.
+"""
+from __future__ import print_function
+
+import argparse
+import binascii
+from collections import OrderedDict
+import gc
+import json
+import os
+import sys
+import time
+
+import dslink
+from inprocess import create_link, subscribe
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "hot_paths.json")
+
+PERCENTILES = (50, 90, 99)
+
+# Setup function of every path by name, in the order they run
+CASES = OrderedDict()
+
+
+def case(name):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+class Subscriptions(object):
+    """
+    Stands in for the subscription manager of the responder until the link
+    replaces it with its BatchingSubscriptionManager.
+    """
+
+    def __init__(self):
+        self.path_subs = {}
+        self.sids_path = {}
+
+    def get_sub(self, path):
+        return self.path_subs.get(path)
+
+    def send_value_update(self, node):
+        pass
+
+
+class Profiles(object):
+    """
+    Stands in for the profile manager, the actions are called directly
+    instead of being invoked.
+    """
+
+    def __init__(self):
+        self.callbacks = {}
+
+    def create_profile(self, profile):
+        self.callbacks[profile] = None
+
+    def register_callback(self, profile, callback):
+        self.callbacks[profile] = callback
+
+    def get_profile(self, profile):
+        raise ValueError("Profile %s is not invokable in process" % profile)
+
+
+class Responder(object):
+    """
+    The parts of the dslink Responder the link and its nodes use, without
+    loading or saving nodes.json and without handling requests.
+    """
+
+    def __init__(self, link):
+        self.link = link
+        self.nodes_changed = False
+        self.subscription_manager = Subscriptions()
+        self.profile_manager = Profiles()
+        self.super_root = None
+
+    def start(self):
+        self.super_root = self.create_empty_super_root()
+
+    def get_super_root(self):
+        return self.super_root
+
+    def create_empty_super_root(self):
+        root = dslink.Node("", None)
+        root.link = self.link
+        return root
+
+
+def cycle(values):
+    """
+    Endless iterator over values that works as a plain function.
+    """
+    state = [0]
+
+    def next_value():
+        value = values[state[0] % len(values)]
+        state[0] += 1
+        return value
+    return next_value
+
+
+def draw(device):
+    """
+    Run the queued display commands and write the merged frame, what the
+    display thread does for every batch.
+    """
+    display = device.display
+    commands = display._wait(0)
+    for command in commands:
+        display.execute(command)
+    if commands:
+        display.compositor.flush()
+
+
+@case("rgb")
+def bench_rgb(link, device):
+    from pixels import rgb
+    colors = cycle(["%06x" % (i * 0x10307 & 0xFFFFFF) for i in range(256)])
+    return lambda: rgb(colors())
+
+
+@case("set_pixel")
+def bench_set_pixel(link, device):
+    parameters = cycle([(None, {"X": i % 8, "Y": i // 8 % 8, "Color": i * 0x10307 & 0xFFFFFF})
+                        for i in range(256)])
+
+    def op():
+        device.set_pixel(parameters())
+        draw(device)
+    return op
+
+
+@case("set_pixels_json")
+def bench_set_pixels_json(link, device):
+    frames = cycle([(None, {"Pixels": json.dumps([[(i + k) % 256, k * 4, 255 - k] for k in range(64)])})
+                    for i in range(16)])
+
+    def op():
+        device.set_pixels(frames())
+        draw(device)
+    return op
+
+
+@case("set_pixels_hex")
+def bench_set_pixels_hex(link, device):
+    frames = cycle([(None, {"Pixels": binascii.hexlify(bytes(bytearray([(i + k) % 256 for k in range(192)]))),
+                            "Format": "Hex"}) for i in range(16)])
+
+    def op():
+        device.set_pixels(frames())
+        draw(device)
+    return op
+
+
+@case("set_pixels_invalid")
+def bench_set_pixels_invalid(link, device):
+    parameters = (None, {"Pixels": json.dumps([[255, 0, 0]] * 63 + [[256, 0, 0]])})
+    return lambda: device.set_pixels(parameters)
+
+
+@case("show_message")
+def bench_show_message(link, device):
+    # More messages than the renderer caches, so every one is rendered
+    messages = cycle([(None, {"Message": "Temperature %d.%d C" % (i, i % 10), "Scroll Speed": 0.1,
+                              "Foreground": 0xFF8000}) for i in range(64)])
+
+    def op():
+        device.show_message(messages())
+        draw(device)
+    return op
+
+
+@case("message_frame")
+def bench_message_frame(link, device):
+    device.set_pixels((None, {"Pixels": json.dumps([[0, 0, 64]] * 64)}))
+    device.show_message((None, {"Message": "Hello world", "Scroll Speed": 0.1}))
+    draw(device)
+    display = device.display
+    player = display.players["overlay"]
+    player.loop = True
+
+    def op():
+        # Moves the message one frame on and merges it over the background
+        display.advance(player.start + (player.shown + 1) * player.period)
+        display.compositor.flush()
+    return op
+
+
+@case("update_tick")
+def bench_update_tick(link, device):
+    for nodes in device.sensor_nodes.values():
+        for node in nodes:
+            subscribe(link, node)
+    return link.update
+
+
+@case("sample_tick")
+def bench_sample_tick(link, device):
+    from sampler import SENSORS
+    for nodes in device.sensor_nodes.values():
+        for node in nodes:
+            subscribe(link, node)
+
+    def op():
+        device.publish(device.sampler.sample(SENSORS))
+    return op
+
+
+@case("stick_decode")
+def bench_stick_decode(link, device):
+    from joystick import StickReader
+    # The simulated joystick of the device, closed with it
+    stick = device.stick
+    for node in device.key_nodes.values():
+        subscribe(link, node)
+    reader = StickReader(stick, device.key_nodes, callback=device.on_stick_event)
+    # 16 presses and releases per read, as a busy joystick delivers them
+    events = b"".join(stick.pack_event(*stick.event(i)) for i in range(16))
+
+    def op():
+        os.write(stick._write_fd, events)
+        reader.doRead()
+    return op
+
+
+def percentile(values, p):
+    """
+    Nearest rank percentile of sorted values.
+    """
+    if not values:
+        return 0.0
+    rank = max(1, int(round(p / 100.0 * len(values))))
+    return values[min(rank, len(values)) - 1]
+
+
+def measure(op, iterations, warmup, rounds, alloc_iterations):
+    """
+    Time op over several rounds and keep the best throughput and
+    percentiles of them, the other rounds are slowed down by the rest of the
+    machine.
+    """
+    for _ in range(warmup):
+        op()
+    timer = time.perf_counter if hasattr(time, "perf_counter") else time.time
+    result = OrderedDict()
+    for _ in range(rounds):
+        latencies = []
+        gc.collect()
+        started = timer()
+        for _ in range(iterations):
+            begin = timer()
+            op()
+            latencies.append(timer() - begin)
+        elapsed = timer() - started
+        latencies.sort()
+        ops_per_second = iterations / elapsed if elapsed > 0 else 0.0
+        result["ops_per_second"] = max(result.get("ops_per_second", 0.0), ops_per_second)
+        for p in PERCENTILES:
+            key = "p%d_us" % p
+            value = percentile(latencies, p) * 1e6
+            result[key] = min(result[key], value) if key in result else value
+
+    if tracemalloc is not None and alloc_iterations > 0:
+        # Peak of the memory allocated during one op, what it churns
+        tracemalloc.start()
+        peaks = []
+        for _ in range(alloc_iterations):
+            tracemalloc.clear_traces()
+            op()
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        peaks.sort()
+        result["alloc_bytes"] = percentile(peaks, 50)
+    return result
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: List of the regressions, as descriptions.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        limit = 1 + threshold / 100.0
+        if result["ops_per_second"] * limit < base["ops_per_second"]:
+            regressions.append("%s: %.0f ops/s, baseline %.0f" % (name, result["ops_per_second"],
+                                                                  base["ops_per_second"]))
+        if result["p50_us"] > base["p50_us"] * limit:
+            regressions.append("%s: p50 %.1f us, baseline %.1f" % (name, result["p50_us"], base["p50_us"]))
+        if "alloc_bytes" in result and "alloc_bytes" in base and \
+                result["alloc_bytes"] > base["alloc_bytes"] * limit + 64:
+            regressions.append("%s: %d bytes allocated, baseline %d" % (name, result["alloc_bytes"],
+                                                                        base["alloc_bytes"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5, help="Rounds to keep the fastest of")
+    parser.add_argument("--alloc-iterations", type=int, default=200,
+                        help="Iterations to measure allocations over, 0 to skip")
+    parser.add_argument("--only", help="Comma separated paths to run, from %s" % ", ".join(CASES))
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="Save the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=30.0,
+                        help="Percentage a path may get slower or allocate more by")
+    args = parser.parse_args()
+
+    names = list(CASES)
+    if args.only:
+        names = [name.strip() for name in args.only.split(",")]
+        unknown = [name for name in names if name not in CASES]
+        if unknown:
+            parser.error("Unknown paths %s" % ", ".join(unknown))
+
+    from backend import SimulatedBackend
+    from device import Device
+
+    print("%-20s %12s %10s %10s %10s %12s" % ("path", "ops/s", "p50 us", "p90 us", "p99 us", "alloc bytes"))
+    results = OrderedDict()
+    for name in names:
+        # A fresh link per path, so the paths do not share subscriptions
+        device = Device(SimulatedBackend(stick_interval=3600.0))
+        link = create_link([device], responder=Responder)
+        link.start()
+        device._opener.join()
+        result = measure(CASES[name](link, device), args.iterations, args.warmup, args.rounds,
+                         args.alloc_iterations)
+        results[name] = result
+        device.stop()
+        print("%-20s %12.0f %10.1f %10.1f %10.1f %12s" % (
+            name, result["ops_per_second"], result["p50_us"], result["p90_us"], result["p99_us"],
+            "%d" % result["alloc_bytes"] if "alloc_bytes" in result else "-"))
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, separators=(",", ": "), sort_keys=True)
+        print("Saved the baseline to %s" % args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline at %s, save one with --save" % args.baseline)
+        return 1
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print("REGRESSION %s" % regression)
+    if regressions:
+        return 1
+    print("No path regressed by more than %g%%" % args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+CPU cost of orientation at 100 Hz on the simulated backend: the gyroscope
+nodes polled through read_imu every 10 ms, against the raw IMU captured at
+100 Hz and filtered in blocks, published at the 100 ms update interval.
+The fused path runs with numpy when it is installed and with the pure
+Python fallback.
+
+    python benchmarks/imu_fusion.py --duration 10 --rate 100
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from inprocess import create_link, subscribe
+
+MODES = ("polled", "fused", "fused-python")
+
+
+def run_mode(mode, rate, duration, warmup):
+    from twisted.internet import reactor
+    from backend import SimulatedBackend
+    from device import Device
+    import fusion
+
+    if mode == "fused-python":
+        fusion.numpy = None
+    device = Device(SimulatedBackend())
+    link = create_link([device])
+    link.start()
+    root = link.responder.get_super_root()
+    if mode == "polled":
+        root.get("/gyroscope/interval").set_value(1.0 / rate)
+        paths = ["/gyroscope/pitch", "/gyroscope/roll", "/gyroscope/yaw"]
+        samples = lambda: device.sampler.latency["imu"].count
+    else:
+        root.get("/imu/rate").set_value(rate)
+        paths = ["/imu/orientation/" + name for name in fusion.EULER]
+        paths += ["/imu/quaternion/" + name for name in fusion.QUATERNION]
+        samples = lambda: device.capture.samples
+    for path in paths:
+        subscribe(link, root.get(path))
+
+    result = {}
+
+    def begin():
+        result["times"] = os.times()
+        result["wall"] = time.time()
+        result["samples"] = samples()
+        result["published"] = device.publisher.published
+
+    def finish():
+        times = os.times()
+        wall = time.time() - result["wall"]
+        cpu = (times[0] + times[1]) - (result["times"][0] + result["times"][1])
+        print(json.dumps({
+            "cpu": cpu / wall * 100,
+            "samples": (samples() - result["samples"]) / wall,
+            "published": (device.publisher.published - result["published"]) / wall
+        }))
+        sys.stdout.flush()
+        os._exit(0)
+
+    reactor.callLater(warmup, begin)
+    reactor.callLater(warmup + duration, finish)
+    reactor.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rate", type=float, default=100.0, help="Orientation samples per second")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="Seconds to measure each mode for")
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--run", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        run_mode(args.run, args.rate, args.duration, args.warmup)
+        return
+
+    print("%-14s %8s %11s %13s" % ("mode", "cpu %", "samples/s", "published/s"))
+    for mode in MODES:
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__), "--run", mode, "--rate", str(args.rate),
+            "--duration", str(args.duration), "--warmup", str(args.warmup)
+        ])
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        print("%-14s %8.1f %11.0f %13.0f" % (mode, result["cpu"], result["samples"], result["published"]))
+
+
+if __name__ == "__main__":
+    main()
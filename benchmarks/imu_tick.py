@@ -0,0 +1,62 @@
+"""
+IMU work per tick of reading the orientation sensors: three separate
+gyroscope/accelerometer/compass reads against one fused read_imu call.
+
+Like sense_hat, every separate read enables only its own IMU sensor first,
+so each tick polls the IMU three times and changes the enabled sensors
+three times, where the fused read polls once and never reconfigures. The
+simulated backend counts both. Times per tick only mean something with the
+costs of a poll and of a reconfiguration measured on the Sense HAT, which
+the simulated reads then block for. Without them, only the Python overhead
+is timed.
+
+    python benchmarks/imu_tick.py --poll-cost 0.004 --config-cost 0.002 --ticks 200
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from backend import SimulatedBackend
+
+IMU_SENSORS = ("gyroscope", "accelerometer", "compass", "imu")
+
+
+def separate_reads(backend):
+    backend.gyroscope
+    backend.accelerometer
+    backend.compass
+
+
+def fused_read(backend):
+    backend.read_imu()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--poll-cost", type=float, default=0.0,
+                        help="Seconds an IMU poll blocks for")
+    parser.add_argument("--config-cost", type=float, default=0.0,
+                        help="Seconds changing the enabled IMU sensors blocks for")
+    parser.add_argument("--ticks", type=int, default=200)
+    args = parser.parse_args()
+
+    latency = dict((sensor, args.poll_cost) for sensor in IMU_SENSORS)
+    latency["imu_config"] = args.config_cost
+
+    print("%-10s %8s %15s %12s" % ("path", "polls", "reconfigures", "ms/tick"))
+    for name, tick in (("separate", separate_reads), ("fused", fused_read)):
+        backend = SimulatedBackend(latency=latency)
+        seconds = timeit.timeit(lambda: tick(backend), number=args.ticks)
+        polls = sum(backend.reads.get(sensor, 0) for sensor in IMU_SENSORS)
+        print("%-10s %8.1f %15.1f %12.3f" % (name, polls / float(args.ticks),
+                                             backend.reads.get("imu_config", 0) / float(args.ticks),
+                                             seconds / args.ticks * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Runs the link in process for the benchmarks, with a responder but without a
+broker connection, so no broker is needed.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+class Storage(object):
+    def read(self):
+        return {}
+
+    def get_updates(self, path, sid):
+        return None
+
+    def store(self, sub, value):
+        pass
+
+
+class Connection(object):
+    """
+    Stands in for the broker websocket and counts the messages sent and
+    their serialised size.
+    """
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def sendMessage(self, message):
+        self.messages += 1
+        self.bytes += len(json.dumps(message, sort_keys=True))
+
+
+def create_link(devices, flush_window=0.0, max_update_rate=0.0, responder=None):
+    """
+    Create a SenseHATLink hosting devices, with a fresh node tree.
+    :param responder: Class of the responder, the one of dslink when None.
+    :return: The link, start() still has to be called.
+    """
+    from SenseHATLink import SenseHATLink
+
+    if responder is None:
+        from dslink.Responder import Responder as responder
+
+    class InProcessLink(SenseHATLink):
+        def __init__(self, devices):
+            self.setup(devices, flush_window=flush_window, max_update_rate=max_update_rate)
+            # What DSLink.__init__ does, minus the handshake and connection
+            self.active = True
+            self.config = argparse.Namespace(nodes_path=os.path.join(os.devnull, "nodes.json"),
+                                             no_save_nodes=True)
+            self.storage = Storage()
+            self.logger = logging.getLogger("DSLink")
+            self.wsp = Connection()
+            self.responder = responder(self)
+            self.responder.start()
+
+    return InProcessLink(devices)
+
+
+def subscribe(link, node):
+    """
+    Subscribe to a node like a broker would.
+    """
+    link.last_sid = getattr(link, "last_sid", 0) + 1
+    link.responder.subscription_manager.add_value_sub(node, link.last_sid)
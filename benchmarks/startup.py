@@ -0,0 +1,85 @@
+"""
+Startup time of the link on the simulated backend.
+
+Every run starts the link in a fresh process and measures, from before the
+device is created, how long it takes until the node tree is published,
+until the backend is open, and until the first temperature and compass
+samples are set. --init-latency and --latency stand in for the RTIMU
+initialisation and slow sensor reads of the real Sense HAT.
+
+    python benchmarks/startup.py --init-latency 0.5 --latency 0.02 --runs 5
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from inprocess import create_link, subscribe
+
+STAGES = ("nodes", "open", "first_sample")
+
+
+def run_startup(init_latency, latency):
+    from twisted.internet import reactor, task
+    from backend import SimulatedBackend
+    from device import Device
+    from timing import monotonic
+
+    started = monotonic()
+    device = Device(SimulatedBackend(latency=latency, init_latency=init_latency))
+    link = create_link([device])
+    link.start()
+    result = {"nodes": monotonic() - started}
+    root = link.responder.get_super_root()
+    nodes = [root.get("/temperature"), root.get("/compass")]
+    for node in nodes:
+        subscribe(link, node)
+
+    def poll():
+        now = monotonic()
+        if "open" not in result and device.opened:
+            result["open"] = now - started
+        if all(node.value.has_value() for node in nodes):
+            result["first_sample"] = now - started
+            device.stop()
+            reactor.stop()
+
+    task.LoopingCall(poll).start(0.001)
+    reactor.run()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--init-latency", type=float, default=0.5,
+                        help="Seconds opening the simulated backend blocks for")
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Seconds each simulated sensor read blocks for")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_startup(args.init_latency, args.latency)
+        return
+
+    results = []
+    for _ in range(args.runs):
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__), "--run",
+            "--init-latency", str(args.init_latency), "--latency", str(args.latency)
+        ])
+        results.append(json.loads(output.decode().strip().splitlines()[-1]))
+
+    print("%-14s %10s %10s %10s" % ("stage", "min ms", "median ms", "max ms"))
+    for stage in STAGES:
+        times = sorted(result[stage] for result in results)
+        print("%-14s %10.1f %10.1f %10.1f" % (
+            stage, times[0] * 1000, times[len(times) // 2] * 1000, times[-1] * 1000))
+
+
+if __name__ == "__main__":
+    main()
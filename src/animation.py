@@ -0,0 +1,78 @@
+from array import array
+from threading import Lock
+
+from framebuffer import FRAME_PIXELS, INDEX_MAPS, FrameStrip, frame_bytes
+
+
+class Animation(object):
+    """
+    Named sequence of full frames, stored packed as RGB565.
+    """
+
+    def __init__(self, name, count, frames, fps):
+        """
+        :param name: Animation name.
+        :param count: Number of frames.
+        :param frames: Packed pixels of all frames, each frame row-major.
+        :param fps: Frames per second.
+        """
+        self.name = name
+        self.count = count
+        self.frames = frames
+        self.fps = fps
+        self._strips = {}
+
+    @property
+    def period(self):
+        return 1.0 / self.fps
+
+    def strip(self, rotation):
+        """
+        The frames in framebuffer order for a rotation, converted once.
+        :return: FrameStrip.
+        """
+        strip = self._strips.get(rotation)
+        if strip is None:
+            if rotation == 0:
+                packed = self.frames
+            else:
+                index_map = INDEX_MAPS[rotation]
+                packed = array("H", [0] * len(self.frames))
+                for offset in range(0, len(self.frames), FRAME_PIXELS):
+                    for k, index in enumerate(index_map):
+                        packed[offset + index] = self.frames[offset + k]
+            strip = FrameStrip(bytearray(frame_bytes(packed)), self.count)
+            self._strips[rotation] = strip
+        return strip
+
+
+class AnimationStore(object):
+    """
+    Uploaded animations by name, bounded by the total number of frames.
+    """
+
+    def __init__(self, max_frames=4096):
+        self.max_frames = max_frames
+        self.animations = {}
+        self._lock = Lock()
+
+    def add(self, animation):
+        """
+        Store an animation, replacing one with the same name.
+        :raises ValueError: When the store would hold too many frames.
+        """
+        with self._lock:
+            total = animation.count
+            for name in self.animations:
+                if name != animation.name:
+                    total += self.animations[name].count
+            if total > self.max_frames:
+                raise ValueError("Animations are limited to %d frames in total" % self.max_frames)
+            self.animations[animation.name] = animation
+
+    def get(self, name):
+        return self.animations.get(name)
+
+    def remove(self, name):
+        with self._lock:
+            return self.animations.pop(name, None) is not None
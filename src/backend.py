@@ -0,0 +1,589 @@
+from collections import namedtuple
+import io
+import math
+import os
+import struct
+from threading import Event, Lock, Thread
+import time
+
+from framebuffer import FrameBuffer, PIX_MAPS
+from recording import SampleLog, segment_paths
+from stick import SenseStick
+from timing import monotonic
+
+
+ImuReading = namedtuple("ImuReading", ("orientation", "compass", "raw"))
+
+
+def orientation_degrees(roll, pitch, yaw):
+    """
+    Convert a fusion pose in radians to the 0-360 degree orientation dict
+    returned by sense_hat.
+    """
+    orientation = {}
+    for key, val in (("roll", roll), ("pitch", pitch), ("yaw", yaw)):
+        deg = math.degrees(val)
+        orientation[key] = deg + 360 if deg < 0 else deg
+    return orientation
+
+
+def accelerometer_orientation(reading):
+    """
+    Orientation measured from gravity alone, what sense_hat returns with only
+    the accelerometer enabled. Gravity does not show the yaw, which is kept
+    from the fused orientation, like RTIMU keeps its last yaw.
+    :param reading: ImuReading.
+    """
+    ax, ay, az = reading.raw[:3]
+    orientation = orientation_degrees(math.atan2(ay, az), math.atan2(-ax, math.hypot(ay, az)), 0.0)
+    orientation["yaw"] = reading.orientation["yaw"]
+    return orientation
+
+
+def raw_imu(roll, pitch, yaw, gyro=(0.0, 0.0, 0.0), field=(20.0, 0.0, -40.0)):
+    """
+    Raw sample of an IMU held at a pose in radians: gravity in g and the
+    magnetic field in uT rotated into the sensor frame, and the gyroscope
+    rates in rad/s.
+    :return: Tuple of accel, gyro and mag x/y/z.
+    """
+    cr, sr = math.cos(roll), math.sin(roll)
+    cp, sp = math.cos(pitch), math.sin(pitch)
+    cy, sy = math.cos(yaw), math.sin(yaw)
+    # Undo yaw, then pitch, then roll
+    x = field[0] * cy + field[1] * sy
+    y = -field[0] * sy + field[1] * cy
+    x, z = x * cp - field[2] * sp, x * sp + field[2] * cp
+    y, z = y * cr + z * sr, -y * sr + z * cr
+    return (-sp, sr * cp, cr * cp) + tuple(gyro) + (x, y, z)
+
+
+class Backend(object):
+    """
+    Hardware used by the link: the environmental and IMU sensors, the LED
+    matrix and the joystick.
+    """
+    name = None
+    # Samples per second the IMU delivers, None when every read has a new one
+    imu_rate = None
+
+    def open(self):
+        """
+        Initialise the hardware. Called once, on a background thread, before
+        anything else is used.
+        """
+        pass
+
+    # Sensors
+
+    @property
+    def temperature(self):
+        raise NotImplementedError()
+
+    @property
+    def humidity(self):
+        raise NotImplementedError()
+
+    @property
+    def pressure(self):
+        raise NotImplementedError()
+
+    @property
+    def gyroscope(self):
+        raise NotImplementedError()
+
+    @property
+    def accelerometer(self):
+        raise NotImplementedError()
+
+    @property
+    def compass(self):
+        raise NotImplementedError()
+
+    def read_imu(self):
+        """
+        Read the IMU once with the gyroscope, accelerometer and magnetometer
+        all enabled. The only read of the IMU, which serves the orientation
+        sensors and the raw capture alike.
+        :return: ImuReading with the fused orientation in degrees, the compass
+        heading and the raw accel x/y/z in g, gyro x/y/z in rad/s and mag
+        x/y/z in uT, or None when the IMU has no new sample since the last
+        read.
+        """
+        raise NotImplementedError()
+
+    # LED matrix, drawn through self.framebuffer
+
+    framebuffer = None
+
+    @property
+    def rotation(self):
+        return self.framebuffer.rotation
+
+    @rotation.setter
+    def rotation(self, r):
+        # Changes the mapping without redrawing, like show_message does
+        if r not in PIX_MAPS:
+            raise ValueError("Rotation must be 0, 90, 180 or 270 degrees")
+        self.framebuffer.rotation = r
+
+    def set_pixel(self, x, y, red, green, blue):
+        self.framebuffer.set_pixel(x, y, red, green, blue)
+
+    def update_pixels(self, pixels):
+        self.framebuffer.update_pixels(pixels)
+
+    def update_region(self, x, y, width, height, values):
+        self.framebuffer.update_region(x, y, width, height, values)
+
+    def set_pixels(self, pixel_list):
+        self.framebuffer.set_pixels(pixel_list)
+
+    def clear(self):
+        self.framebuffer.clear()
+
+    def write_frame(self, frame):
+        """
+        Write a frame that is already packed in framebuffer order.
+        """
+        self.framebuffer.write(frame)
+
+    def get_char_pixels(self, s):
+        """
+        Returns the 40 pixels (five columns of eight) of a text character.
+        """
+        raise NotImplementedError()
+
+    @staticmethod
+    def trim_whitespace(char):
+        """
+        Trims empty columns from the front and back of a text character.
+        """
+        psum = lambda x: sum(sum(x, []))
+        if psum(char) > 0:
+            while psum(char[0:8]) == 0:
+                del char[0:8]
+            while psum(char[-8:]) == 0:
+                del char[-8:]
+        return char
+
+    # Joystick
+
+    def open_stick(self):
+        """
+        Returns a SenseStick compatible event source.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        if self.framebuffer is not None:
+            self.framebuffer.close()
+
+
+class SenseHatBackend(Backend):
+    """
+    The real Sense HAT, through the sense_hat library.
+    """
+    name = "sensehat"
+
+    def __init__(self):
+        self._sense = None
+        self._last_pose = (0.0, 0.0, 0.0)
+        self._raw = (0.0,) * 9
+        # The sampler and capture threads hand the IMU over to each other
+        self._imu_lock = Lock()
+
+    def open(self):
+        # Initialises RTIMU and loads the text assets
+        from sense_hat import SenseHat
+        self._sense = SenseHat()
+        self.framebuffer = FrameBuffer(self._sense._fb_device)
+        # RTIMU has a new sample every poll interval, in ms
+        self.imu_rate = 1000.0 / max(1, self._sense._imu.IMUGetPollInterval())
+
+    @property
+    def temperature(self):
+        return self._sense.temperature
+
+    @property
+    def humidity(self):
+        return self._sense.humidity
+
+    @property
+    def pressure(self):
+        return self._sense.pressure
+
+    @property
+    def gyroscope(self):
+        return self._sense.gyroscope
+
+    @property
+    def accelerometer(self):
+        return self._sense.accelerometer
+
+    @property
+    def compass(self):
+        return self._sense.compass
+
+    def read_imu(self):
+        sense = self._sense
+        with self._imu_lock:
+            # Only touches RTIMU when the enabled sensors actually change
+            sense.set_imu_config(True, True, True)
+            if not sense._read_imu():
+                return None
+            data = sense._imu.getIMUData()
+            if data["fusionPoseValid"]:
+                self._last_pose = tuple(data["fusionPose"])
+            # Each sensor keeps its last valid values
+            raw = list(self._raw)
+            for i, key in enumerate(("accel", "gyro", "compass")):
+                if data[key + "Valid"]:
+                    raw[i * 3:i * 3 + 3] = data[key]
+            self._raw = tuple(raw)
+        orientation = orientation_degrees(*self._last_pose)
+        return ImuReading(orientation, orientation["yaw"], self._raw)
+
+    def get_char_pixels(self, s):
+        return self._sense._get_char_pixels(s)
+
+    def open_stick(self):
+        return SenseStick()
+
+
+class SimulatedStick(SenseStick):
+    """
+    Joystick that produces a deterministic cycle of press and release events
+    through a pipe, using the same binary format as the evdev device.
+    """
+    KEYS = [
+        SenseStick.KEY_UP,
+        SenseStick.KEY_RIGHT,
+        SenseStick.KEY_DOWN,
+        SenseStick.KEY_LEFT,
+        SenseStick.KEY_ENTER
+    ]
+
+    def __init__(self, interval=0.5, keys=None):
+        self.interval = interval
+        self.keys = keys or self.KEYS
+        self.events_sent = 0
+        read_fd, self._write_fd = os.pipe()
+        self._stick_file = io.open(read_fd, 'rb')
+        self._stopped = Event()
+        self._feeder = Thread(target=self._feed)
+        self._feeder.daemon = True
+        self._feeder.start()
+
+    def close(self):
+        self._stopped.set()
+        # A feeder blocked on a full pipe fails with EPIPE once it is closed
+        self._stick_file.close()
+        self._feeder.join()
+
+    def event(self, i):
+        """
+        Returns the (timestamp, key, state) of the i-th event of the cycle,
+        the timestamp relative to the first event.
+        """
+        key = self.keys[(i // 2) % len(self.keys)]
+        state = self.STATE_PRESS if i % 2 == 0 else self.STATE_RELEASE
+        return i * self.interval, key, state
+
+    def pack_event(self, timestamp, key, state):
+        sec = int(timestamp)
+        usec = int(round((timestamp - sec) * 1000000))
+        return struct.pack(self.EVENT_FORMAT, sec, usec, self.EV_KEY, key, state)
+
+    def _feed(self):
+        while not self._stopped.wait(self.interval):
+            _, key, state = self.event(self.events_sent)
+            try:
+                # Stamped with the wall clock, like the kernel does
+                os.write(self._write_fd, self.pack_event(time.time(), key, state))
+            except OSError:
+                break
+            self.events_sent += 1
+        os.close(self._write_fd)
+
+
+class SimulatedBackend(Backend):
+    """
+    Deterministic stand-in for the Sense HAT. Sensor values follow fixed
+    curves indexed by the number of reads, the IMU one over the monotonic
+    clock so it holds at any sample rate. Every read can be slowed down to
+    mimic I2C latency and the LED matrix is an in-memory or file backed
+    framebuffer. Like sense_hat, the gyroscope, accelerometer and compass
+    properties each enable only their own IMU sensor before they read, and
+    a change of the enabled sensors costs the "imu_config" latency.
+    """
+    name = "simulated"
+
+    def __init__(self, latency=0.0, stick_interval=0.5, framebuffer_path=None, init_latency=0.0, imu_rate=None):
+        """
+        :param latency: Seconds each sensor read blocks for, either a number
+        or a dict keyed by sensor name, "imu" for read_imu and "imu_config"
+        for changing the enabled IMU sensors.
+        :param stick_interval: Seconds between synthetic joystick events.
+        :param framebuffer_path: File to use as the framebuffer, None to keep
+        it in memory.
+        :param init_latency: Seconds opening the backend blocks for, like
+        RTIMU initialisation.
+        :param imu_rate: Samples per second the IMU delivers, reads in between
+        have no new sample. None for a new sample at every read.
+        """
+        self.latency = latency
+        self.init_latency = init_latency
+        self.stick_interval = stick_interval
+        self.imu_rate = imu_rate
+        self.reads = {}
+        self.imu_config = None
+        self._imu_sample = None
+        self.framebuffer = FrameBuffer(framebuffer_path)
+
+    def open(self):
+        if self.init_latency > 0:
+            time.sleep(self.init_latency)
+
+    def _read(self, sensor):
+        if isinstance(self.latency, dict):
+            delay = self.latency.get(sensor, 0.0)
+        else:
+            delay = self.latency
+        if delay > 0:
+            time.sleep(delay)
+        n = self.reads.get(sensor, 0)
+        self.reads[sensor] = n + 1
+        return n
+
+    def _configure_imu(self, compass, gyro, accel):
+        # Same argument order as sense_hat's set_imu_config
+        if (compass, gyro, accel) != self.imu_config:
+            self._read("imu_config")
+            self.imu_config = (compass, gyro, accel)
+
+    @staticmethod
+    def _orientation(n, phase):
+        return {
+            "pitch": (math.sin(n * 0.05 + phase) * 30.0) % 360,
+            "roll": (math.cos(n * 0.05 + phase) * 30.0) % 360,
+            "yaw": (n * 1.5 + phase * 60.0) % 360
+        }
+
+    @property
+    def temperature(self):
+        return 25.0 + 2.0 * math.sin(self._read("temperature") * 0.1)
+
+    @property
+    def humidity(self):
+        return 40.0 + 5.0 * math.sin(self._read("humidity") * 0.07)
+
+    @property
+    def pressure(self):
+        return 1013.25 + 3.0 * math.sin(self._read("pressure") * 0.03)
+
+    @property
+    def gyroscope(self):
+        self._configure_imu(False, True, False)
+        return self._orientation(self._read("gyroscope"), 0.0)
+
+    @property
+    def accelerometer(self):
+        self._configure_imu(False, False, True)
+        return self._orientation(self._read("accelerometer"), 1.0)
+
+    @property
+    def compass(self):
+        self._configure_imu(True, False, False)
+        return (self._read("compass") * 0.5) % 360
+
+    def read_imu(self):
+        self._configure_imu(True, True, True)
+        self._read("imu")
+        t = monotonic()
+        if self.imu_rate is not None:
+            sample = int(t * self.imu_rate)
+            if sample == self._imu_sample:
+                return None
+            self._imu_sample = sample
+        # A slow rocking motion and a steady turn, against the clock so the
+        # gyroscope rates match the pose at any sample rate
+        tilt = math.radians(30.0)
+        roll = tilt * math.cos(t * 0.5)
+        pitch = tilt * math.sin(t * 0.5)
+        yaw = (t * 0.3 + math.pi) % (2 * math.pi) - math.pi
+        raw = raw_imu(roll, pitch, yaw, (-tilt * 0.5 * math.sin(t * 0.5), tilt * 0.5 * math.cos(t * 0.5), 0.3))
+        # Machine vibration at 50 and 120 Hz along z
+        vibration = 0.05 * math.sin(2 * math.pi * 50 * t) + 0.02 * math.sin(2 * math.pi * 120 * t)
+        orientation = orientation_degrees(roll, pitch, yaw)
+        return ImuReading(orientation, orientation["yaw"], raw[:2] + (raw[2] + vibration,) + raw[3:])
+
+    def get_char_pixels(self, s):
+        if s == " ":
+            return [[0, 0, 0] for _ in range(40)]
+        code = ord(s[0]) if s else ord("?")
+        char = []
+        for column in range(5):
+            bits = (code * (column + 3) * 2654435761 >> 7) & 0x7E
+            for row in range(8):
+                char.append([255, 255, 255] if bits >> row & 1 else [0, 0, 0])
+        return char
+
+    def open_stick(self):
+        return SimulatedStick(self.stick_interval)
+
+
+class ReplayStick(SimulatedStick):
+    """
+    Joystick that replays the events of a recorded log at the pace of its
+    ReplayBackend.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        SimulatedStick.__init__(self)
+
+    def _feed(self):
+        backend = self.backend
+        log = backend.log
+        duration = log.end - log.start
+        opened = monotonic()
+        cycle = 0
+        if backend.loop and duration > 0:
+            cycle = int((opened - backend.started) * backend.speed // duration)
+        try:
+            while log.stick_events:
+                for timestamp, key, state in log.stick_events:
+                    due = backend.started + (timestamp - log.start + cycle * duration) / backend.speed
+                    if due < opened:
+                        # Replayed before the stick was opened
+                        continue
+                    if self._stopped.wait(max(0.0, due - monotonic())):
+                        return
+                    os.write(self._write_fd, self.pack_event(timestamp, key, state))
+                    self.events_sent += 1
+                if not backend.loop or duration <= 0:
+                    break
+                cycle += 1
+        except OSError:
+            pass
+        finally:
+            os.close(self._write_fd)
+
+
+class ReplayBackend(SimulatedBackend):
+    """
+    Feeds a log written by a Recorder back through the link in place of the
+    Sense HAT. Sensors read the value recorded at the current position of
+    the replay, which advances with real time multiplied by the speed. The
+    LED matrix and text characters are those of the SimulatedBackend.
+    """
+    name = "replay"
+
+    def __init__(self, path, speed=1.0, loop=False, framebuffer_path=None):
+        """
+        :param path: Log directory, or a single segment file.
+        :param speed: Replay speed, 1 replays in real time.
+        :param loop: Start over at the end of the log.
+        :param framebuffer_path: File to use as the framebuffer, None to keep
+        it in memory.
+        """
+        if speed <= 0:
+            raise ValueError("Replay speed must be greater than 0")
+        # Checked up front, the log is only loaded on the opener thread
+        if not path:
+            raise ValueError("The replay backend needs the path of a log")
+        if not segment_paths(path):
+            raise ValueError("No sample log at %s" % path)
+        SimulatedBackend.__init__(self, framebuffer_path=framebuffer_path)
+        self.path = path
+        self.log = None
+        self.speed = speed
+        self.loop = loop
+        self.started = None
+
+    def open(self):
+        self.log = SampleLog(self.path)
+        self.started = monotonic()
+
+    def position(self):
+        """
+        The time in the log that is being replayed.
+        """
+        elapsed = (monotonic() - self.started) * self.speed
+        duration = self.log.end - self.log.start
+        if self.loop and duration > 0:
+            elapsed %= duration
+        return self.log.start + elapsed
+
+    def _value(self, sensor):
+        self._read(sensor)
+        return self.log.value_at("/" + sensor, self.position())
+
+    def _orientation_at(self, sensor, position):
+        return {
+            "pitch": self.log.value_at("/%s/pitch" % sensor, position),
+            "roll": self.log.value_at("/%s/roll" % sensor, position),
+            "yaw": self.log.value_at("/%s/yaw" % sensor, position)
+        }
+
+    @property
+    def temperature(self):
+        return self._value("temperature")
+
+    @property
+    def humidity(self):
+        return self._value("humidity")
+
+    @property
+    def pressure(self):
+        return self._value("pressure")
+
+    @property
+    def gyroscope(self):
+        self._read("gyroscope")
+        return self._orientation_at("gyroscope", self.position())
+
+    @property
+    def accelerometer(self):
+        self._read("accelerometer")
+        return self._orientation_at("accelerometer", self.position())
+
+    @property
+    def compass(self):
+        return self._value("compass")
+
+    def read_imu(self):
+        self._read("imu")
+        position = self.position()
+        sensor = "gyroscope" if self.log.has("/gyroscope/pitch") else "accelerometer"
+        orientation = self._orientation_at(sensor, position)
+        # Raw values are not recorded, they are synthesised at rest with the
+        # recorded accelerometer tilt
+        tilt = orientation
+        if self.log.has("/accelerometer/pitch"):
+            tilt = self._orientation_at("accelerometer", position)
+        raw = raw_imu(math.radians(tilt["roll"]), math.radians(tilt["pitch"]), math.radians(orientation["yaw"]))
+        return ImuReading(orientation, self.log.value_at("/compass", position), raw)
+
+    def open_stick(self):
+        return ReplayStick(self)
+
+
+BACKENDS = {
+    SenseHatBackend.name: SenseHatBackend,
+    SimulatedBackend.name: SimulatedBackend,
+    ReplayBackend.name: ReplayBackend
+}
+
+
+def create_backend(name, **options):
+    """
+    Create a backend by name.
+    :param name: Backend name, see BACKENDS.
+    :param options: Backend specific keyword arguments.
+    :return: Backend instance.
+    """
+    if name not in BACKENDS:
+        raise ValueError("Unknown backend %s, expected one of %s" % (name, ", ".join(sorted(BACKENDS))))
+    return BACKENDS[name](**options)
@@ -0,0 +1,199 @@
+from array import array
+
+from framebuffer import FRAME_PIXELS, frame_bytes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Layers from the bottom up
+BACKGROUND = "background"
+STATUS = "status"
+OVERLAY = "overlay"
+LAYERS = (BACKGROUND, STATUS, OVERLAY)
+
+OPAQUE = 255
+
+_TRANSPARENT = bytes(bytearray(FRAME_PIXELS))
+_OPAQUE = bytes(bytearray([OPAQUE]) * FRAME_PIXELS)
+
+
+def blend_pixel(below, above, weight):
+    """
+    Mix two packed RGB565 pixels.
+    :param weight: Weight of above, from 0 to 1.
+    """
+    red = below >> 11
+    green = below >> 5 & 0x3F
+    blue = below & 0x1F
+    # Rounded half up, like the numpy merge
+    red = int(red + ((above >> 11) - red) * weight + 0.5)
+    green = int(green + ((above >> 5 & 0x3F) - green) * weight + 0.5)
+    blue = int(blue + ((above & 0x1F) - blue) * weight + 0.5)
+    return red << 11 | green << 5 | blue
+
+
+class Layer(object):
+    """
+    An off-screen frame: 64 packed RGB565 pixels in framebuffer order, the
+    coverage of every pixel from 0 (transparent) to 255 (opaque) and the
+    alpha of the whole layer from 0 to 1.
+    """
+    __slots__ = ("name", "frame", "coverage", "alpha", "opaque")
+
+    def __init__(self, name, opaque=False, alpha=1.0):
+        """
+        :param opaque: True for a layer that is cleared to black instead of
+        to transparent.
+        """
+        self.name = name
+        self.opaque = opaque
+        self.alpha = alpha
+        self.frame = None
+        self.coverage = None
+        self.clear()
+
+    @property
+    def visible(self):
+        return self.alpha > 0 and self.coverage != _TRANSPARENT
+
+    def clear(self):
+        self.frame = array("H", [0] * FRAME_PIXELS)
+        self.coverage = bytearray(_OPAQUE if self.opaque else _TRANSPARENT)
+
+    def fill(self, frame, coverage=None):
+        """
+        Replace the whole layer.
+        :param frame: Packed frame in framebuffer order, or its bytes.
+        :param coverage: 64 coverage bytes, None for opaque.
+        """
+        self.frame = frame if isinstance(frame, array) else array("H", frame_bytes(frame))
+        self.coverage = bytearray(_OPAQUE if coverage is None else coverage)
+
+    def draw_region(self, x, y, width, height, values, pix_map):
+        """
+        Draw a rectangle of packed pixels, opaque.
+        :param values: Packed RGB565 pixels, row-major over the rectangle.
+        :param pix_map: Framebuffer index of every x, y for the rotation.
+        """
+        if x < 0 or y < 0 or x + width > 8 or y + height > 8:
+            raise ValueError("Region must be inside the 8x8 matrix")
+        frame, coverage = self.frame, self.coverage
+        i = 0
+        for row in range(y, y + height):
+            map_row = pix_map[row]
+            for col in range(x, x + width):
+                index = map_row[col]
+                frame[index] = values[i]
+                coverage[index] = OPAQUE
+                i += 1
+
+    def draw_pixels(self, pixels, pix_map):
+        """
+        Draw single packed pixels, opaque.
+        :param pixels: List of (x, y, packed pixel).
+        """
+        frame, coverage = self.frame, self.coverage
+        for x, y, value in pixels:
+            if x > 7 or x < 0 or y > 7 or y < 0:
+                raise ValueError("Pixel position must be between 0 and 7")
+            index = pix_map[y][x]
+            frame[index] = value
+            coverage[index] = OPAQUE
+
+
+class Compositor(object):
+    """
+    Named layers merged from the bottom up into the frame shown on the LED
+    matrix, each pixel mixed by its coverage times the alpha of its layer.
+    Layers are kept in framebuffer order, so the merge needs no rotation
+    and strips are copied in as they are. A merged frame is only written to
+    the hardware when it differs from the last one written, and is mixed
+    with numpy when it is installed.
+    """
+
+    def __init__(self, backend):
+        """
+        :param backend: Backend the frames are written to.
+        """
+        self.backend = backend
+        self.layers = [Layer(name, name == BACKGROUND) for name in LAYERS]
+        self.frames_composed = 0
+        self.frames_suppressed = 0
+        self._by_name = dict((layer.name, layer) for layer in self.layers)
+        self._last = None
+
+    def layer(self, name):
+        """
+        :raises ValueError: For an unknown layer.
+        """
+        layer = self._by_name.get(name)
+        if layer is None:
+            raise ValueError("Unknown layer %s, expected one of %s" % (name, ", ".join(LAYERS)))
+        return layer
+
+    def clear(self):
+        for layer in self.layers:
+            layer.clear()
+
+    def compose(self):
+        """
+        :return: The merged frame, packed in framebuffer order.
+        """
+        self.frames_composed += 1
+        base = self.layers[0]
+        above = [layer for layer in self.layers[1:] if layer.visible]
+        if base.alpha >= 1 and base.coverage == _OPAQUE:
+            if not above:
+                return array("H", base.frame)
+        else:
+            above.insert(0, base)
+            base = None
+        if numpy is not None:
+            return self._compose_numpy(base, above)
+        frame = array("H", base.frame) if base is not None else array("H", [0] * FRAME_PIXELS)
+        for layer in above:
+            source, coverage, alpha = layer.frame, layer.coverage, layer.alpha
+            if alpha >= 1 and coverage == _OPAQUE:
+                frame = array("H", source)
+                continue
+            for i in range(FRAME_PIXELS):
+                weight = coverage[i]
+                if weight == OPAQUE and alpha >= 1:
+                    frame[i] = source[i]
+                elif weight:
+                    frame[i] = blend_pixel(frame[i], source[i], weight * alpha / 255.0)
+        return frame
+
+    def _compose_numpy(self, base, above):
+        if base is not None:
+            values = numpy.frombuffer(base.frame, dtype=numpy.uint16)
+            channels = [(values >> 11).astype(float), (values >> 5 & 0x3F).astype(float),
+                        (values & 0x1F).astype(float)]
+        else:
+            channels = [numpy.zeros(FRAME_PIXELS) for _ in range(3)]
+        for layer in above:
+            values = numpy.frombuffer(layer.frame, dtype=numpy.uint16)
+            weight = numpy.frombuffer(bytes(layer.coverage), dtype=numpy.uint8) * layer.alpha / 255.0
+            # The operations of blend_pixel, rounded after every layer so
+            # the frames match those merged without numpy
+            for channel, source in zip(channels, (values >> 11, values >> 5 & 0x3F, values & 0x1F)):
+                channel += (source - channel) * weight
+                channel += 0.5
+                numpy.floor(channel, channel)
+        red, green, blue = [channel.astype(numpy.uint16) for channel in channels]
+        return array("H", (red << 11 | green << 5 | blue).tobytes())
+
+    def flush(self):
+        """
+        Merge the layers and write the frame if it changed.
+        :return: True if a frame was written.
+        """
+        frame = self.compose()
+        if frame == self._last:
+            self.frames_suppressed += 1
+            return False
+        self.backend.write_frame(frame)
+        self._last = frame
+        return True
@@ -0,0 +1,1312 @@
+from animation import Animation, AnimationStore
+from compositor import BACKGROUND, LAYERS
+from display import DisplayWorker
+import dslink
+from fusion import AXES, DEFAULT_RATE, DEFAULT_TIME_CONSTANT, EULER, QUATERNION, RAW, ImuCapture
+from history import DEFAULT_WINDOW, STATS, History
+from joystick import HOLD_COALESCE, KEY_NODES, StickReader
+import logging
+from metrics import LATENCY_BOUNDS, Gauges, Rate
+from pixels import FORMATS, JSON, PixelFormatError, decode_frames, decode_pixels, rgb
+from publish import DEADBAND_SETTINGS, Publisher
+from rules import MAX_RULES, RuleError, RuleSet, compile_rule
+from sampler import DEFAULT_INTERVALS, READS, SENSORS, SensorSampler
+from text import MessageRenderer
+from threading import Thread
+from timing import SKIP, monotonic, to_monotonic
+from twisted.internet import reactor
+import vibration
+
+# Seconds between publications of the raw IMU and fused orientation
+DEFAULT_IMU_INTERVAL = 0.1
+
+# Fastest raw IMU sample rate, in Hz
+MAX_IMU_RATE = 1000.0
+
+# Seconds stop() waits for each worker thread before closing the backend
+STOP_TIMEOUT = 1.0
+
+IMU_UNITS = {"accel": "g", "gyro": "rad/s", "mag": "uT"}
+
+# Layer choice of clear_screen that clears them all
+ALL_LAYERS = "all"
+
+# Vibration summary nodes, in the order of the Vibration fields
+VIBRATION_VALUES = (
+    ("sample_rate", "Sample Rate", "Hz"),
+    ("rms", "RMS", "g"),
+    ("peak", "Peak", "g"),
+    ("crest_factor", "Crest Factor", None),
+    ("frequency", "Dominant Frequency", "Hz"),
+    ("band_energy", "Band Energy", "g^2")
+)
+
+
+class Device(object):
+    """
+    One Sense HAT hosted by the link: its backend, the sampler and display
+    worker threads that read from and draw on it, and the subtree of nodes
+    it publishes to. The backend is opened on a background thread, so the
+    nodes can be published before the hardware is initialised.
+    """
+
+    def __init__(self, backend, name=None, hold_policy=HOLD_COALESCE, history_size=4096, recorder=None,
+                 overrun_policy=SKIP):
+        """
+        :param backend: Backend of the device.
+        :param name: Name of the node of the device, None to use the root.
+        :param hold_policy: Joystick hold policy, one of HOLD_POLICIES.
+        :param history_size: Samples of history to keep per value.
+        :param recorder: Recorder to log samples and joystick events to.
+        :param overrun_policy: What the sensor reads do when they fall behind
+        their schedule, one of OVERRUN_POLICIES.
+        """
+        self.name = name
+        self.path = ""
+        self.root = None
+        self.sense = backend
+        self.logger = logging.getLogger("DSLink")
+        self.opened = False
+        self.stopped = False
+        self.stick = None
+        self.stick_reader = None
+        self.key_nodes = None
+        self.hold_policy = hold_policy
+        self.display = DisplayWorker(self.sense, MessageRenderer(self.sense))
+        self.animations = AnimationStore()
+        # The IMU is read by the capture while it runs and by the sampler
+        # otherwise, never by both
+        self.capture = ImuCapture(self.sense, self.on_imu_block, policy=overrun_policy)
+        self.sampler = SensorSampler(self.sense, self.on_readings, overrun_policy, self.capture)
+        self.sensor_nodes = {}
+        self.channels = {}
+        self.interval_nodes = {}
+        self.publisher = Publisher()
+        self.deadband_nodes = []
+        self.history = History(history_size)
+        self.stats_nodes = []
+        self.recorder = recorder
+        self.imu_nodes = []
+        self.imu_settings = None
+        self.imu_channels = []
+        self.imu_interval = DEFAULT_IMU_INTERVAL
+        self._imu_due = 0.0
+        self.vibration = None
+        self.vibration_nodes = []
+        self.vibration_settings = None
+        self.vibration_channels = []
+        self._vibration_config = None
+        self.rules = RuleSet()
+        self.rules_node = None
+        self._rule_definitions = {}
+        self.gauges = Gauges()
+        self._opener = Thread(target=self.open, name="DeviceOpener")
+        self._opener.daemon = True
+        self._opener.start()
+
+    def open(self):
+        """
+        Initialise the hardware, on the opener thread.
+        """
+        try:
+            self.sense.open()
+            self.sense.clear()
+            self.stick = self.sense.open_stick()
+            self.display.renderer.atlas.preload()
+        except Exception:
+            self.logger.exception("Failed to open the %s backend" % self.sense.name)
+            return
+        reactor.callFromThread(self.opened_backend)
+
+    def opened_backend(self):
+        """
+        Start the threads once the backend is open. Commands and sensor
+        settings received before are queued until then.
+        """
+        if self.stopped:
+            # Stopped while it was being opened
+            self.close_backend()
+            return
+        self.opened = True
+        if self.imu_settings is not None:
+            # The capture rate is capped by the IMU from now on
+            self.update_capture()
+        self.display.start()
+        self.sampler.start()
+        self.capture.start()
+        self.attach_stick()
+
+    def attach_stick(self):
+        if self.opened and self.key_nodes is not None and self.stick_reader is None:
+            self.stick_reader = StickReader(self.stick, self.key_nodes, self.hold_policy, self.recorder,
+                                            self.on_stick_event)
+            reactor.addReader(self.stick_reader)
+
+    def start(self, root):
+        """
+        Start publishing to the nodes of the device.
+        :param root: Node of the device.
+        """
+        self.path = root.path if root.parent is not None else ""
+        self.root = root
+        for sensor in SENSORS:
+            node = root.get("/" + sensor)
+            if sensor in ("gyroscope", "accelerometer"):
+                self.sensor_nodes[sensor] = [node.get("/pitch"), node.get("/roll"), node.get("/yaw")]
+            else:
+                self.sensor_nodes[sensor] = [node]
+            # Paths within the device, as they are recorded
+            self.channels[sensor] = [value_node.path[len(self.path):] for value_node in self.sensor_nodes[sensor]]
+            self.interval_nodes[sensor] = node.get("/interval")
+            for value_node in self.sensor_nodes[sensor]:
+                settings = [value_node.get("/" + name) for name, _, _ in DEADBAND_SETTINGS]
+                self.deadband_nodes.append((value_node, settings))
+                stats = value_node.get("/stats")
+                self.stats_nodes.append((sensor, value_node, stats.get("/window"),
+                                         [stats.get("/" + name) for name, _ in STATS]))
+
+        imu = root.get("/imu")
+        groups = [imu.get("/" + group) for group in RAW]
+        self.imu_nodes = [group.get("/" + axis) for group in groups for axis in AXES]
+        self.imu_nodes += [imu.get("/quaternion/" + name) for name in QUATERNION]
+        self.imu_nodes += [imu.get("/orientation/" + name) for name in EULER]
+        self.imu_settings = (imu.get("/rate"), imu.get("/interval"), imu.get("/time_constant"))
+        self.imu_channels = [node.path[len(self.path):] for node in self.imu_nodes]
+
+        vibration_node = root.get("/vibration")
+        self.vibration_nodes = [vibration_node.get("/" + name) for name, _, _ in VIBRATION_VALUES]
+        self.vibration_settings = (vibration_node.get("/rate"), vibration_node.get("/window"),
+                                   vibration_node.get("/bands"))
+        self.vibration_channels = [node.path[len(self.path):] for node in self.vibration_nodes]
+
+        for sensor in SENSORS:
+            self.bind_setting(self.interval_nodes[sensor],
+                              lambda value, sensor=sensor: self.sampler.configure(sensor, value))
+        for node in self.imu_settings + self.vibration_settings[:2]:
+            maximum = {"rate": MAX_IMU_RATE, "window": vibration.MAX_WINDOW_SIZE}.get(node.name)
+            self.bind_setting(node, lambda value: self.update_capture(), maximum)
+        for name in LAYERS:
+            apply = lambda value, name=name: self.display.set_alpha(name, value)
+            alpha = self.bind_setting(root.get("/layers/%s/alpha" % name), apply, 1.0, 0.0)
+            if alpha is not None and alpha != 1.0:
+                apply(alpha)
+
+        self.rules_node = root.get("/rules")
+        self.compile_rules()
+
+        stick = root.get("/stick")
+        key_nodes = {}
+        for key in KEY_NODES:
+            key_nodes[key] = stick.get("/" + KEY_NODES[key])
+        self.key_nodes = key_nodes
+        self.attach_stick()
+
+        self.bind_metrics(root.get("/metrics"))
+
+    def bind_setting(self, node, apply, maximum=None, minimum=None):
+        """
+        Check values written to a setting node as they arrive and apply them
+        at once instead of with the next update. A value that is not a
+        positive number, or at least minimum when given, up to maximum is
+        rejected by setting the node back to its last valid value.
+        :param apply: Called with every valid value.
+        """
+        def check(value):
+            if minimum is None:
+                value = self.positive(value)
+            elif isinstance(value, bool) or not isinstance(value, (int, float)) or value < minimum:
+                value = None
+            if value is not None and maximum is not None and value > maximum:
+                value = None
+            return value
+
+        valid = [check(node.get_value())]
+
+        def on_set(node, value):
+            if check(value) is None:
+                expected = "a positive number" if minimum is None else "a number from %g" % minimum
+                limit = " up to %g" % maximum if maximum is not None else ""
+                self.logger.warning("Rejected %s for %s, expected %s%s" % (value, node.path, expected, limit))
+                if valid[0] is not None:
+                    node.set_value(valid[0])
+                return
+            valid[0] = value
+            apply(value)
+        node.set_value_callback = on_set
+        return valid[0]
+
+    def bind_metrics(self, metrics):
+        sampler = self.sampler
+        for read in READS:
+            node = metrics.get("/sensors/" + read)
+            self.add_histogram_gauges(self.gauges, node, sampler.latency[read])
+        self.add_tick_gauges(self.gauges, metrics.get("/sampler"), sampler.ticks)
+        self.add_tick_gauges(self.gauges, metrics.get("/imu_capture"), self.capture.ticks)
+        gauges = (
+            ("published_per_second", Rate(lambda: self.publisher.published)),
+            ("suppressed_per_second", Rate(lambda: self.publisher.suppressed)),
+            ("frames_written", lambda: self.sense.framebuffer.frames_written if self.opened else 0),
+            ("frames_dropped", lambda: self.display.frames_dropped),
+            ("frames_suppressed", lambda: self.display.compositor.frames_suppressed),
+            ("commands_dropped", lambda: self.display.dropped),
+            ("queue_depth", lambda: self.display.queue_depth),
+            ("stick_events_per_second", Rate(lambda: self.stick_reader.events if self.stick_reader else 0)),
+            ("imu_samples_per_second", Rate(lambda: self.capture.samples)),
+            ("imu_stale_per_second", Rate(lambda: self.capture.stale)),
+            ("rules_fired", lambda: sum(rule.fired for rule in self.rules.rules))
+        )
+        for name, read in gauges:
+            self.gauges.add(metrics.get("/" + name), read)
+
+    @staticmethod
+    def add_histogram_gauges(gauges, node, histogram):
+        gauges.add(node.get("/count"), lambda: histogram.count)
+        gauges.add(node.get("/p50"), lambda: histogram.percentile(50) * 1000)
+        gauges.add(node.get("/p99"), lambda: histogram.percentile(99) * 1000)
+        gauges.add(node.get("/max"), lambda: histogram.max * 1000)
+        gauges.add(node.get("/histogram"), lambda: list(histogram.counts))
+
+    @staticmethod
+    def add_tick_gauges(gauges, node, ticks):
+        gauges.add(node.get("/jitter_p99"), lambda: ticks.jitter.percentile(99) * 1000)
+        gauges.add(node.get("/jitter_max"), lambda: ticks.jitter.max * 1000)
+        gauges.add(node.get("/overruns"), lambda: ticks.overruns)
+        gauges.add(node.get("/skipped"), lambda: ticks.skipped)
+
+    def stop(self):
+        self.stopped = True
+        if self.stick_reader is not None:
+            reactor.removeReader(self.stick_reader)
+        workers = (self.sampler, self.capture, self.display)
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            worker.join(STOP_TIMEOUT)
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        # Otherwise closed by opened_backend once it is open
+        if not self._opener.is_alive():
+            self.close_backend()
+
+    def close_backend(self):
+        """
+        Close the joystick and the backend, releasing the framebuffer.
+        """
+        if self.stick is not None:
+            self.stick.close()
+            self.stick = None
+        self.sense.close()
+
+    def create_nodes(self, root):
+        """
+        Add the nodes of the device to its root node.
+        :param root: Node of the device.
+        :return: root.
+        """
+        # Screen Manipulation
+        show_message = dslink.Node("show_message", root)
+        show_message.set_display_name("Show Message")
+        show_message.set_invokable(dslink.Permission.WRITE)
+        show_message.set_profile("show_message")
+        show_message.set_parameters([
+            {
+                "name": "Message",
+                "type": "string"
+            },
+            {
+                "name": "Scroll Speed",
+                "type": "number",
+                "default": "0.1"
+            },
+            {
+                "name": "Foreground",
+                "type": "dynamic",
+                "editor": "color"
+            },
+            {
+                "name": "Background",
+                "type": "dynamic",
+                "editor": "color"
+            }
+        ])
+
+        set_pixel = dslink.Node("set_pixel", root)
+        set_pixel.set_display_name("Set Pixel")
+        set_pixel.set_profile("set_pixel")
+        set_pixel.set_invokable(dslink.Permission.WRITE)
+        set_pixel.set_parameters([
+            {
+                "name": "X",
+                "type": "int",
+                "default": 0
+            },
+            {
+                "name": "Y",
+                "type": "int",
+                "default": 0
+            },
+            {
+                "name": "Color",
+                "type": "dynamic",
+                "editor": "color"
+            },
+            {
+                "name": "Layer",
+                "type": dslink.Value.build_enum(list(LAYERS)),
+                "default": BACKGROUND
+            }
+        ])
+        set_pixel.set_columns([
+            {
+                "name": "Message",
+                "type": "string"
+            }
+        ])
+
+        clear_screen = dslink.Node("clear_screen", root)
+        clear_screen.set_display_name("Clear Screen")
+        clear_screen.set_profile("clear_screen")
+        clear_screen.set_invokable(dslink.Permission.WRITE)
+        clear_screen.set_parameters([
+            {
+                "name": "Layer",
+                "type": dslink.Value.build_enum([ALL_LAYERS] + list(LAYERS)),
+                "default": ALL_LAYERS
+            }
+        ])
+
+        set_pixels = dslink.Node("set_pixels", root)
+        set_pixels.set_display_name("Set Pixels")
+        set_pixels.set_profile("set_pixels")
+        set_pixels.set_invokable(dslink.Permission.WRITE)
+        set_pixels.set_parameters([
+            {
+                "name": "Pixels",
+                "type": "string"
+            },
+            {
+                "name": "Format",
+                "type": dslink.Value.build_enum(FORMATS),
+                "default": JSON
+            },
+            {
+                "name": "X",
+                "type": "int",
+                "default": 0
+            },
+            {
+                "name": "Y",
+                "type": "int",
+                "default": 0
+            },
+            {
+                "name": "Width",
+                "type": "int",
+                "default": 8
+            },
+            {
+                "name": "Height",
+                "type": "int",
+                "default": 8
+            },
+            {
+                "name": "Layer",
+                "type": dslink.Value.build_enum(list(LAYERS)),
+                "default": BACKGROUND
+            }
+        ])
+        set_pixels.set_columns([
+            {
+                "name": "Message",
+                "type": "string"
+            }
+        ])
+
+        # Animations
+        upload_animation = dslink.Node("upload_animation", root)
+        upload_animation.set_display_name("Upload Animation")
+        upload_animation.set_profile("upload_animation")
+        upload_animation.set_invokable(dslink.Permission.WRITE)
+        upload_animation.set_parameters([
+            {
+                "name": "Name",
+                "type": "string"
+            },
+            {
+                "name": "Frames",
+                "type": "string"
+            },
+            {
+                "name": "Format",
+                "type": dslink.Value.build_enum(FORMATS),
+                "default": JSON
+            },
+            {
+                "name": "FPS",
+                "type": "number",
+                "default": 10
+            }
+        ])
+        upload_animation.set_columns([
+            {
+                "name": "Message",
+                "type": "string"
+            }
+        ])
+
+        play_animation = dslink.Node("play_animation", root)
+        play_animation.set_display_name("Play Animation")
+        play_animation.set_profile("play_animation")
+        play_animation.set_invokable(dslink.Permission.WRITE)
+        play_animation.set_parameters([
+            {
+                "name": "Name",
+                "type": "string"
+            },
+            {
+                "name": "Loop",
+                "type": "bool",
+                "default": False
+            },
+            {
+                "name": "Start Time",
+                "type": "number"
+            },
+            {
+                "name": "Layer",
+                "type": dslink.Value.build_enum(list(LAYERS)),
+                "default": BACKGROUND
+            }
+        ])
+        play_animation.set_columns([
+            {
+                "name": "Message",
+                "type": "string"
+            }
+        ])
+
+        stop_animation = dslink.Node("stop_animation", root)
+        stop_animation.set_display_name("Stop Animation")
+        stop_animation.set_profile("stop_animation")
+        stop_animation.set_invokable(dslink.Permission.WRITE)
+
+        layers = dslink.Node("layers", root)
+        layers.set_display_name("Display Layers")
+        for name in LAYERS:
+            layer = dslink.Node(name, layers)
+            layer.set_display_name(name.capitalize())
+            alpha = dslink.Node("alpha", layer)
+            alpha.set_display_name("Alpha")
+            alpha.set_writable(dslink.Permission.CONFIG)
+            alpha.set_type("number")
+            alpha.set_value(1.0)
+            layer.add_child(alpha)
+            layers.add_child(layer)
+
+        # History
+        get_history = dslink.Node("get_history", root)
+        get_history.set_display_name("Get History")
+        get_history.set_profile("get_history")
+        get_history.set_invokable(dslink.Permission.READ)
+        get_history.set_parameters([
+            {
+                "name": "Path",
+                "type": "string"
+            },
+            {
+                "name": "Start Time",
+                "type": "number"
+            },
+            {
+                "name": "End Time",
+                "type": "number"
+            },
+            {
+                "name": "Interval",
+                "type": "number",
+                "default": 0
+            },
+            {
+                "name": "Offset",
+                "type": "int",
+                "default": 0
+            },
+            {
+                "name": "Limit",
+                "type": "int",
+                "default": 1000
+            }
+        ])
+        get_history.set_columns([
+            {
+                "name": "Timestamp",
+                "type": "number"
+            },
+            {
+                "name": "Value",
+                "type": "number"
+            }
+        ])
+        get_history.set_config("$result", "table")
+
+        # Temperature
+        temperature = dslink.Node("temperature", root)
+        temperature.set_display_name("Temperature")
+        temperature.set_type("number")
+        temperature.set_attribute("@unit", "C")
+        self.add_interval_node(temperature)
+        self.add_deadband_nodes(temperature)
+        self.add_stats_nodes(temperature)
+
+        # Humidity
+        humidity = dslink.Node("humidity", root)
+        humidity.set_display_name("Humidity")
+        humidity.set_type("number")
+        humidity.set_attribute("@unit", "%")
+        self.add_interval_node(humidity)
+        self.add_deadband_nodes(humidity)
+        self.add_stats_nodes(humidity)
+
+        # Pressure
+        pressure = dslink.Node("pressure", root)
+        pressure.set_display_name("Pressure")
+        pressure.set_type("number")
+        pressure.set_attribute("@unit", "MB")
+        self.add_interval_node(pressure)
+        self.add_deadband_nodes(pressure)
+        self.add_stats_nodes(pressure)
+
+        # Gyroscope
+        gyroscope = dslink.Node("gyroscope", root)
+        gyroscope.set_display_name("Gyroscope")
+
+        pitch = dslink.Node("pitch", gyroscope)
+        pitch.set_display_name("Pitch")
+        pitch.set_type("number")
+
+        roll = dslink.Node("roll", gyroscope)
+        roll.set_display_name("Roll")
+        roll.set_type("number")
+
+        yaw = dslink.Node("yaw", gyroscope)
+        yaw.set_display_name("Yaw")
+        yaw.set_type("number")
+
+        self.add_deadband_nodes(pitch)
+        self.add_deadband_nodes(roll)
+        self.add_deadband_nodes(yaw)
+        self.add_stats_nodes(pitch)
+        self.add_stats_nodes(roll)
+        self.add_stats_nodes(yaw)
+        gyroscope.add_child(pitch)
+        gyroscope.add_child(roll)
+        gyroscope.add_child(yaw)
+        self.add_interval_node(gyroscope)
+
+        # Accelerometer
+        accelerometer = dslink.Node("accelerometer", root)
+        accelerometer.set_display_name("Accelerometer")
+
+        pitch = dslink.Node("pitch", accelerometer)
+        pitch.set_display_name("Pitch")
+        pitch.set_type("number")
+
+        roll = dslink.Node("roll", accelerometer)
+        roll.set_display_name("Roll")
+        roll.set_type("number")
+
+        yaw = dslink.Node("yaw", accelerometer)
+        yaw.set_display_name("Yaw")
+        yaw.set_type("number")
+
+        self.add_deadband_nodes(pitch)
+        self.add_deadband_nodes(roll)
+        self.add_deadband_nodes(yaw)
+        self.add_stats_nodes(pitch)
+        self.add_stats_nodes(roll)
+        self.add_stats_nodes(yaw)
+        accelerometer.add_child(pitch)
+        accelerometer.add_child(roll)
+        accelerometer.add_child(yaw)
+        self.add_interval_node(accelerometer)
+
+        # Compass
+        compass = dslink.Node("compass", root)
+        compass.set_display_name("Compass")
+        compass.set_type("number")
+        self.add_interval_node(compass)
+        self.add_deadband_nodes(compass)
+        self.add_stats_nodes(compass)
+
+        # Rules
+        add_rule = dslink.Node("add_rule", root)
+        add_rule.set_display_name("Add Rule")
+        add_rule.set_profile("add_rule")
+        add_rule.set_invokable(dslink.Permission.CONFIG)
+        add_rule.set_parameters([
+            {
+                "name": "Name",
+                "type": "string"
+            },
+            {
+                "name": "Rule",
+                "type": "string",
+                "editor": "textarea"
+            }
+        ])
+        add_rule.set_columns([
+            {
+                "name": "Message",
+                "type": "string"
+            }
+        ])
+
+        remove_rule = dslink.Node("remove_rule", root)
+        remove_rule.set_display_name("Remove Rule")
+        remove_rule.set_profile("remove_rule")
+        remove_rule.set_invokable(dslink.Permission.CONFIG)
+        remove_rule.set_parameters([
+            {
+                "name": "Name",
+                "type": "string"
+            }
+        ])
+        remove_rule.set_columns([
+            {
+                "name": "Message",
+                "type": "string"
+            }
+        ])
+
+        rules = dslink.Node("rules", root)
+        rules.set_display_name("Rules")
+
+        # Raw IMU and fused orientation
+        imu = dslink.Node("imu", root)
+        imu.set_display_name("IMU")
+        self.add_setting_node(imu, "rate", "Sample Rate", DEFAULT_RATE, "Hz")
+        self.add_setting_node(imu, "interval", "Update Interval", DEFAULT_IMU_INTERVAL, "s")
+        self.add_setting_node(imu, "time_constant", "Filter Time Constant", DEFAULT_TIME_CONSTANT, "s")
+        for group, display_name in zip(RAW, ("Accelerometer", "Gyroscope", "Magnetometer")):
+            node = dslink.Node(group, imu)
+            node.set_display_name(display_name)
+            for axis in AXES:
+                self.add_metric_node(node, axis, axis.upper(), IMU_UNITS[group])
+            imu.add_child(node)
+        quaternion = dslink.Node("quaternion", imu)
+        quaternion.set_display_name("Quaternion")
+        for name in QUATERNION:
+            self.add_metric_node(quaternion, name, name.upper())
+        imu.add_child(quaternion)
+        orientation = dslink.Node("orientation", imu)
+        orientation.set_display_name("Orientation")
+        for name in EULER:
+            self.add_metric_node(orientation, name, name.capitalize(), "deg")
+        imu.add_child(orientation)
+
+        # Vibration
+        vibration_node = dslink.Node("vibration", root)
+        vibration_node.set_display_name("Vibration")
+        self.add_setting_node(vibration_node, "rate", "Sample Rate", vibration.DEFAULT_RATE, "Hz")
+        self.add_setting_node(vibration_node, "window", "Window Size", vibration.DEFAULT_WINDOW_SIZE, "samples")
+        bands = dslink.Node("bands", vibration_node)
+        bands.set_display_name("Bands")
+        bands.set_writable(dslink.Permission.CONFIG)
+        bands.set_type("string")
+        bands.set_value(vibration.DEFAULT_BANDS)
+        bands.set_attribute("@unit", "Hz")
+        vibration_node.add_child(bands)
+        for name, display_name, unit in VIBRATION_VALUES:
+            self.add_metric_node(vibration_node, name, display_name, unit,
+                                 "array" if name == "band_energy" else "number")
+
+        # Joystick
+        joystick = dslink.Node("stick", root)
+        joystick.set_display_name("Stick")
+
+        up = dslink.Node("up", joystick)
+        up.set_display_name("Up")
+        up.set_type(dslink.Value.build_enum(["UP, DOWN"]))
+        up.set_value("UP", check=False)
+
+        down = dslink.Node("down", joystick)
+        down.set_display_name("Down")
+        down.set_type(dslink.Value.build_enum(["UP, DOWN"]))
+        down.set_value("UP", check=False)
+
+        left = dslink.Node("left", joystick)
+        left.set_display_name("Left")
+        left.set_type(dslink.Value.build_enum(["UP, DOWN"]))
+        left.set_value("UP", check=False)
+
+        right = dslink.Node("right", joystick)
+        right.set_display_name("Right")
+        right.set_type(dslink.Value.build_enum(["UP, DOWN"]))
+        right.set_value("UP", check=False)
+
+        button = dslink.Node("button", joystick)
+        button.set_display_name("Button")
+        button.set_type(dslink.Value.build_enum(["UP, DOWN"]))
+        button.set_value("UP", check=False)
+
+        joystick.add_child(up)
+        joystick.add_child(down)
+        joystick.add_child(left)
+        joystick.add_child(right)
+        joystick.add_child(button)
+
+        # Add Nodes to root
+        root.add_child(show_message)
+        root.add_child(set_pixel)
+        root.add_child(clear_screen)
+        root.add_child(set_pixels)
+        root.add_child(upload_animation)
+        root.add_child(play_animation)
+        root.add_child(stop_animation)
+        root.add_child(layers)
+        root.add_child(get_history)
+        root.add_child(add_rule)
+        root.add_child(remove_rule)
+        root.add_child(rules)
+        root.add_child(temperature)
+        root.add_child(humidity)
+        root.add_child(pressure)
+        root.add_child(gyroscope)
+        root.add_child(accelerometer)
+        root.add_child(compass)
+        root.add_child(imu)
+        root.add_child(vibration_node)
+        root.add_child(joystick)
+
+        # Metrics
+        metrics = dslink.Node("metrics", root)
+        metrics.set_display_name("Metrics")
+        sensors = dslink.Node("sensors", metrics)
+        sensors.set_display_name("Sensor Read Latency")
+        for read in READS:
+            self.add_histogram_nodes(sensors, read, read.capitalize() if read != "imu" else "IMU")
+        metrics.add_child(sensors)
+        self.add_tick_nodes(metrics, "sampler", "Sampler")
+        self.add_tick_nodes(metrics, "imu_capture", "IMU Capture")
+        self.add_metric_node(metrics, "published_per_second", "Published Per Second", "1/s")
+        self.add_metric_node(metrics, "suppressed_per_second", "Suppressed Per Second", "1/s")
+        self.add_metric_node(metrics, "frames_written", "Frames Written", node_type="int")
+        self.add_metric_node(metrics, "frames_dropped", "Frames Dropped", node_type="int")
+        self.add_metric_node(metrics, "frames_suppressed", "Unchanged Frames Not Written", node_type="int")
+        self.add_metric_node(metrics, "commands_dropped", "Display Commands Dropped", node_type="int")
+        self.add_metric_node(metrics, "queue_depth", "Display Queue Depth", node_type="int")
+        self.add_metric_node(metrics, "stick_events_per_second", "Stick Events Per Second", "1/s")
+        self.add_metric_node(metrics, "imu_samples_per_second", "IMU Samples Per Second", "1/s")
+        self.add_metric_node(metrics, "imu_stale_per_second", "Stale IMU Reads Per Second", "1/s")
+        self.add_metric_node(metrics, "rules_fired", "Rules Fired", node_type="int")
+        root.add_child(metrics)
+
+        return root
+
+    @staticmethod
+    def add_interval_node(sensor):
+        interval = dslink.Node("interval", sensor)
+        interval.set_display_name("Update Interval")
+        interval.set_writable(dslink.Permission.CONFIG)
+        interval.set_type("number")
+        interval.set_value(DEFAULT_INTERVALS[sensor.name])
+        interval.set_attribute("@unit", "s")
+        sensor.add_child(interval)
+
+    @staticmethod
+    def add_setting_node(parent, name, display_name, default, unit):
+        setting = dslink.Node(name, parent)
+        setting.set_display_name(display_name)
+        setting.set_writable(dslink.Permission.CONFIG)
+        setting.set_type("number")
+        setting.set_value(default)
+        setting.set_attribute("@unit", unit)
+        parent.add_child(setting)
+        return setting
+
+    @staticmethod
+    def add_deadband_nodes(value_node):
+        for name, display_name, default in DEADBAND_SETTINGS:
+            setting = dslink.Node(name, value_node)
+            setting.set_display_name(display_name)
+            setting.set_writable(dslink.Permission.CONFIG)
+            setting.set_type("number")
+            setting.set_value(default)
+            if name != "deadband":
+                setting.set_attribute("@unit", "%" if name == "deadband_percent" else "s")
+            value_node.add_child(setting)
+
+    @staticmethod
+    def add_metric_node(parent, name, display_name, unit=None, node_type="number"):
+        node = dslink.Node(name, parent)
+        node.set_display_name(display_name)
+        node.set_type(node_type)
+        if unit is not None:
+            node.set_attribute("@unit", unit)
+        parent.add_child(node)
+        return node
+
+    @staticmethod
+    def add_histogram_nodes(parent, name, display_name):
+        node = dslink.Node(name, parent)
+        node.set_display_name(display_name)
+        Device.add_metric_node(node, "count", "Count", node_type="int")
+        Device.add_metric_node(node, "p50", "50th Percentile", "ms")
+        Device.add_metric_node(node, "p99", "99th Percentile", "ms")
+        Device.add_metric_node(node, "max", "Max", "ms")
+        histogram = Device.add_metric_node(node, "histogram", "Histogram", node_type="array")
+        # Upper bounds of the buckets, the last bucket has none
+        histogram.set_attribute("@buckets", [bound * 1000 for bound in LATENCY_BOUNDS])
+        parent.add_child(node)
+        return node
+
+    @staticmethod
+    def add_tick_nodes(parent, name, display_name):
+        node = dslink.Node(name, parent)
+        node.set_display_name(display_name)
+        Device.add_metric_node(node, "jitter_p99", "Jitter 99th Percentile", "ms")
+        Device.add_metric_node(node, "jitter_max", "Jitter Max", "ms")
+        Device.add_metric_node(node, "overruns", "Overruns", node_type="int")
+        Device.add_metric_node(node, "skipped", "Skipped Runs", node_type="int")
+        parent.add_child(node)
+        return node
+
+    @staticmethod
+    def add_stats_nodes(value_node):
+        stats = dslink.Node("stats", value_node)
+        stats.set_display_name("Statistics")
+        window = dslink.Node("window", stats)
+        window.set_display_name("Window")
+        window.set_writable(dslink.Permission.CONFIG)
+        window.set_type("number")
+        window.set_value(DEFAULT_WINDOW)
+        window.set_attribute("@unit", "s")
+        stats.add_child(window)
+        for name, display_name in STATS:
+            stat = dslink.Node(name, stats)
+            stat.set_display_name(display_name)
+            stat.set_type("number")
+            stats.add_child(stat)
+        value_node.add_child(stats)
+
+    def start_show_message(self, parameters):
+        self.show_message(parameters)
+        return []
+
+    def show_message(self, parameters):
+        message = str(parameters[1]["Message"])
+        scroll_speed = float(parameters[1]["Scroll Speed"])
+        if "Foreground" in parameters[1]:
+            fgin = str(parameters[1]["Foreground"]).lstrip("#")
+            fgred, fggreen, fgblue = rgb(hex(int(fgin))[2:].zfill(6))
+            fg = [fgred, fggreen, fgblue]
+        else:
+            fg = [255, 255, 255]
+        if "Background" in parameters[1]:
+            bgin = str(parameters[1]["Background"]).lstrip("#")
+            bgred, bggreen, bgblue = rgb(hex(int(bgin))[2:].zfill(6))
+            bg = [bgred, bggreen, bgblue]
+        else:
+            # Scrolls over what the other layers show
+            bg = None
+        self.display.show_message(message, scroll_speed, fg, bg)
+
+    def set_pixel(self, parameters):
+        x = int(parameters[1]["X"])
+        y = int(parameters[1]["Y"])
+        if (x < 0 or x > 7) or (y < 0 or y > 7):
+            return [
+                [
+                    "Invalid coordinate, 0-7 is valid."
+                ]
+            ]
+        if "Color" in parameters[1]:
+            input = str(parameters[1]["Color"]).lstrip("#")
+            red, green, blue = rgb(hex(int(input))[2:].zfill(6))
+        else:
+            red = green = blue = 255
+        layer = str(parameters[1].get("Layer", BACKGROUND))
+        if layer not in LAYERS:
+            return [
+                [
+                    "Unknown layer %s" % layer
+                ]
+            ]
+
+        self.display.set_pixel(x, y, red, green, blue, layer)
+
+        return [
+            [
+                "Success"
+            ]
+        ]
+
+    def clear_screen(self, parameters):
+        layer = str(parameters[1].get("Layer", ALL_LAYERS))
+        if layer == ALL_LAYERS:
+            self.display.clear()
+        elif layer in LAYERS:
+            self.display.clear(layer)
+
+        return []
+
+    def set_pixels(self, parameters):
+        pixel_format = parameters[1].get("Format", JSON)
+        x = int(parameters[1].get("X", 0))
+        y = int(parameters[1].get("Y", 0))
+        width = int(parameters[1].get("Width", 8))
+        height = int(parameters[1].get("Height", 8))
+        layer = str(parameters[1].get("Layer", BACKGROUND))
+        if x < 0 or y < 0 or width < 1 or height < 1 or x + width > 8 or y + height > 8:
+            return [
+                [
+                    "Region must be inside the 8x8 matrix"
+                ]
+            ]
+        if layer not in LAYERS:
+            return [
+                [
+                    "Unknown layer %s" % layer
+                ]
+            ]
+        try:
+            values = decode_pixels(str(parameters[1]["Pixels"]), pixel_format, width, height)
+        except PixelFormatError as e:
+            return [
+                [
+                    str(e)
+                ]
+            ]
+
+        self.display.set_region(x, y, width, height, values, layer)
+
+        return [
+            [
+                "Success"
+            ]
+        ]
+
+    def upload_animation(self, parameters):
+        name = str(parameters[1].get("Name", ""))
+        fps = float(parameters[1].get("FPS", 10))
+        if not name:
+            return [
+                [
+                    "Name is required"
+                ]
+            ]
+        if fps <= 0:
+            return [
+                [
+                    "FPS must be greater than 0"
+                ]
+            ]
+        try:
+            count, frames = decode_frames(str(parameters[1]["Frames"]), parameters[1].get("Format", JSON))
+            self.animations.add(Animation(name, count, frames, fps))
+        except ValueError as e:
+            return [
+                [
+                    str(e)
+                ]
+            ]
+
+        return [
+            [
+                "Uploaded %d frames" % count
+            ]
+        ]
+
+    def play_animation(self, parameters):
+        animation = self.animations.get(str(parameters[1].get("Name", "")))
+        if animation is None:
+            return [
+                [
+                    "Unknown animation"
+                ]
+            ]
+        layer = str(parameters[1].get("Layer", BACKGROUND))
+        if layer not in LAYERS:
+            return [
+                [
+                    "Unknown layer %s" % layer
+                ]
+            ]
+        start = parameters[1].get("Start Time")
+        if start is not None:
+            # Wall clock time, so several devices can start in sync
+            start = to_monotonic(float(start))
+        self.display.play(animation, bool(parameters[1].get("Loop", False)), start, layer)
+
+        return [
+            [
+                "Success"
+            ]
+        ]
+
+    def stop_animation(self, parameters):
+        self.display.stop_playing()
+
+        return []
+
+    def get_history(self, parameters):
+        path = str(parameters[1].get("Path", ""))
+        if path not in self.history.series:
+            # Relative to the device
+            path = self.path + path
+            if path not in self.history.series:
+                return []
+        start = parameters[1].get("Start Time")
+        end = parameters[1].get("End Time")
+        return self.history.query(path,
+                                  None if start is None else float(start),
+                                  None if end is None else float(end),
+                                  float(parameters[1].get("Interval", 0)),
+                                  max(0, int(parameters[1].get("Offset", 0))),
+                                  max(0, int(parameters[1].get("Limit", 1000))))
+
+    def add_rule(self, parameters):
+        name = str(parameters[1].get("Name", ""))
+        definition = str(parameters[1].get("Rule", ""))
+        if not name or name[0] in "$@" or "/" in name:
+            return [
+                [
+                    "Name is required and cannot contain / or start with $ or @"
+                ]
+            ]
+        if not self.rules_node.has_child(name) and len(self.rules_node.children) >= MAX_RULES:
+            return [
+                [
+                    "A device has at most %d rules" % MAX_RULES
+                ]
+            ]
+        try:
+            compile_rule(name, definition, self)
+        except RuleError as e:
+            return [
+                [
+                    str(e)
+                ]
+            ]
+        if self.rules_node.has_child(name):
+            self.rules_node.get("/" + name).set_value(definition)
+        else:
+            rule = dslink.Node(name, self.rules_node)
+            rule.set_type("string")
+            rule.set_writable(dslink.Permission.CONFIG)
+            rule.set_value(definition)
+            self.rules_node.add_child(rule)
+        self.compile_rules()
+
+        return [
+            [
+                "Success"
+            ]
+        ]
+
+    def remove_rule(self, parameters):
+        name = str(parameters[1].get("Name", ""))
+        if not self.rules_node.has_child(name):
+            return [
+                [
+                    "Unknown rule"
+                ]
+            ]
+        self.rules_node.remove_child(name)
+        self.compile_rules()
+
+        return [
+            [
+                "Success"
+            ]
+        ]
+
+    def compile_rules(self):
+        """
+        Compile the rules under the rules node into a new RuleSet.
+        """
+        definitions = dict((name, node.get_value()) for name, node in self.rules_node.children.items())
+        self._rule_definitions = definitions
+        self.rules, errors = RuleSet.compile(definitions, self)
+        for name in errors:
+            self.logger.warning(errors[name])
+
+    def on_stick_event(self, key, state):
+        self.rules.key(key, state)
+
+    def update(self):
+        """
+        Called by the link every 250 ms to enable the sensors that are
+        subscribed to or have rules, apply interval, deadband and rule
+        changes and refresh the subscribed statistics.
+        """
+        for name, node in self.rules_node.children.items():
+            if self._rule_definitions.get(name) != node.get_value():
+                # Edited through the node value
+                self.compile_rules()
+                break
+
+        watched = set()
+        for sensor, value_node, window, stats in self.stats_nodes:
+            value = window.get_value()
+            if isinstance(value, (int, float)) and value > 0:
+                self.history.set_window(value_node.path, value)
+            rolling = self.history.stats(value_node.path)
+            for node in stats:
+                if node.is_subscribed():
+                    watched.add(sensor)
+                    if rolling is not None and rolling.count:
+                        node.set_value(getattr(rolling, node.name))
+
+        paths = self.rules.paths
+        for sensor in SENSORS:
+            subscribed = sensor in watched or any(channel in paths for channel in self.channels[sensor])
+            for node in self.sensor_nodes[sensor]:
+                if subscribed or node.is_subscribed():
+                    subscribed = True
+                    break
+            self.sampler.configure(sensor, self.positive(self.interval_nodes[sensor].get_value()), subscribed)
+
+        for value_node, settings in self.deadband_nodes:
+            values = []
+            for setting in settings:
+                value = setting.get_value()
+                if not isinstance(value, (int, float)) or value < 0:
+                    value = 0.0
+                values.append(value)
+            self.publisher.deadband(value_node).configure(*values)
+
+        self.update_capture()
+        self.gauges.refresh()
+
+    def update_capture(self):
+        rate, interval, time_constant = [self.positive(node.get_value()) for node in self.imu_settings]
+        if interval is not None:
+            self.imu_interval = interval
+        paths = self.rules.paths
+        fuse = any(node.is_subscribed() for node in self.imu_nodes) or \
+            any(channel in paths for channel in self.imu_channels)
+        analyse = any(node.is_subscribed() for node in self.vibration_nodes) or \
+            any(channel in paths for channel in self.vibration_channels)
+        if analyse:
+            self.update_vibration()
+            vibration_rate = self.positive(self.vibration_settings[0].get_value())
+            if vibration_rate is not None and (rate is None or not fuse or vibration_rate > rate):
+                rate = vibration_rate
+        else:
+            self.vibration = None
+            self._vibration_config = None
+        if rate is not None:
+            # Faster reads than the IMU delivers only find stale samples
+            limit = MAX_IMU_RATE
+            if self.opened and self.sense.imu_rate is not None:
+                limit = min(limit, self.sense.imu_rate)
+            rate = min(rate, limit)
+        self.capture.configure(rate, time_constant, fuse or analyse, fuse)
+
+    def update_vibration(self):
+        """
+        Replace the analyser when the window size or bands change. The
+        capture thread picks the new one up with its next block.
+        """
+        _, window, bands = self.vibration_settings
+        config = (self.positive(window.get_value()), bands.get_value())
+        if config == self._vibration_config:
+            return
+        self._vibration_config = config
+        try:
+            parsed = vibration.parse_bands(str(config[1] or ""))
+        except ValueError as e:
+            self.logger.warning("Invalid vibration bands: %s" % e)
+            if self.vibration is not None:
+                return
+            parsed = vibration.parse_bands(vibration.DEFAULT_BANDS)
+        analyser = vibration.VibrationAnalyser(config[0] or vibration.DEFAULT_WINDOW_SIZE, parsed)
+        self.vibration_nodes[-1].set_attribute("@bands", ["%g-%g" % band for band in parsed])
+        self.vibration = analyser
+
+    @staticmethod
+    def positive(value):
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0:
+            return value
+        return None
+
+    def on_readings(self, readings):
+        """
+        Called by the sampler thread with new readings.
+        """
+        reactor.callFromThread(self.publish, readings)
+
+    def publish(self, readings):
+        """
+        Set the values of the subscribed nodes from new sampler readings.
+        """
+        now = monotonic()
+        recorder = self.recorder
+        for sensor in readings:
+            value = readings[sensor].value
+            timestamp = readings[sensor].timestamp
+            nodes = self.sensor_nodes[sensor]
+            if sensor in ("gyroscope", "accelerometer"):
+                pitch, roll, yaw = nodes
+                self.history.record(pitch.path, timestamp, value["pitch"])
+                self.history.record(roll.path, timestamp, value["roll"])
+                self.history.record(yaw.path, timestamp, value["yaw"])
+                if recorder is not None:
+                    channels = self.channels[sensor]
+                    recorder.record_value(channels[0], timestamp, value["pitch"])
+                    recorder.record_value(channels[1], timestamp, value["roll"])
+                    recorder.record_value(channels[2], timestamp, value["yaw"])
+                self.publisher.publish(pitch, value["pitch"], now)
+                self.publisher.publish(roll, value["roll"], now)
+                self.publisher.publish(yaw, value["yaw"], now)
+                channels = self.channels[sensor]
+                self.rules.value(channels[0], value["pitch"])
+                self.rules.value(channels[1], value["roll"])
+                self.rules.value(channels[2], value["yaw"])
+            else:
+                self.history.record(nodes[0].path, timestamp, value)
+                if recorder is not None:
+                    recorder.record_value(self.channels[sensor][0], timestamp, value)
+                self.publisher.publish(nodes[0], value, now)
+                self.rules.value(self.channels[sensor][0], value)
+
+    def on_imu_block(self, block):
+        """
+        Called by the capture thread with every block.
+        """
+        analyser = self.vibration
+        if analyser is not None:
+            for summary in analyser.add(block):
+                reactor.callFromThread(self.publish_vibration, summary)
+        if block.euler is None:
+            return
+        now = monotonic()
+        # Decimated to the update interval, only the latest sample is sent.
+        # Blocks arrive with some jitter, so they may be half a block early
+        span = block.timestamps[-1] - block.timestamps[0]
+        if now + span / 2 < self._imu_due:
+            return
+        self._imu_due = now + self.imu_interval
+        reactor.callFromThread(self.publish_imu, block.latest())
+
+    def publish_imu(self, latest):
+        now = monotonic()
+        timestamp, raw, quaternion, euler = latest
+        for node, channel, value in zip(self.imu_nodes, self.imu_channels, raw + quaternion + euler):
+            self.history.record(node.path, timestamp, value)
+            self.publisher.publish(node, value, now)
+            self.rules.value(channel, value)
+
+    def publish_vibration(self, summary):
+        now = monotonic()
+        for node, channel, value in zip(self.vibration_nodes, self.vibration_channels, summary[1:-1]):
+            self.history.record(node.path, summary.timestamp, value)
+            self.publisher.publish(node, value, now)
+            self.rules.value(channel, value)
+        band_energy = self.vibration_nodes[-1]
+        if band_energy.is_subscribed():
+            band_energy.set_value(summary.band_energy)
+
+
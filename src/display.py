@@ -0,0 +1,315 @@
+from array import array
+from collections import deque
+import logging
+from threading import Condition, Thread
+
+from compositor import BACKGROUND, OVERLAY, Compositor
+from framebuffer import PIX_MAPS, pack_pixel
+from timing import monotonic
+
+FRAME = "frame"
+REGION = "region"
+PIXELS = "pixels"
+CLEAR = "clear"
+MESSAGE = "message"
+ANIMATION = "animation"
+STOP = "stop"
+ALPHA = "alpha"
+
+DRAWS = (FRAME, REGION, PIXELS, CLEAR)
+PLAYS = (MESSAGE, ANIMATION)
+
+
+class Player(object):
+    """
+    A strip being played on a layer, frame i at start + i * period.
+    """
+    __slots__ = ("layer", "strip", "period", "loop", "start", "transient", "shown")
+
+    def __init__(self, layer, strip, period, loop, start, transient=False):
+        """
+        :param transient: True to clear the layer when the strip ends.
+        """
+        self.layer = layer
+        self.strip = strip
+        self.period = period
+        self.loop = loop
+        self.start = start
+        self.transient = transient
+        self.shown = -1
+
+    def next_due(self, now):
+        if self.period <= 0:
+            return now
+        return self.start + (self.shown + 1) * self.period
+
+
+class DisplayWorker(object):
+    """
+    Single thread that owns the LED matrix. Invokes queue commands and
+    return straight away. Commands draw on the layers of a Compositor: the
+    background, status pixels and the overlay messages scroll on. After
+    every batch of commands and frames the layers are merged, and the frame
+    is only written out when it changed.
+
+    Pending commands are coalesced: a full frame or a clear replaces what is
+    queued for its layer, consecutive single pixel writes are merged, and a
+    message or animation replaces the ones queued before it. Drawing on a
+    layer stops a message or animation that is playing on it, while the
+    other layers keep playing.
+
+    Messages and animations are played against absolute deadlines on the
+    monotonic clock, so they do not drift, and frames whose deadline has
+    already passed are skipped and counted in frames_dropped.
+    """
+
+    def __init__(self, backend, renderer, max_pending=16):
+        """
+        :param backend: Backend to draw on.
+        :param renderer: MessageRenderer used for messages.
+        :param max_pending: Maximum number of queued commands, the oldest
+        ones are dropped beyond it.
+        """
+        self.backend = backend
+        self.renderer = renderer
+        self.compositor = Compositor(backend)
+        self.players = {}
+        self.commands = 0
+        self.dropped = 0
+        self.frames_played = 0
+        self.frames_dropped = 0
+        self.logger = logging.getLogger("DSLink")
+        self._pending = deque(maxlen=max_pending)
+        self._cond = Condition()
+        self._stopped = False
+        self._thread = Thread(target=self.run, name="DisplayWorker")
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def join(self, timeout=None):
+        """
+        Wait for the thread to end after stop().
+        """
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+
+    def set_pixels(self, values, layer=BACKGROUND):
+        """
+        Queue a full frame.
+        :param values: 64 packed RGB565 pixels, row-major.
+        :param layer: Name of the layer to draw on.
+        """
+        self._submit((FRAME, layer, values), lambda pending: pending[0] in DRAWS and pending[1] == layer)
+
+    def set_region(self, x, y, width, height, values, layer=BACKGROUND):
+        """
+        Queue an update of part of the frame.
+        :param values: Packed RGB565 pixels, row-major over the region.
+        """
+        if width == 8 and height == 8:
+            self.set_pixels(values, layer)
+            return
+        with self._cond:
+            self.commands += 1
+            self._append((REGION, layer, x, y, width, height, values))
+            self._cond.notify()
+
+    def clear(self, layer=None):
+        """
+        Queue a clear of a layer, or of every layer and anything playing.
+        """
+        if layer is None:
+            self._submit((CLEAR, None), lambda pending: pending[0] != ALPHA)
+        else:
+            self._submit((CLEAR, layer), lambda pending: pending[0] in DRAWS and pending[1] == layer)
+
+    def set_pixel(self, x, y, red, green, blue, layer=BACKGROUND):
+        with self._cond:
+            self.commands += 1
+            if self._pending and self._pending[-1][0] == PIXELS and self._pending[-1][1] == layer:
+                self._pending[-1][2].append((x, y, red, green, blue))
+            else:
+                self._append((PIXELS, layer, [(x, y, red, green, blue)]))
+            self._cond.notify()
+
+    def show_message(self, text_string, scroll_speed, text_colour, back_colour=None):
+        """
+        Queue a message scrolling across the overlay.
+        :param back_colour: [R,G,B] of the background, None to scroll over
+        the layers below.
+        """
+        self._submit((MESSAGE, OVERLAY, text_string, scroll_speed, text_colour, back_colour),
+                     lambda pending: pending[0] in PLAYS and pending[1] == OVERLAY)
+
+    def play(self, animation, loop=False, start=None, layer=BACKGROUND):
+        """
+        Queue an animation.
+        :param animation: Animation to play.
+        :param loop: True to repeat it until something else is drawn.
+        :param start: Monotonic time of the first frame, defaults to when
+        the worker gets to it.
+        :param layer: Name of the layer to play it on.
+        """
+        self._submit((ANIMATION, layer, animation, loop, start),
+                     lambda pending: pending[0] in PLAYS and pending[1] == layer)
+
+    def stop_playing(self):
+        """
+        Stop the messages and animations, leaving their current frames shown.
+        """
+        self._submit((STOP, None), lambda pending: pending[0] in PLAYS)
+
+    def set_alpha(self, layer, alpha):
+        """
+        :param alpha: Opacity of the layer from 0 to 1.
+        """
+        self._submit((ALPHA, layer, alpha), lambda pending: pending[0] == ALPHA and pending[1] == layer)
+
+    def _submit(self, command, replaces):
+        """
+        Queue a command, dropping the pending commands it makes pointless.
+        :param replaces: Returns True for a pending command to drop.
+        """
+        with self._cond:
+            self.commands += 1
+            kept = [pending for pending in self._pending if not replaces(pending)]
+            self.dropped += len(self._pending) - len(kept)
+            self._pending.clear()
+            self._pending.extend(kept)
+            self._append(command)
+            self._cond.notify()
+
+    def _append(self, command):
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append(command)
+
+    def _wait(self, due):
+        """
+        Wait for new commands, or until the monotonic time due.
+        :return: List of the pending commands, None when stopped.
+        """
+        with self._cond:
+            while not self._pending and not self._stopped:
+                if due is None:
+                    self._cond.wait()
+                    continue
+                timeout = due - monotonic()
+                if timeout <= 0:
+                    break
+                self._cond.wait(timeout)
+            if self._stopped:
+                return None
+            commands = list(self._pending)
+            self._pending.clear()
+            return commands
+
+    def next_due(self, now):
+        """
+        :return: Monotonic time the next frame of a strip is due, None when
+        nothing is playing.
+        """
+        due = None
+        for player in self.players.values():
+            player_due = max(player.start, player.next_due(now))
+            due = player_due if due is None else min(due, player_due)
+        return due
+
+    def run(self):
+        while True:
+            commands = self._wait(self.next_due(monotonic()))
+            if commands is None:
+                return
+            changed = False
+            for command in commands:
+                try:
+                    self.execute(command)
+                    changed = True
+                except Exception:
+                    self.logger.exception("Display command %s failed" % command[0])
+            try:
+                if self.advance(monotonic()) or changed:
+                    self.compositor.flush()
+            except Exception:
+                self.logger.exception("Failed to draw the display")
+
+    def execute(self, command):
+        kind = command[0]
+        if kind == STOP:
+            self.players.clear()
+            return
+        if kind == CLEAR and command[1] is None:
+            self.players.clear()
+            self.compositor.clear()
+            return
+        layer = self.compositor.layer(command[1])
+        if kind == ALPHA:
+            layer.alpha = min(max(float(command[2]), 0.0), 1.0)
+            return
+        self.players.pop(layer.name, None)
+        rotation = self.backend.rotation
+        if kind == FRAME:
+            if rotation == 0:
+                layer.fill(array("H", command[2]))
+            else:
+                layer.draw_region(0, 0, 8, 8, command[2], PIX_MAPS[rotation])
+        elif kind == REGION:
+            x, y, width, height, values = command[2:]
+            layer.draw_region(x, y, width, height, values, PIX_MAPS[rotation])
+        elif kind == PIXELS:
+            layer.draw_pixels([(x, y, pack_pixel(red, green, blue)) for x, y, red, green, blue in command[2]],
+                              PIX_MAPS[rotation])
+        elif kind == CLEAR:
+            layer.clear()
+        elif kind == MESSAGE:
+            text_string, scroll_speed, text_colour, back_colour = command[2:]
+            strip = self.renderer.render(text_string, text_colour, back_colour, rotation)
+            self.add_player(Player(layer, strip, scroll_speed, False, monotonic(), True))
+        elif kind == ANIMATION:
+            animation, loop, start = command[2:]
+            self.add_player(Player(layer, animation.strip(rotation), animation.period, loop,
+                                   monotonic() if start is None else start))
+
+    def add_player(self, player):
+        if len(player.strip):
+            self.players[player.layer.name] = player
+
+    def advance(self, now):
+        """
+        Show the frames of the strips that are due.
+        :return: True if a layer changed.
+        """
+        changed = False
+        for name in list(self.players):
+            player = self.players[name]
+            if now < player.start:
+                continue
+            count = len(player.strip)
+            due = int((now - player.start) / player.period) if player.period > 0 else player.shown + 1
+            if due == player.shown:
+                continue
+            if due >= count and not player.loop:
+                del self.players[name]
+                if player.transient:
+                    player.layer.clear()
+                    changed = True
+                continue
+            if due > player.shown + 1:
+                self.frames_dropped += due - player.shown - 1
+            i = due % count
+            player.layer.fill(player.strip.frame(i), player.strip.frame_coverage(i))
+            self.frames_played += 1
+            player.shown = due
+            changed = True
+        return changed
@@ -0,0 +1,208 @@
+from array import array
+import io
+import mmap
+import os
+import stat
+from threading import Lock
+
+FRAME_PIXELS = 64
+FRAME_BYTES = FRAME_PIXELS * 2
+
+# RGB565 packing tables, a pixel is _RED[r] | _GREEN[g] | _BLUE[b]
+_RED = [(v >> 3) << 11 for v in range(256)]
+_GREEN = [(v >> 2) << 5 for v in range(256)]
+_BLUE = [v >> 3 for v in range(256)]
+
+
+def _rot90(pix_map):
+    # Same result as numpy.rot90 on an 8x8 map
+    return [[pix_map[j][7 - i] for j in range(8)] for i in range(8)]
+
+
+_PIX_MAP0 = [[row * 8 + col for col in range(8)] for row in range(8)]
+_PIX_MAP90 = _rot90(_PIX_MAP0)
+_PIX_MAP180 = _rot90(_PIX_MAP90)
+_PIX_MAP270 = _rot90(_PIX_MAP180)
+
+PIX_MAPS = {
+    0: _PIX_MAP0,
+    90: _PIX_MAP90,
+    180: _PIX_MAP180,
+    270: _PIX_MAP270
+}
+
+# Framebuffer index of every pixel of a row-major pixel list, per rotation
+INDEX_MAPS = dict(
+    (rotation, [index for row in pix_map for index in row])
+    for rotation, pix_map in PIX_MAPS.items()
+)
+
+
+def pack_pixel(red, green, blue):
+    return _RED[red] | _GREEN[green] | _BLUE[blue]
+
+
+def unpack_pixel(bits16):
+    return [(bits16 & 0xF800) >> 8, (bits16 & 0x7E0) >> 3, (bits16 & 0x1F) << 3]
+
+
+def frame_bytes(frame):
+    """
+    Raw bytes of a packed frame.
+    """
+    if isinstance(frame, array):
+        return frame.tobytes() if hasattr(frame, "tobytes") else frame.tostring()
+    if isinstance(frame, memoryview):
+        return frame.tobytes()
+    return bytes(frame)
+
+
+class FrameStrip(object):
+    """
+    A sequence of frames packed in framebuffer order into a single buffer.
+    Frames are memoryview slices of it, so playing the strip copies nothing
+    until a frame is written out. Strips with transparent pixels also have
+    a coverage byte per pixel.
+    """
+
+    def __init__(self, frames, count, coverage=None):
+        self.buffer = frames
+        self.count = count
+        self.coverage = coverage
+        self._view = memoryview(frames)
+        self._coverage_view = memoryview(coverage) if coverage is not None else None
+
+    def __len__(self):
+        return self.count
+
+    def frame(self, i):
+        start = i * FRAME_BYTES
+        return self._view[start:start + FRAME_BYTES]
+
+    def frame_coverage(self, i):
+        """
+        :return: Coverage of the pixels of frame i, None when it is opaque.
+        """
+        if self._coverage_view is None:
+            return None
+        start = i * FRAME_PIXELS
+        return self._coverage_view[start:start + FRAME_PIXELS]
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.frame(i)
+
+
+class FrameBuffer(object):
+    """
+    Direct writer for the Sense HAT LED framebuffer. The device is mapped
+    once, the current frame is kept as 64 packed RGB565 values in
+    framebuffer order and every update is written as a single copy of the
+    whole frame. Any file of at least 128 bytes can stand in for the
+    device, and without a path the frame lives only in memory.
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: Framebuffer device or file, None for memory only.
+        """
+        self.path = path
+        self.rotation = 0
+        self.frame = array("H", [0] * FRAME_PIXELS)
+        self.frames_written = 0
+        self._lock = Lock()
+        self._file = None
+        if path is None:
+            self._buffer = bytearray(FRAME_BYTES)
+        else:
+            self._file = io.open(path, "r+b" if os.path.exists(path) else "w+b")
+            if stat.S_ISREG(os.fstat(self._file.fileno()).st_mode) and \
+                    os.fstat(self._file.fileno()).st_size < FRAME_BYTES:
+                self._file.truncate(FRAME_BYTES)
+            self._buffer = mmap.mmap(self._file.fileno(), FRAME_BYTES)
+
+    def close(self):
+        if self._file is not None:
+            self._buffer.close()
+            self._file.close()
+            self._file = None
+
+    def pack(self, pixel_list, rotation=None):
+        """
+        Pack 64 [R,G,B] pixels into a frame in framebuffer order.
+        :param pixel_list: Row-major pixels with elements from 0 to 255.
+        :param rotation: Rotation to draw with, defaults to the current one.
+        :return: Packed frame.
+        """
+        if len(pixel_list) != FRAME_PIXELS:
+            raise ValueError("Pixel lists must have 64 elements")
+        index_map = INDEX_MAPS[self.rotation if rotation is None else rotation]
+        frame = array("H", [0] * FRAME_PIXELS)
+        red, green, blue = _RED, _GREEN, _BLUE
+        for index, pix in zip(index_map, pixel_list):
+            frame[index] = red[pix[0]] | green[pix[1]] | blue[pix[2]]
+        return frame
+
+    def write(self, frame):
+        """
+        Write a packed frame to the framebuffer.
+        :param frame: Frame from pack, or 128 bytes (or a memoryview of them)
+        in framebuffer order.
+        """
+        data = frame_bytes(frame)
+        with self._lock:
+            self.frame = frame if isinstance(frame, array) else array("H", data)
+            self._buffer[0:FRAME_BYTES] = data
+            self.frames_written += 1
+
+    def set_pixels(self, pixel_list):
+        self.write(self.pack(pixel_list))
+
+    def set_pixel(self, x, y, red, green, blue):
+        self.update_pixels([(x, y, red, green, blue)])
+
+    def update_pixels(self, pixels):
+        """
+        Change several single pixels with one frame write.
+        :param pixels: List of (x, y, red, green, blue).
+        """
+        pix_map = PIX_MAPS[self.rotation]
+        frame = array("H", self.frame)
+        for x, y, red, green, blue in pixels:
+            if x > 7 or x < 0 or y > 7 or y < 0:
+                raise ValueError("Pixel position must be between 0 and 7")
+            frame[pix_map[y][x]] = pack_pixel(red, green, blue)
+        self.write(frame)
+
+    def update_region(self, x, y, width, height, values):
+        """
+        Replace a rectangle of the frame with one frame write.
+        :param values: Packed RGB565 pixels, row-major over the rectangle.
+        """
+        if x < 0 or y < 0 or x + width > 8 or y + height > 8:
+            raise ValueError("Region must be inside the 8x8 matrix")
+        if width == 8 and height == 8:
+            if self.rotation == 0:
+                self.write(array("H", values))
+                return
+            frame = array("H", [0] * FRAME_PIXELS)
+        else:
+            frame = array("H", self.frame)
+        pix_map = PIX_MAPS[self.rotation]
+        i = 0
+        for row in range(y, y + height):
+            map_row = pix_map[row]
+            for col in range(x, x + width):
+                frame[map_row[col]] = values[i]
+                i += 1
+        self.write(frame)
+
+    def clear(self, red=0, green=0, blue=0):
+        self.write(array("H", [pack_pixel(red, green, blue)]) * FRAME_PIXELS)
+
+    def get_pixels(self):
+        """
+        Returns the current frame as 64 row-major [R,G,B] pixels.
+        """
+        frame = self.frame
+        return [unpack_pixel(frame[index]) for index in INDEX_MAPS[self.rotation]]
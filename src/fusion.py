@@ -0,0 +1,360 @@
+import logging
+import math
+from threading import Event, Thread
+import time
+
+from metrics import TickTimer
+from timing import SKIP, Schedule, monotonic, sleep_until
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Order of the values of a raw IMU sample
+AXES = ("x", "y", "z")
+RAW = ("accel", "gyro", "mag")
+QUATERNION = ("w", "x", "y", "z")
+EULER = ("roll", "pitch", "yaw")
+
+DEFAULT_RATE = 100.0
+# Seconds of samples per block
+DEFAULT_BLOCK_DURATION = 0.1
+DEFAULT_TIME_CONSTANT = 0.5
+
+_TWO_PI = 2 * math.pi
+
+
+def measured_pose(ax, ay, az, mx, my, mz, cos=math.cos, sin=math.sin, atan2=math.atan2, hypot=math.hypot):
+    """
+    Roll and pitch from gravity and the tilt compensated magnetometer yaw,
+    in radians. Works on floats, and on arrays with the numpy functions.
+    """
+    roll = atan2(ay, az)
+    pitch = atan2(-ax, hypot(ay, az))
+    cr, sr = cos(roll), sin(roll)
+    cp, sp = cos(pitch), sin(pitch)
+    xh = mx * cp + my * sr * sp + mz * cr * sp
+    yh = my * cr - mz * sr
+    return roll, pitch, atan2(-yh, xh)
+
+
+def quaternion(roll, pitch, yaw):
+    """
+    Quaternion w, x, y, z of a ZYX Euler pose in radians, with w >= 0 so
+    it does not flip sign where the yaw wraps around.
+    """
+    cr, sr = math.cos(roll / 2), math.sin(roll / 2)
+    cp, sp = math.cos(pitch / 2), math.sin(pitch / 2)
+    cy, sy = math.cos(yaw / 2), math.sin(yaw / 2)
+    q = (cr * cp * cy + sr * sp * sy,
+         sr * cp * cy - cr * sp * sy,
+         cr * sp * cy + sr * cp * sy,
+         cr * cp * sy - sr * sp * cy)
+    return q if q[0] >= 0 else tuple(-v for v in q)
+
+
+def _wrap(angle):
+    return (angle + math.pi) % _TWO_PI - math.pi
+
+
+class FusedBlock(object):
+    """
+    A block of raw IMU samples with the filtered pose of every sample.
+    Rows are numpy arrays when numpy is installed and lists of tuples
+    otherwise.
+    """
+
+    def __init__(self, times, timestamps, raw, euler=None, quaternions=None):
+        """
+        :param times: Monotonic time of every sample.
+        :param timestamps: Wall clock time of every sample.
+        :param raw: Accel, gyro and mag x/y/z of every sample.
+        :param euler: Roll, pitch and yaw in radians of every sample, None
+        when the block was not filtered.
+        :param quaternions: Quaternion w, x, y, z of every sample.
+        """
+        self.times = times
+        self.timestamps = timestamps
+        self.raw = raw
+        self.euler = euler
+        self.quaternions = quaternions
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def latest(self):
+        """
+        Timestamp and the raw, quaternion and 0-360 degree Euler values of
+        the last sample, as floats.
+        """
+        euler = []
+        for angle in self.euler[-1]:
+            degrees = math.degrees(float(angle))
+            euler.append(degrees + 360 if degrees < 0 else degrees)
+        return (float(self.timestamps[-1]), [float(v) for v in self.raw[-1]],
+                [float(v) for v in self.quaternions[-1]], euler)
+
+
+class ComplementaryFilter(object):
+    """
+    Blends the integrated gyroscope rates with the pose measured from
+    gravity and the magnetometer:
+
+        pose[k] = alpha * (pose[k-1] + rate[k] * dt[k]) + (1 - alpha) * measured[k]
+
+    The recursion is linear, so a block of n samples is solved at once as
+    pose = W . u + A[k] * pose[-1], where W[k][j] is the product of the
+    alphas of the samples after j up to k and A[k] that of all of them up to
+    k. numpy evaluates it as one matrix product instead of n Python
+    iterations, with the alpha of every sample so uneven sample spacing
+    gives the same poses as the loop.
+    """
+
+    def __init__(self, time_constant=DEFAULT_TIME_CONSTANT):
+        """
+        :param time_constant: Seconds over which the gyroscope is trusted
+        before the measured pose takes over.
+        """
+        self.time_constant = time_constant
+        self.reset()
+
+    def reset(self):
+        self.pose = None
+        self.last_time = None
+
+    def alpha(self, dt):
+        return self.time_constant / (self.time_constant + dt) if dt > 0 else 1.0
+
+    def filter(self, timestamps, raw):
+        """
+        :param timestamps: Monotonic time of every sample.
+        :param raw: Accel, gyro and mag x/y/z of every sample.
+        :return: Roll, pitch and yaw in radians of every sample.
+        """
+        if numpy is not None:
+            return self._filter_numpy(numpy.asarray(timestamps, dtype=float), numpy.asarray(raw, dtype=float))
+        return self._filter_python(timestamps, raw)
+
+    def _filter_numpy(self, timestamps, raw):
+        n = len(timestamps)
+        measured = self._measured_numpy(raw)
+        if self.pose is None:
+            self.pose = measured[0].copy()
+            self.last_time = timestamps[0]
+        dt = numpy.empty(n)
+        dt[0] = timestamps[0] - self.last_time
+        numpy.subtract(timestamps[1:], timestamps[:-1], dt[1:])
+        alpha = numpy.ones(n)
+        moving = dt > 0
+        alpha[moving] = self.time_constant / (self.time_constant + dt[moving])
+        # Products of consecutive alphas as differences of their summed logs,
+        # which do not underflow over long blocks
+        logs = numpy.cumsum(numpy.log(alpha))
+        lags = numpy.subtract.outer(logs, logs)
+        weights = numpy.tril(numpy.exp(numpy.minimum(lags, 0.0)))
+        decay = numpy.exp(logs)[:, None]
+        # Unwrap the measurements around the current pose
+        measured -= self.pose
+        measured += math.pi
+        measured %= _TWO_PI
+        measured += self.pose - math.pi
+        u = raw[:, 3:6] * (alpha * dt)[:, None]
+        u += (1 - alpha)[:, None] * measured
+        pose = weights.dot(u)
+        pose += decay * self.pose
+        pose += math.pi
+        pose %= _TWO_PI
+        pose -= math.pi
+        self.pose = pose[-1]
+        self.last_time = timestamps[-1]
+        return pose
+
+    @staticmethod
+    def _measured_numpy(raw):
+        ax, ay, az = raw[:, 0], raw[:, 1], raw[:, 2]
+        mx, my, mz = raw[:, 6], raw[:, 7], raw[:, 8]
+        measured = numpy.empty((len(raw), 3))
+        roll, pitch = measured[:, 0], measured[:, 1]
+        numpy.arctan2(ay, az, roll)
+        numpy.arctan2(-ax, numpy.hypot(ay, az), pitch)
+        tilt = measured[:, :2]
+        (cr, cp), (sr, sp) = numpy.cos(tilt).T, numpy.sin(tilt).T
+        yh = my * cr - mz * sr
+        xh = mx * cp + (my * sr + mz * cr) * sp
+        numpy.arctan2(-yh, xh, measured[:, 2])
+        return measured
+
+    def _filter_python(self, timestamps, raw):
+        poses = []
+        for timestamp, sample in zip(timestamps, raw):
+            ax, ay, az, gx, gy, gz, mx, my, mz = sample
+            measured = measured_pose(ax, ay, az, mx, my, mz)
+            if self.pose is None:
+                self.pose = measured
+                self.last_time = timestamp
+            dt = timestamp - self.last_time
+            alpha = self.alpha(dt)
+            pose = []
+            for angle, rate, target in zip(self.pose, (gx, gy, gz), measured):
+                target = angle + _wrap(target - angle)
+                pose.append(_wrap(alpha * (angle + rate * dt) + (1 - alpha) * target))
+            self.pose = tuple(pose)
+            self.last_time = timestamp
+            poses.append(self.pose)
+        return poses
+
+    def quaternions(self, euler):
+        if numpy is not None:
+            half = euler * 0.5
+            (cr, cp, cy), (sr, sp, sy) = numpy.cos(half).T, numpy.sin(half).T
+            ccc, sss = cr * cp, sr * sp
+            csc, scc = cr * sp, sr * cp
+            quaternions = numpy.empty((len(euler), 4))
+            quaternions[:, 0] = ccc * cy + sss * sy
+            quaternions[:, 1] = scc * cy - csc * sy
+            quaternions[:, 2] = csc * cy + scc * sy
+            quaternions[:, 3] = ccc * sy - sss * cy
+            quaternions *= numpy.where(quaternions[:, :1] < 0, -1.0, 1.0)
+            return quaternions
+        return [quaternion(*pose) for pose in euler]
+
+
+class ImuCapture(object):
+    """
+    Reads the IMU at a fixed rate on its own thread into blocks of raw
+    samples, numpy arrays when numpy is installed. Every full block is run
+    through the ComplementaryFilter at once, unless fusion is off, and
+    handed to the callback, so the per-sample work is a single backend read.
+    While it captures it is the only reader of the IMU: the last reading is
+    kept in latest, which the SensorSampler serves the orientation sensors
+    from instead of reading the IMU itself.
+    """
+
+    def __init__(self, backend, callback, rate=DEFAULT_RATE, block_duration=DEFAULT_BLOCK_DURATION,
+                 time_constant=DEFAULT_TIME_CONSTANT, policy=SKIP):
+        """
+        :param backend: Backend to read from.
+        :param callback: Called on the capture thread with every FusedBlock.
+        :param rate: Samples per second.
+        :param block_duration: Seconds of samples per block.
+        :param time_constant: Time constant of the filter in seconds.
+        :param policy: Overrun policy of the reads, one of OVERRUN_POLICIES.
+        """
+        self.backend = backend
+        self.callback = callback
+        self.rate = rate
+        self.block_duration = block_duration
+        self.filter = ComplementaryFilter(time_constant)
+        self.fuse = True
+        self.enabled = False
+        self.capturing = False
+        # Wall clock time and ImuReading of the last read while capturing
+        self.latest = None
+        self.samples = 0
+        # Reads that found no new sample, more than a few mean the rate is too high
+        self.stale = 0
+        self.ticks = TickTimer()
+        self.policy = policy
+        self.logger = logging.getLogger("DSLink")
+        self._stopped = Event()
+        self._wake = Event()
+        self._thread = Thread(target=self.run, name="ImuCapture")
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def join(self, timeout=None):
+        """
+        Wait for the thread to end after stop().
+        """
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def configure(self, rate=None, time_constant=None, enabled=None, fuse=None):
+        """
+        :param rate: Samples per second.
+        :param time_constant: Time constant of the filter in seconds.
+        :param enabled: True to capture.
+        :param fuse: True to filter the orientation of every block.
+        """
+        if rate is not None:
+            self.rate = rate
+        if fuse is not None:
+            self.fuse = fuse
+        if time_constant is not None:
+            self.filter.time_constant = time_constant
+        if enabled is not None and enabled != self.enabled:
+            self.enabled = enabled
+            self._wake.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            self._wake.clear()
+            if not self.enabled:
+                self._wake.wait()
+                continue
+            # Gaps between captures would be integrated as one long sample
+            self.filter.reset()
+            self.capturing = True
+            try:
+                self.capture()
+            finally:
+                self.capturing = False
+                self.latest = None
+
+    def capture(self):
+        rate = self.rate
+        size = max(1, int(round(rate * self.block_duration)))
+        if numpy is not None:
+            times = numpy.empty(size)
+            walls = numpy.empty(size)
+            raw = numpy.empty((size, len(RAW) * len(AXES)))
+        else:
+            times, walls, raw = [0.0] * size, [0.0] * size, [None] * size
+        count = 0
+        schedule = Schedule(1.0 / rate, self.policy, self.ticks)
+        schedule.start()
+        # Restarted with new blocks when the rate changes
+        while self.enabled and self.rate == rate and not self._stopped.is_set():
+            now = monotonic()
+            wall = time.time()
+            schedule.begin(now)
+            try:
+                reading = self.backend.read_imu()
+                if reading is None:
+                    self.stale += 1
+            except Exception:
+                self.logger.exception("Failed to read the IMU")
+                reading = None
+            # A read without a new sample is skipped, not captured twice
+            if reading is not None:
+                self.latest = (wall, reading)
+                times[count] = now
+                walls[count] = wall
+                raw[count] = reading.raw
+                count += 1
+                self.samples += 1
+                if count == size:
+                    if numpy is not None:
+                        block = FusedBlock(times.copy(), walls.copy(), raw.copy())
+                    else:
+                        block = FusedBlock(list(times), list(walls), list(raw))
+                    count = 0
+                    try:
+                        if self.fuse:
+                            block.euler = self.filter.filter(block.times, block.raw)
+                            block.quaternions = self.filter.quaternions(block.euler)
+                        else:
+                            # Skipped blocks would be integrated as one long sample
+                            self.filter.reset()
+                        self.callback(block)
+                    except Exception:
+                        # Drop the block and keep capturing
+                        self.logger.exception("Failed to handle an IMU block")
+            sleep_until(schedule.advance())
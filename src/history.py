@@ -0,0 +1,234 @@
+from array import array
+from collections import deque
+import math
+
+DEFAULT_WINDOW = 60.0
+
+STATS = (
+    ("min", "Min"),
+    ("max", "Max"),
+    ("mean", "Mean"),
+    ("stddev", "Standard Deviation")
+)
+
+
+class RingBuffer(object):
+    """
+    Fixed-size sample history in two typed arrays. Samples are addressed by
+    sequence number, the number of samples appended before them, and only
+    the last capacity samples are retained.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array("d", [0.0]) * capacity
+        self.values = array("d", [0.0]) * capacity
+        self.total = 0
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    @property
+    def first(self):
+        """
+        Sequence number of the oldest retained sample.
+        """
+        return max(0, self.total - self.capacity)
+
+    def append(self, timestamp, value):
+        """
+        :return: Sequence number of the sample.
+        """
+        i = self.total % self.capacity
+        self.timestamps[i] = timestamp
+        self.values[i] = value
+        self.total += 1
+        return self.total - 1
+
+    def timestamp(self, seq):
+        return self.timestamps[seq % self.capacity]
+
+    def value(self, seq):
+        return self.values[seq % self.capacity]
+
+    def find(self, timestamp):
+        """
+        Sequence number of the first retained sample at or after timestamp.
+        """
+        low, high = self.first, self.total
+        while low < high:
+            mid = (low + high) // 2
+            if self.timestamps[mid % self.capacity] < timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+
+class RollingStats(object):
+    """
+    Min, max, mean and standard deviation of the samples of a RingBuffer in
+    the last window seconds, updated incrementally as samples come and go.
+    """
+
+    def __init__(self, buffer, window):
+        self.buffer = buffer
+        self.reset(window)
+
+    def reset(self, window):
+        """
+        Change the window and rebuild from the retained samples.
+        """
+        self.window = window
+        self.tail = self.buffer.total
+        self.count = 0
+        self.shift = 0.0
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self._min = deque()
+        self._max = deque()
+        if self.buffer.total:
+            latest = self.buffer.timestamp(self.buffer.total - 1)
+            self.tail = self.buffer.find(latest - window)
+            for seq in range(self.tail, self.buffer.total):
+                self._add(seq)
+
+    def _add(self, seq):
+        value = self.buffer.value(seq)
+        if self.count == 0:
+            # Sums are kept relative to a recent sample for precision
+            self.shift = value
+            self.sum = self.sumsq = 0.0
+        d = value - self.shift
+        self.sum += d
+        self.sumsq += d * d
+        self.count += 1
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((seq, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((seq, value))
+
+    def _remove_tail(self):
+        d = self.buffer.value(self.tail) - self.shift
+        self.sum -= d
+        self.sumsq -= d * d
+        self.count -= 1
+        self.tail += 1
+        while self._min and self._min[0][0] < self.tail:
+            self._min.popleft()
+        while self._max and self._max[0][0] < self.tail:
+            self._max.popleft()
+
+    def before_overwrite(self):
+        """
+        Called before the oldest sample of a full buffer is overwritten.
+        """
+        if self.count and self.tail == self.buffer.first:
+            self._remove_tail()
+
+    def add(self, seq):
+        """
+        Called after a sample was appended to the buffer.
+        """
+        self._add(seq)
+        cutoff = self.buffer.timestamp(seq) - self.window
+        while self.count > 1 and self.buffer.timestamp(self.tail) < cutoff:
+            self._remove_tail()
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else None
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else None
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self.shift + self.sum / self.count
+
+    @property
+    def stddev(self):
+        if not self.count:
+            return None
+        mean = self.sum / self.count
+        return math.sqrt(max(0.0, self.sumsq / self.count - mean * mean))
+
+
+class History(object):
+    """
+    RingBuffer and RollingStats of every recorded series.
+    """
+
+    def __init__(self, capacity=4096, window=DEFAULT_WINDOW):
+        self.capacity = capacity
+        self.window = window
+        self.series = {}
+
+    def record(self, name, timestamp, value):
+        series = self.series.get(name)
+        if series is None:
+            buf = RingBuffer(self.capacity)
+            series = (buf, RollingStats(buf, self.window))
+            self.series[name] = series
+        buf, stats = series
+        if buf.total >= buf.capacity:
+            stats.before_overwrite()
+        stats.add(buf.append(timestamp, value))
+
+    def stats(self, name):
+        series = self.series.get(name)
+        return series[1] if series is not None else None
+
+    def set_window(self, name, window):
+        series = self.series.get(name)
+        if series is not None and series[1].window != window:
+            series[1].reset(window)
+
+    def query(self, name, start=None, end=None, interval=0, offset=0, limit=None):
+        """
+        Samples of a series in a time range.
+        :param start: First timestamp, defaults to the oldest sample.
+        :param end: Last timestamp, defaults to the newest sample.
+        :param interval: Average samples into buckets of this many seconds,
+        0 returns every sample.
+        :param offset: Rows to skip, for paging.
+        :param limit: Maximum number of rows.
+        :return: List of [timestamp, value] rows.
+        """
+        series = self.series.get(name)
+        if series is None:
+            return []
+        buf = series[0]
+        first = buf.first if start is None else buf.find(start)
+        last = buf.total if end is None else buf.find(end)
+        if end is not None:
+            while last < buf.total and buf.timestamp(last) <= end:
+                last += 1
+        rows = []
+        if interval > 0:
+            bucket = None
+            total = count = 0
+            for seq in range(first, last):
+                key = math.floor(buf.timestamp(seq) / interval) * interval
+                if key != bucket:
+                    if count:
+                        rows.append([bucket, total / count])
+                    bucket, total, count = key, 0.0, 0
+                total += buf.value(seq)
+                count += 1
+            if count:
+                rows.append([bucket, total / count])
+            rows = rows[offset:]
+        else:
+            for seq in range(first + offset, last):
+                rows.append([buf.timestamp(seq), buf.value(seq)])
+                if limit is not None and len(rows) >= limit:
+                    break
+        if limit is not None:
+            rows = rows[:limit]
+        return rows
@@ -0,0 +1,74 @@
+from twisted.internet.interfaces import IReadDescriptor
+from zope.interface import implementer
+
+from stick import SenseStick
+
+KEY_NODES = {
+    SenseStick.KEY_UP: "up",
+    SenseStick.KEY_DOWN: "down",
+    SenseStick.KEY_LEFT: "left",
+    SenseStick.KEY_RIGHT: "right",
+    SenseStick.KEY_ENTER: "button"
+}
+
+# Only publish changes between UP and DOWN, key repeats of a held key are dropped
+HOLD_COALESCE = "coalesce"
+# Publish DOWN again for key repeats, at most once per key per read
+HOLD_REPEAT = "repeat"
+
+HOLD_POLICIES = [HOLD_COALESCE, HOLD_REPEAT]
+
+
+@implementer(IReadDescriptor)
+class StickReader(object):
+    """
+    Reads the joystick from the reactor. Every wakeup drains all pending
+    events and publishes them to the stick nodes on the reactor thread.
+    """
+
+    def __init__(self, stick, nodes, hold_policy=HOLD_COALESCE, recorder=None, callback=None):
+        """
+        :param stick: SenseStick, switched to non-blocking mode.
+        :param nodes: Dict of key code to stick Node.
+        :param hold_policy: One of HOLD_POLICIES.
+        :param recorder: Recorder to log every event to, or None.
+        :param callback: Called with the key code and "DOWN" or "UP" of
+        every press and release, whether the node is subscribed or not.
+        """
+        self.stick = stick
+        self.nodes = nodes
+        self.hold_policy = hold_policy
+        self.recorder = recorder
+        self.callback = callback
+        self.events = 0
+        stick.set_nonblocking()
+
+    def fileno(self):
+        return self.stick.fileno()
+
+    def logPrefix(self):
+        return "SenseStick"
+
+    def connectionLost(self, reason):
+        pass
+
+    def doRead(self):
+        events = self.stick.read_events()
+        self.events += len(events)
+        repeated = set()
+        for event in events:
+            if self.recorder is not None:
+                self.recorder.record_stick(event.timestamp, event.key, event.state)
+            node = self.nodes.get(event.key)
+            if node is None:
+                continue
+            state = "UP" if event.state == SenseStick.STATE_RELEASE else "DOWN"
+            if self.callback is not None and event.state != SenseStick.STATE_HOLD:
+                self.callback(event.key, state)
+            if not node.is_subscribed():
+                continue
+            if node.get_value() != state:
+                node.set_value(state, check=False)
+            elif state == "DOWN" and self.hold_policy == HOLD_REPEAT and event.key not in repeated:
+                repeated.add(event.key)
+                node.set_value(state, check=False)
@@ -0,0 +1,136 @@
+from bisect import bisect_left
+import os
+import threading
+
+from timing import monotonic
+
+# Upper bounds in seconds of the latency and jitter histogram buckets, the
+# last bucket counts everything above the last bound
+LATENCY_BOUNDS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class Histogram(object):
+    """
+    Fixed-bucket histogram. Observing a value only increments preallocated
+    counters, so it is cheap enough for every sensor read.
+    """
+    __slots__ = ("bounds", "counts", "count", "max")
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """
+        Upper bound of the bucket the p-th percentile falls in, the maximum
+        when that is the last bucket.
+        :param p: Percentile, 0-100.
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100.0
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+
+class TickTimer(object):
+    """
+    Jitter and overruns of a periodic task: how late each run started, how
+    often a run started a whole interval or more after it was due and how
+    many runs a skip overrun policy left out.
+    """
+
+    def __init__(self):
+        self.jitter = Histogram()
+        self.overruns = 0
+        self.skipped = 0
+
+    def tick(self, due, now, interval):
+        """
+        :param due: Time the run was due.
+        :param now: Time the run started.
+        :param interval: Interval of the task.
+        """
+        late = max(0.0, now - due)
+        self.jitter.observe(late)
+        if late >= interval:
+            self.overruns += 1
+
+
+class Rate(object):
+    """
+    Per second rate of a counter, measured between two reads.
+    """
+
+    def __init__(self, counter):
+        """
+        :param counter: Function returning the current count.
+        """
+        self.counter = counter
+        self.last_count = counter()
+        self.last_time = monotonic()
+
+    def __call__(self):
+        count = self.counter()
+        now = monotonic()
+        elapsed = now - self.last_time
+        rate = (count - self.last_count) / elapsed if elapsed > 0 else 0.0
+        self.last_count = count
+        self.last_time = now
+        return rate
+
+
+def rss():
+    """
+    Resident set size of the process in bytes, 0 where /proc is missing.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (IOError, OSError):
+        return 0
+
+
+def thread_count():
+    return threading.active_count()
+
+
+class Gauges(object):
+    """
+    Metric nodes with the functions that compute their values. Values are
+    only computed for the nodes that are subscribed to.
+    """
+
+    def __init__(self, interval=1.0):
+        """
+        :param interval: Seconds between refreshes.
+        """
+        self.interval = interval
+        self.gauges = []
+        self._refreshed = 0.0
+
+    def add(self, node, read):
+        self.gauges.append((node, read))
+
+    def refresh(self):
+        now = monotonic()
+        if now - self._refreshed < self.interval:
+            return
+        self._refreshed = now
+        for node, read in self.gauges:
+            if node.is_subscribed():
+                node.set_value(read())
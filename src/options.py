@@ -0,0 +1,112 @@
+import argparse
+import os
+import re
+import sys
+
+from backend import BACKENDS, create_backend
+from device import Device
+from joystick import HOLD_COALESCE, HOLD_POLICIES
+from recording import Recorder
+from timing import OVERRUN_POLICIES, SKIP
+
+
+def parse_options(argv=None):
+    """
+    Parse the link specific command line options. Options that are not
+    recognised are left in sys.argv for dslink.Configuration.
+    :param argv: Arguments to parse, defaults to sys.argv.
+    :return: Parsed options.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--backend", default="sensehat", choices=sorted(BACKENDS))
+    parser.add_argument("--device", action="append", default=[])
+    parser.add_argument("--sim-latency", type=float, default=0.0)
+    parser.add_argument("--sim-stick-interval", type=float, default=0.5)
+    parser.add_argument("--sim-framebuffer")
+    parser.add_argument("--sim-init-latency", type=float, default=0.0)
+    parser.add_argument("--stick-hold", default=HOLD_COALESCE, choices=HOLD_POLICIES)
+    parser.add_argument("--history-size", type=int, default=4096)
+    parser.add_argument("--overrun-policy", default=SKIP, choices=OVERRUN_POLICIES)
+    parser.add_argument("--profile-dir", default="profiles")
+    parser.add_argument("--flush-window", type=float, default=0.0)
+    parser.add_argument("--max-update-rate", type=float, default=0.0)
+    parser.add_argument("--record")
+    parser.add_argument("--record-segment-size", type=int, default=4 * 1024 * 1024)
+    parser.add_argument("--record-segments", type=int, default=8)
+    parser.add_argument("--replay-log")
+    parser.add_argument("--replay-speed", type=float, default=1.0)
+    parser.add_argument("--replay-loop", action="store_true")
+    if argv is None:
+        options, sys.argv[1:] = parser.parse_known_args(sys.argv[1:])
+    else:
+        options, _ = parser.parse_known_args(argv)
+    return options
+
+
+def backend_options(options):
+    """
+    Keyword arguments for create_backend.
+    :param options: Parsed options.
+    :return: Dict of backend arguments.
+    """
+    if options.backend == "simulated":
+        return {
+            "latency": options.sim_latency,
+            "stick_interval": options.sim_stick_interval,
+            "framebuffer_path": options.sim_framebuffer,
+            "init_latency": options.sim_init_latency
+        }
+    if options.backend == "replay":
+        return {
+            "path": options.replay_log,
+            "speed": options.replay_speed,
+            "loop": options.replay_loop,
+            "framebuffer_path": options.sim_framebuffer
+        }
+    return {}
+
+
+def create_recorder(options, name=None):
+    """
+    Create the Recorder selected by the options.
+    :param options: Parsed options.
+    :param name: Device name, named devices record to a subdirectory.
+    :return: Recorder, or None when not recording.
+    """
+    if not options.record:
+        return None
+    directory = options.record if name is None else os.path.join(options.record, name)
+    return Recorder(directory, options.record_segment_size, options.record_segments)
+
+
+def create_devices(options):
+    """
+    Create the Devices selected by the options. Without --device options a
+    single device of --backend is hosted at the root. Every --device
+    NAME[:BACKEND[:LOG]] adds a device below a node of that name, with its
+    own backend and replay log.
+    :param options: Parsed options.
+    :return: List of Devices.
+    """
+    if not options.device:
+        return [Device(create_backend(options.backend, **backend_options(options)), None,
+                       options.stick_hold, options.history_size, create_recorder(options),
+                       options.overrun_policy)]
+    devices = []
+    for spec in options.device:
+        parts = spec.split(":", 2)
+        name = parts[0]
+        # Names taken by the link are checked by SenseHATLink
+        if not re.match(r"^[A-Za-z0-9_-]+$", name):
+            raise ValueError("Invalid device name %s" % name)
+        device_options = argparse.Namespace(**vars(options))
+        if len(parts) > 1:
+            device_options.backend = parts[1]
+        if len(parts) > 2:
+            device_options.replay_log = parts[2]
+        if options.sim_framebuffer:
+            device_options.sim_framebuffer = "%s.%s" % (options.sim_framebuffer, name)
+        backend = create_backend(device_options.backend, **backend_options(device_options))
+        devices.append(Device(backend, name, options.stick_hold, options.history_size,
+                              create_recorder(options, name), options.overrun_policy))
+    return devices
@@ -0,0 +1,131 @@
+from array import array
+import base64
+import binascii
+import json
+import sys
+
+from framebuffer import _BLUE, _GREEN, _RED
+
+JSON = "JSON"
+HEX = "Hex"
+BASE64_RGB888 = "Base64 RGB888"
+BASE64_RGB565 = "Base64 RGB565"
+
+FORMATS = [JSON, HEX, BASE64_RGB888, BASE64_RGB565]
+
+_NUMERALS = '0123456789abcdefABCDEF'
+_HEXDEC = {v: int(v, 16) for v in (x+y for x in _NUMERALS for y in _NUMERALS)}
+
+
+class PixelFormatError(ValueError):
+    pass
+
+
+def rgb(triplet):
+    return _HEXDEC[triplet[0:2]], _HEXDEC[triplet[2:4]], _HEXDEC[triplet[4:6]]
+
+
+def pack_rgb888(data):
+    """
+    Pack RGB888 bytes into RGB565 values.
+    :param data: bytearray of red, green, blue triplets.
+    :return: array of packed pixels.
+    """
+    return array("H", [
+        _RED[r] | _GREEN[g] | _BLUE[b]
+        for r, g, b in zip(data[0::3], data[1::3], data[2::3])
+    ])
+
+
+def decode_pixels(pixels, pixel_format=JSON, width=8, height=8):
+    """
+    Decode the Pixels parameter of Set Pixels.
+    :param pixels: Encoded pixels, row-major over the region.
+    :param pixel_format: One of FORMATS.
+    :param width: Region width.
+    :param height: Region height.
+    :return: array of packed RGB565 pixels, row-major over the region.
+    """
+    count = width * height
+    if pixel_format == JSON:
+        return _decode_json(pixels, count)
+    try:
+        if pixel_format == HEX:
+            data = bytearray(binascii.unhexlify(pixels.strip()))
+        elif pixel_format in (BASE64_RGB888, BASE64_RGB565):
+            data = bytearray(base64.b64decode(pixels.strip()))
+        else:
+            raise PixelFormatError("Unknown pixel format %s, expected one of %s" % (pixel_format, ", ".join(FORMATS)))
+    except (TypeError, binascii.Error):
+        raise PixelFormatError("Pixels are not valid %s" % pixel_format)
+
+    if pixel_format == BASE64_RGB565:
+        if len(data) != count * 2:
+            raise PixelFormatError("Expected %d bytes of RGB565 pixels, got %d" % (count * 2, len(data)))
+        # Little-endian on the wire, like the Pi framebuffer
+        packed = array("H", bytes(data))
+        if sys.byteorder == "big":
+            packed.byteswap()
+        return packed
+    if len(data) != count * 3:
+        raise PixelFormatError("Expected %d bytes of RGB888 pixels, got %d" % (count * 3, len(data)))
+    return pack_rgb888(data)
+
+
+def decode_frames(frames, pixel_format=JSON):
+    """
+    Decode a sequence of full frames.
+    :param frames: JSON array of frames, each an array of 64 pixels, or the
+    frames concatenated in one of the other formats.
+    :param pixel_format: One of FORMATS.
+    :return: Number of frames and an array of their packed RGB565 pixels.
+    """
+    if pixel_format == JSON:
+        try:
+            frames = json.loads(frames)
+        except ValueError:
+            raise PixelFormatError("Frames are not valid JSON")
+        if not isinstance(frames, list) or not frames:
+            raise PixelFormatError("Expected an array of frames")
+        packed = array("H")
+        for frame in frames:
+            packed.extend(pack_pixel_list(frame, 64))
+        return len(frames), packed
+    bytes_per_pixel = 2 if pixel_format == BASE64_RGB565 else 3
+    characters_per_byte = 2 if pixel_format == HEX else 1
+    if pixel_format in (BASE64_RGB888, BASE64_RGB565):
+        size = len(frames.strip()) * 3 // 4 - frames.strip()[-2:].count("=")
+    else:
+        size = len(frames.strip()) // characters_per_byte
+    count = size // (64 * bytes_per_pixel)
+    if count < 1:
+        raise PixelFormatError("Expected at least one frame")
+    return count, decode_pixels(frames, pixel_format, 8, 8 * count)
+
+
+def pack_pixel_list(pixels, count):
+    """
+    Pack pixels that are already parsed from JSON.
+    :param pixels: List of [red, green, blue] lists.
+    :param count: Number of pixels expected.
+    :return: array of packed RGB565 pixels.
+    """
+    if not isinstance(pixels, list) or len(pixels) != count:
+        raise PixelFormatError("Expected an array of %d pixels" % count)
+    data = bytearray()
+    for pixel in pixels:
+        if not isinstance(pixel, list) or len(pixel) != 3:
+            raise PixelFormatError("Pixel arrays must contain three values: red, green, and blue")
+        try:
+            data.extend(pixel)
+        except (TypeError, ValueError):
+            raise PixelFormatError("Pixel colors must be 0-255")
+    return pack_rgb888(data)
+
+
+def _decode_json(pixels, count):
+    try:
+        pixels = json.loads(pixels)
+    except ValueError:
+        raise PixelFormatError("Pixels are not valid JSON")
+    return pack_pixel_list(pixels, count)
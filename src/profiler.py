@@ -0,0 +1,141 @@
+import cProfile
+from collections import defaultdict
+import os
+import pstats
+import sys
+from threading import Event, Thread, current_thread, enumerate as threads
+
+CPROFILE = "cProfile"
+SAMPLING = "Sampling"
+
+MODES = [CPROFILE, SAMPLING]
+
+# Longest a profiler runs for
+MAX_DURATION = 300.0
+
+
+def function_name(filename, line, name):
+    return "%s (%s:%d)" % (name, os.path.basename(filename), line)
+
+
+class CProfiler(object):
+    """
+    cProfile of the thread it is started on, the reactor thread for the
+    profiler actions.
+    """
+    extension = "prof"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.running = False
+
+    def start(self):
+        self.profile.enable()
+        self.running = True
+
+    def stop(self):
+        if self.running:
+            self.profile.disable()
+            self.running = False
+
+    def top(self, count):
+        """
+        :param count: Number of functions.
+        :return: Rows of function, calls, own seconds and total seconds of
+        the functions with the most own time.
+        """
+        stats = pstats.Stats(self.profile).stats
+        rows = []
+        for (filename, line, name), (_, calls, own, total, _) in stats.items():
+            rows.append([function_name(filename, line, name), calls, own, total])
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows[:count]
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+class SamplingProfiler(object):
+    """
+    Samples the stacks of every other thread at a fixed interval with
+    sys._current_frames, so the profiled code runs at full speed.
+    """
+    extension = "folded"
+
+    def __init__(self, interval=0.005):
+        """
+        :param interval: Seconds between samples.
+        """
+        self.interval = interval
+        self.samples = 0
+        self.own = defaultdict(int)
+        self.total = defaultdict(int)
+        self.stacks = defaultdict(int)
+        self.running = False
+        self._stopped = Event()
+        self._thread = Thread(target=self.run, name="SamplingProfiler")
+        self._thread.daemon = True
+
+    def start(self):
+        self.running = True
+        self._thread.start()
+
+    def stop(self):
+        if self.running:
+            self._stopped.set()
+            self._thread.join()
+            self.running = False
+
+    def run(self):
+        own_ident = current_thread().ident
+        while not self._stopped.wait(self.interval):
+            names = dict((thread.ident, thread.name) for thread in threads())
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(function_name(code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                self.own[stack[0]] += 1
+                for function in set(stack):
+                    self.total[function] += 1
+                stack.append(names.get(ident, str(ident)))
+                stack.reverse()
+                self.stacks[";".join(stack)] += 1
+            self.samples += 1
+
+    def top(self, count):
+        """
+        :param count: Number of functions.
+        :return: Rows of function, samples on top of the stack, and the
+        estimated own and total seconds of the functions sampled most on top
+        of the stack.
+        """
+        rows = []
+        for function in self.own:
+            rows.append([function, self.own[function], self.own[function] * self.interval,
+                         self.total[function] * self.interval])
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return rows[:count]
+
+    def dump(self, path):
+        """
+        Write the stacks in the folded format of flame graph tools.
+        """
+        with open(path, "w") as f:
+            for stack in sorted(self.stacks):
+                f.write("%s %d\n" % (stack, self.stacks[stack]))
+
+
+def create_profiler(mode, interval=0.005):
+    """
+    :param mode: One of MODES.
+    :param interval: Seconds between samples of the sampling profiler.
+    """
+    if mode == CPROFILE:
+        return CProfiler()
+    if mode == SAMPLING:
+        return SamplingProfiler(interval)
+    raise ValueError("Unknown profiler %s, expected one of %s" % (mode, ", ".join(MODES)))
@@ -0,0 +1,89 @@
+from timing import monotonic
+
+DEADBAND_SETTINGS = (
+    ("deadband", "Deadband", 0.0),
+    ("deadband_percent", "Deadband Percent", 0.0),
+    ("min_publish_interval", "Min Publish Interval", 0.0),
+    ("max_publish_interval", "Max Publish Interval", 0.0)
+)
+
+
+class Deadband(object):
+    """
+    Decides whether a new reading of a node is worth publishing. A reading
+    is published when it differs from the last published value by more
+    than both the absolute and the percentage deadband, but never sooner
+    than min_interval after the last one. After max_interval the value is
+    published again even if it did not change, as a heartbeat.
+    """
+    __slots__ = ("absolute", "percent", "min_interval", "max_interval", "last_value", "last_time")
+
+    def __init__(self, absolute=0.0, percent=0.0, min_interval=0.0, max_interval=0.0):
+        self.absolute = absolute
+        self.percent = percent
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.last_value = None
+        self.last_time = None
+
+    def configure(self, absolute, percent, min_interval, max_interval):
+        self.absolute = absolute
+        self.percent = percent
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+    def should_publish(self, value, now):
+        if self.last_time is None:
+            return True
+        elapsed = now - self.last_time
+        if elapsed < self.min_interval:
+            return False
+        if 0 < self.max_interval <= elapsed:
+            return True
+        delta = abs(value - self.last_value)
+        if delta == 0 or delta <= self.absolute:
+            return False
+        if delta <= abs(self.last_value) * self.percent / 100.0:
+            return False
+        return True
+
+    def published(self, value, now):
+        self.last_value = value
+        self.last_time = now
+
+
+class Publisher(object):
+    """
+    Sets node values through their Deadband and counts what was published
+    and what was suppressed.
+    """
+
+    def __init__(self):
+        self.deadbands = {}
+        self.published = 0
+        self.suppressed = 0
+
+    def deadband(self, node):
+        deadband = self.deadbands.get(node.path)
+        if deadband is None:
+            deadband = Deadband()
+            self.deadbands[node.path] = deadband
+        return deadband
+
+    def publish(self, node, value, now=None):
+        """
+        Set the value of a subscribed node if its deadband allows it.
+        :return: True if the value was published.
+        """
+        if not node.is_subscribed():
+            return False
+        if now is None:
+            now = monotonic()
+        deadband = self.deadband(node)
+        if not deadband.should_publish(value, now):
+            self.suppressed += 1
+            return False
+        node.set_value(value)
+        deadband.published(value, now)
+        self.published += 1
+        return True
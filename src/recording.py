@@ -0,0 +1,179 @@
+from array import array
+from bisect import bisect_right
+import glob
+import mmap
+import os
+import struct
+
+# Every sample is one fixed size record: timestamp, channel, joystick state,
+# joystick key and value
+RECORD = struct.Struct("<dBBHd")
+HEADER = b"SHLOG1\0\0"
+
+CHANNELS = (
+    "/temperature",
+    "/humidity",
+    "/pressure",
+    "/gyroscope/pitch",
+    "/gyroscope/roll",
+    "/gyroscope/yaw",
+    "/accelerometer/pitch",
+    "/accelerometer/roll",
+    "/accelerometer/yaw",
+    "/compass",
+    "/stick"
+)
+CHANNEL_IDS = dict((name, i) for i, name in enumerate(CHANNELS))
+STICK = CHANNEL_IDS["/stick"]
+
+
+def segment_paths(path):
+    """
+    The segments of a log in recording order.
+    :param path: Log directory, or a single segment file.
+    """
+    if os.path.isfile(path):
+        return [path]
+    paths = glob.glob(os.path.join(path, "samples-*.log"))
+    return sorted(paths, key=lambda p: int(os.path.basename(p)[8:-4]))
+
+
+def read_log(path):
+    """
+    Read every record of a log.
+    :param path: Log directory, or a single segment file.
+    :return: Generator of (timestamp, channel, state, key, value) tuples.
+    """
+    for segment in segment_paths(path):
+        with open(segment, "rb") as f:
+            data = f.read()
+        if data[:len(HEADER)] != HEADER:
+            raise ValueError("%s is not a sample log" % segment)
+        for offset in range(len(HEADER), len(data) - RECORD.size + 1, RECORD.size):
+            record = RECORD.unpack_from(data, offset)
+            if record[0] == 0:
+                # Unused space of a segment that was not closed
+                break
+            yield record
+
+
+class Recorder(object):
+    """
+    Appends samples and joystick events to a log of memory mapped segment
+    files. Each segment is allocated at its full size up front and records
+    are packed straight into the map, so recording does not allocate and
+    leaves writing back to the page cache. When a segment is full the next
+    one is started, and the oldest segments are deleted to bound the size
+    of the log.
+    """
+
+    def __init__(self, directory, segment_size=4 * 1024 * 1024, max_segments=8):
+        """
+        :param directory: Directory of the segment files.
+        :param segment_size: Size of a segment in bytes.
+        :param max_segments: Number of segments to keep.
+        """
+        if segment_size < len(HEADER) + RECORD.size:
+            raise ValueError("Segments must hold at least one record")
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.records = 0
+        self._file = None
+        self._map = None
+        self._offset = 0
+        existing = segment_paths(directory)
+        self._segment = int(os.path.basename(existing[-1])[8:-4]) if existing else 0
+        self._open_segment()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, "samples-%d.log" % segment)
+
+    def _open_segment(self):
+        self._segment += 1
+        self._file = open(self._path(self._segment), "w+b")
+        self._file.truncate(self.segment_size)
+        self._map = mmap.mmap(self._file.fileno(), self.segment_size)
+        self._map[0:len(HEADER)] = HEADER
+        self._offset = len(HEADER)
+        stale = self._segment - self.max_segments
+        for path in segment_paths(self.directory):
+            if int(os.path.basename(path)[8:-4]) <= stale:
+                os.remove(path)
+
+    def _close_segment(self):
+        self._map.close()
+        # Drop the unused space of the segment
+        self._file.truncate(self._offset)
+        self._file.close()
+
+    def _append(self, timestamp, channel, state, key, value):
+        if self._offset + RECORD.size > self.segment_size:
+            self._close_segment()
+            self._open_segment()
+        RECORD.pack_into(self._map, self._offset, timestamp, channel, state, key, value)
+        self._offset += RECORD.size
+        self.records += 1
+
+    def record_value(self, path, timestamp, value):
+        """
+        :param path: Path of the value node, one of CHANNELS.
+        """
+        self._append(timestamp, CHANNEL_IDS[path], 0, 0, value)
+
+    def record_stick(self, timestamp, key, state):
+        self._append(timestamp, STICK, state, key, 0.0)
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        if self._map is not None:
+            self._close_segment()
+            self._map = None
+
+
+class SampleLog(object):
+    """
+    A recorded log loaded for replay, with the samples of every channel in
+    arrays sorted by time.
+    """
+
+    def __init__(self, path):
+        self.timestamps = {}
+        self.values = {}
+        self.stick_events = []
+        for timestamp, channel, state, key, value in read_log(path):
+            if channel == STICK:
+                self.stick_events.append((timestamp, key, state))
+                continue
+            if channel >= len(CHANNELS):
+                continue
+            name = CHANNELS[channel]
+            if name not in self.timestamps:
+                self.timestamps[name] = array("d")
+                self.values[name] = array("d")
+            self.timestamps[name].append(timestamp)
+            self.values[name].append(value)
+        times = [event[0] for event in self.stick_events]
+        for timestamps in self.timestamps.values():
+            times.extend((timestamps[0], timestamps[-1]))
+        if not times:
+            raise ValueError("%s holds no samples" % path)
+        self.start = min(times)
+        self.end = max(times)
+
+    def has(self, path):
+        return path in self.timestamps
+
+    def value_at(self, path, timestamp):
+        """
+        The last value of a channel recorded at or before a time, or the first
+        one if the time is before it. Values that were not recorded are 0.
+        """
+        timestamps = self.timestamps.get(path)
+        if not timestamps:
+            return 0.0
+        return self.values[path][max(0, bisect_right(timestamps, timestamp) - 1)]
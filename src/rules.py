@@ -0,0 +1,288 @@
+import json
+import logging
+
+from compositor import BACKGROUND, LAYERS
+from joystick import KEY_NODES
+from pixels import PixelFormatError, pack_pixel_list, pack_rgb888, rgb
+
+KEYS = dict((name, key) for key, name in KEY_NODES.items())
+STATES = ("DOWN", "UP")
+
+MAX_RULES = 64
+
+try:
+    basestring_types = basestring
+except NameError:
+    basestring_types = str
+
+
+class RuleError(ValueError):
+    pass
+
+
+def parse_color(color):
+    """
+    Parse a rule color: "#rrggbb", an [r, g, b] array or the integer of a
+    color editor.
+    :return: List of red, green, blue.
+    """
+    if isinstance(color, list) and len(color) == 3 and all(isinstance(c, int) and 0 <= c <= 255 for c in color):
+        return list(color)
+    if isinstance(color, int) and not isinstance(color, bool) and 0 <= color <= 0xFFFFFF:
+        return list(rgb("%06x" % color))
+    if isinstance(color, basestring_types) and len(color.lstrip("#")) == 6:
+        try:
+            return list(rgb(color.lstrip("#")))
+        except KeyError:
+            pass
+    raise RuleError("Invalid color %s, expected #rrggbb or [r, g, b]" % json.dumps(color))
+
+
+def _number(spec, key, default=None):
+    value = spec.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RuleError("%s must be a number" % key)
+    return value
+
+
+def _layer(spec, default=BACKGROUND):
+    layer = spec.get("layer")
+    if layer is None:
+        return default
+    if layer not in LAYERS:
+        raise RuleError("Unknown layer %s, expected one of %s" % (json.dumps(layer), ", ".join(LAYERS)))
+    return str(layer)
+
+
+def compile_action(spec, device):
+    """
+    Compile one action of a rule into a function that runs it.
+    :param spec: Dict with the action name and its arguments.
+    :param device: Device the action draws on or writes to.
+    """
+    if not isinstance(spec, dict):
+        raise RuleError("Actions must be objects")
+    action = spec.get("action")
+    display = device.display
+    if action == "fill":
+        pixels = pack_rgb888(bytearray(parse_color(spec.get("color", "#ffffff")) * 64))
+        layer = _layer(spec)
+        return lambda: display.set_pixels(pixels, layer)
+    if action == "clear":
+        layer = _layer(spec, None)
+        return lambda: display.clear(layer)
+    if action == "set_pixel":
+        x, y = int(_number(spec, "x")), int(_number(spec, "y"))
+        if not (0 <= x <= 7 and 0 <= y <= 7):
+            raise RuleError("Invalid coordinate, 0-7 is valid.")
+        red, green, blue = parse_color(spec.get("color", "#ffffff"))
+        layer = _layer(spec)
+        return lambda: display.set_pixel(x, y, red, green, blue, layer)
+    if action == "set_pixels":
+        x, y = int(_number(spec, "x", 0)), int(_number(spec, "y", 0))
+        width, height = int(_number(spec, "width", 8)), int(_number(spec, "height", 8))
+        if x < 0 or y < 0 or width < 1 or height < 1 or x + width > 8 or y + height > 8:
+            raise RuleError("Region must be inside the 8x8 matrix")
+        try:
+            values = pack_pixel_list(spec.get("pixels"), width * height)
+        except PixelFormatError as e:
+            raise RuleError(str(e))
+        layer = _layer(spec)
+        return lambda: display.set_region(x, y, width, height, values, layer)
+    if action == "show_message":
+        message = spec.get("message")
+        if not isinstance(message, basestring_types):
+            raise RuleError("show_message needs a message")
+        message = str(message)
+        speed = _number(spec, "speed", 0.1)
+        foreground = parse_color(spec.get("color", "#ffffff"))
+        background = parse_color(spec["background"]) if spec.get("background") is not None else None
+        return lambda: display.show_message(message, speed, foreground, background)
+    if action == "play_animation":
+        name = str(spec.get("name", ""))
+        loop = bool(spec.get("loop", False))
+        layer = _layer(spec)
+
+        def play():
+            # Looked up when it runs, so it can be uploaded after the rule
+            animation = device.animations.get(name)
+            if animation is not None:
+                display.play(animation, loop, layer=layer)
+        return play
+    if action == "stop_animation":
+        return display.stop_playing
+    if action == "set_value":
+        path = spec.get("path")
+        if not isinstance(path, basestring_types) or not path.startswith("/"):
+            raise RuleError("set_value needs the path of a node within the device")
+        path = str(path)
+        value = spec.get("value")
+
+        def set_value():
+            node = device.root.get(path) if device.root is not None else None
+            if node is not None:
+                node.set_value(value)
+        return set_value
+    raise RuleError("Unknown action %s" % json.dumps(action))
+
+
+def compile_actions(spec, device):
+    if spec is None:
+        return ()
+    if isinstance(spec, dict):
+        spec = [spec]
+    if not isinstance(spec, list):
+        raise RuleError("Actions must be an object or an array of objects")
+    return tuple(compile_action(action, device) for action in spec)
+
+
+class Rule(object):
+    """
+    A compiled rule. Threshold rules run their actions when the value
+    crosses into the condition and their else actions when it crosses back
+    out past the hysteresis. Key rules run their actions on the key event
+    and their else actions on the opposite state of the key.
+    """
+    __slots__ = ("name", "source", "enter", "leave", "actions", "otherwise", "active", "fired")
+
+    def __init__(self, name, source, actions, otherwise=(), enter=None, leave=None):
+        self.name = name
+        self.source = source
+        self.enter = enter
+        self.leave = leave
+        self.actions = actions
+        self.otherwise = otherwise
+        self.active = None
+        self.fired = 0
+
+    def evaluate(self, value):
+        """
+        :return: The actions to run for a new value of the source.
+        """
+        if self.enter is None:
+            if value != self.source[1]:
+                return self.otherwise
+            self.fired += 1
+            return self.actions
+        if self.active is not True and self.enter(value):
+            self.active = True
+            self.fired += 1
+            return self.actions
+        if self.active is not False and self.leave(value):
+            was_active = self.active
+            self.active = False
+            if was_active:
+                return self.otherwise
+        return ()
+
+
+def compile_rule(name, text, device):
+    """
+    Compile the JSON definition of a rule, for example
+
+        {"when": {"path": "/temperature", "above": 30, "hysteresis": 0.5},
+         "do": {"action": "fill", "color": "#ff0000"},
+         "else": {"action": "clear"}}
+
+        {"when": {"key": "up", "state": "DOWN"},
+         "do": {"action": "fill", "color": "#00ff00"},
+         "else": {"action": "clear"}}
+
+    :raises RuleError: When the definition is invalid.
+    """
+    try:
+        spec = json.loads(text)
+    except (TypeError, ValueError):
+        raise RuleError("Rule %s is not valid JSON" % name)
+    if not isinstance(spec, dict) or not isinstance(spec.get("when"), dict):
+        raise RuleError("Rule %s needs a when object" % name)
+    when = spec["when"]
+    actions = compile_actions(spec.get("do"), device)
+    otherwise = compile_actions(spec.get("else"), device)
+    if not actions and not otherwise:
+        raise RuleError("Rule %s has no actions" % name)
+
+    if "key" in when:
+        if when["key"] not in KEYS:
+            raise RuleError("Unknown key %s, expected one of %s" % (json.dumps(when["key"]), ", ".join(sorted(KEYS))))
+        state = when.get("state", "DOWN")
+        if state not in STATES:
+            raise RuleError("Key state must be DOWN or UP")
+        return Rule(name, (KEYS[when["key"]], str(state)), actions, otherwise)
+
+    path = when.get("path")
+    if not isinstance(path, basestring_types) or not path.startswith("/"):
+        raise RuleError("Rule %s needs the path of a value or a key" % name)
+    hysteresis = abs(_number(when, "hysteresis", 0.0))
+    if "above" in when:
+        threshold = _number(when, "above")
+        enter = lambda value: value > threshold
+        leave = lambda value: value <= threshold - hysteresis
+    elif "below" in when:
+        threshold = _number(when, "below")
+        enter = lambda value: value < threshold
+        leave = lambda value: value >= threshold + hysteresis
+    else:
+        raise RuleError("Rule %s needs an above or below threshold" % name)
+    return Rule(name, str(path), actions, otherwise, enter, leave)
+
+
+class RuleSet(object):
+    """
+    Rules compiled into a dispatch table keyed by their source: the path of
+    a value within the device, or a key code and state. Looking up a value
+    without rules is a single dict miss.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+        self.logger = logging.getLogger("DSLink")
+        dispatch = {}
+        for rule in self.rules:
+            dispatch.setdefault(rule.source, []).append(rule)
+            if isinstance(rule.source, tuple) and rule.otherwise:
+                # The else actions of a key rule run on the opposite state
+                key, state = rule.source
+                dispatch.setdefault((key, STATES[1 - STATES.index(state)]), []).append(rule)
+        self.dispatch = dict((source, tuple(rules)) for source, rules in dispatch.items())
+        self.paths = frozenset(source for source in dispatch if not isinstance(source, tuple))
+
+    @staticmethod
+    def compile(definitions, device):
+        """
+        :param definitions: Dict of rule name to JSON definition.
+        :param device: Device the actions run on.
+        :return: RuleSet and a dict of rule name to error of the rules that
+        did not compile.
+        """
+        rules = []
+        errors = {}
+        names = sorted(definitions)
+        if len(names) > MAX_RULES:
+            logging.getLogger("DSLink").warning("Only %d rules are run, dropped %s" %
+                                                (MAX_RULES, ", ".join(names[MAX_RULES:])))
+        for name in names[:MAX_RULES]:
+            try:
+                rules.append(compile_rule(name, definitions[name], device))
+            except RuleError as e:
+                errors[name] = str(e)
+        return RuleSet(rules), errors
+
+    def value(self, path, value):
+        rules = self.dispatch.get(path)
+        if rules is not None:
+            for rule in rules:
+                self.run(rule, rule.evaluate(value))
+
+    def key(self, key, state):
+        rules = self.dispatch.get((key, state))
+        if rules is not None:
+            for rule in rules:
+                self.run(rule, rule.evaluate(state))
+
+    def run(self, rule, actions):
+        for action in actions:
+            try:
+                action()
+            except Exception:
+                self.logger.exception("Action of rule %s failed" % rule.name)
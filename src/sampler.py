@@ -0,0 +1,193 @@
+from collections import namedtuple
+import logging
+from threading import Event, Thread
+import time
+
+from backend import accelerometer_orientation
+from metrics import Histogram, TickTimer
+from timing import SKIP, Schedule, check_interval, monotonic, sleep_until
+
+Reading = namedtuple("Reading", ("value", "timestamp"))
+
+SENSORS = ("temperature", "humidity", "pressure", "gyroscope", "accelerometer", "compass")
+IMU_SENSORS = ("gyroscope", "accelerometer", "compass")
+
+DEFAULT_INTERVALS = {
+    "temperature": 0.5,
+    "humidity": 0.5,
+    "pressure": 0.5,
+    "gyroscope": 0.05,
+    "accelerometer": 0.05,
+    "compass": 0.05
+}
+
+# Read latency is measured per read, the IMU sensors share one read
+READS = ("temperature", "humidity", "pressure", "imu")
+
+
+class SensorSampler(object):
+    """
+    Reads the sensors on a dedicated thread so the blocking I2C and RTIMU
+    calls never run on the reactor. Every sensor has its own interval and is
+    only read while it is enabled, which the link does when its nodes are
+    subscribed to. Reads follow the absolute deadlines of a Schedule per
+    sensor, so the read time does not add up into drift. Readings are
+    published as an immutable snapshot dict which is swapped wholesale after
+    every pass, so readers only need a single attribute read and never take
+    a lock.
+    """
+
+    def __init__(self, backend, callback=None, policy=SKIP, capture=None):
+        """
+        :param backend: Backend to read from.
+        :param callback: Called on the sampler thread with a dict of the new
+        readings after every pass.
+        :param policy: Overrun policy of the reads, one of OVERRUN_POLICIES.
+        :param capture: ImuCapture of the same backend, which the IMU sensors
+        are served from while it captures.
+        """
+        self.backend = backend
+        self.callback = callback
+        self.capture = capture
+        self.intervals = dict(DEFAULT_INTERVALS)
+        self.enabled = frozenset()
+        self.snapshot = {}
+        self.logger = logging.getLogger("DSLink")
+        self.latency = dict((read, Histogram()) for read in READS)
+        self.ticks = TickTimer()
+        # Only used on the sampler thread, which applies the intervals and
+        # enabled sensors set by configure
+        self.schedules = dict((sensor, Schedule(DEFAULT_INTERVALS[sensor], policy, self.ticks))
+                              for sensor in SENSORS)
+        self._active = frozenset()
+        self._stopped = Event()
+        self._wake = Event()
+        self._thread = Thread(target=self.run, name="SensorSampler")
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def join(self, timeout=None):
+        """
+        Wait for the thread to end after stop().
+        """
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def configure(self, sensor, interval=None, enabled=None):
+        """
+        Change the interval of a sensor or enable/disable it.
+        :param sensor: Sensor name.
+        :param interval: Seconds between reads.
+        :param enabled: True to read the sensor.
+        :raises ValueError: When the interval is not a positive number.
+        """
+        changed = False
+        if interval is not None and interval != self.intervals[sensor]:
+            self.intervals[sensor] = check_interval(interval)
+            changed = True
+        if enabled is not None and enabled != (sensor in self.enabled):
+            if enabled:
+                self.enabled = self.enabled | {sensor}
+            else:
+                self.enabled = self.enabled - {sensor}
+            changed = True
+        if changed:
+            self._wake.set()
+
+    def sample(self, sensors):
+        """
+        Read the given sensors and publish a new snapshot.
+        :param sensors: Sensor names, attributes of the backend.
+        :return: Dict of the new readings.
+        """
+        readings = {}
+        imu = [sensor for sensor in sensors if sensor in IMU_SENSORS]
+        capture = self.capture
+        if imu and capture is not None and capture.capturing:
+            # The capture thread owns the IMU while it runs, its last read is
+            # used rather than draining samples from under it
+            latest = capture.latest
+            if latest is not None:
+                self._add_imu(readings, imu, latest[1], latest[0])
+        elif imu:
+            # One fused IMU read serves every orientation sensor that is due.
+            # Readings are stamped with the start of their read, which keeps
+            # to the schedule while the read latency varies.
+            now = time.time()
+            started = monotonic()
+            try:
+                reading = self.backend.read_imu()
+            except Exception:
+                self.logger.exception("Failed to read the IMU")
+            else:
+                self.latency["imu"].observe(monotonic() - started)
+                # Without a new sample the IMU sensors are left for next time
+                if reading is not None:
+                    self._add_imu(readings, imu, reading, now)
+        for sensor in sensors:
+            if sensor in IMU_SENSORS:
+                continue
+            now = time.time()
+            started = monotonic()
+            try:
+                value = getattr(self.backend, sensor)
+            except Exception:
+                self.logger.exception("Failed to read %s" % sensor)
+                continue
+            self.latency[sensor].observe(monotonic() - started)
+            readings[sensor] = Reading(value, now)
+        snapshot = dict(self.snapshot)
+        snapshot.update(readings)
+        self.snapshot = snapshot
+        return readings
+
+    @staticmethod
+    def _add_imu(readings, sensors, reading, timestamp):
+        for sensor in sensors:
+            if sensor == "compass":
+                readings[sensor] = Reading(reading.compass, timestamp)
+            elif sensor == "accelerometer":
+                readings[sensor] = Reading(accelerometer_orientation(reading), timestamp)
+            else:
+                readings[sensor] = Reading(reading.orientation, timestamp)
+
+    def run(self):
+        schedules = self.schedules
+        while not self._stopped.is_set():
+            self._wake.clear()
+            enabled = self.enabled
+            now = monotonic()
+            for sensor in enabled:
+                schedule = schedules[sensor]
+                if schedule.interval != self.intervals[sensor]:
+                    schedule.set_interval(self.intervals[sensor])
+                if sensor not in self._active:
+                    schedule.start(now)
+            self._active = enabled
+            due = [sensor for sensor in enabled if schedules[sensor].due <= now]
+            if any(sensor in IMU_SENSORS for sensor in due):
+                # Serve the other IMU sensors from the same read if they would
+                # be due within half of their interval anyway
+                for sensor in IMU_SENSORS:
+                    if sensor in enabled and sensor not in due and \
+                            schedules[sensor].due - now <= schedules[sensor].interval / 2.0:
+                        due.append(sensor)
+            if due:
+                for sensor in due:
+                    schedules[sensor].begin(now)
+                readings = self.sample(due)
+                ended = monotonic()
+                for sensor in due:
+                    schedules[sensor].advance(ended)
+                if readings and self.callback is not None:
+                    self.callback(readings)
+            if enabled:
+                sleep_until(min(schedules[sensor].due for sensor in enabled), self._wake)
+            else:
+                self._wake.wait()
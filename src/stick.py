@@ -41,6 +41,7 @@ import io
 import os
 import glob
 import errno
+import fcntl
 import struct
 import select
 from collections import namedtuple
@@ -66,9 +67,57 @@ class SenseStick(object):
     KEY_DOWN = 108
     KEY_ENTER = 28
 
+    # Most events drained by one read_events call
+    MAX_BATCH = 64
+
     def __init__(self):
         self._stick_file = io.open(self._stick_device(), 'rb')
 
+    def fileno(self):
+        return self._stick_file.fileno()
+
+    def set_nonblocking(self):
+        """
+        Put the device in non-blocking mode for read_events. read and
+        iteration block and must not be used afterwards.
+        """
+        fd = self.fileno()
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self._pending = b''
+        self._batch_structs = {}
+
+    def read_events(self):
+        """
+        Drain every pending event from a non-blocking device without
+        blocking, unpacking each read in one struct call.
+        :return: List of key InputEvents, empty if nothing is pending.
+        """
+        events = []
+        while True:
+            try:
+                chunk = os.read(self.fileno(), self.EVENT_SIZE * self.MAX_BATCH)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not chunk:
+                break
+            data = self._pending + chunk
+            count = len(data) // self.EVENT_SIZE
+            self._pending = data[count * self.EVENT_SIZE:]
+            if count:
+                batch = self._batch_structs.get(count)
+                if batch is None:
+                    batch = struct.Struct(native_str(self.EVENT_FORMAT * count))
+                    self._batch_structs[count] = batch
+                fields = batch.unpack(data[:count * self.EVENT_SIZE])
+                for i in range(0, len(fields), 5):
+                    if fields[i + 2] == self.EV_KEY:
+                        events.append(InputEvent(fields[i] + (fields[i + 1] / 1000000), fields[i + 3], fields[i + 4]))
+            if len(chunk) < self.EVENT_SIZE * self.MAX_BATCH:
+                break
+        return events
+
     def close(self):
         self._stick_file.close()
 
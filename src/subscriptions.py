@@ -0,0 +1,123 @@
+from dslink.Responder import LocalSubscriptionManager
+from timing import monotonic
+from twisted.internet import reactor
+
+
+class BatchingSubscriptionManager(LocalSubscriptionManager):
+    """
+    Gathers the value updates of all nodes and sends them to the broker in
+    a single subscription update message per flush, instead of one message
+    per set_value. A flush runs flush_window seconds after the first pending
+    update, at the end of the current reactor iteration for 0, so the values
+    a sampler pass or a joystick read sets go out together. Several updates
+    of the same subscription before a flush only send the latest value.
+
+    With a max_rate, a subscription is sent at most that many updates per
+    second, the latest value being held back until it is allowed. The flush
+    is scheduled for the earliest subscription that is due, so one held
+    back does not delay the others.
+    """
+
+    def __init__(self, link, flush_window=0.0, max_rate=0.0):
+        """
+        :param link: DSLink.
+        :param flush_window: Seconds to gather updates for.
+        :param max_rate: Updates per second per subscription, 0 for no limit.
+        """
+        LocalSubscriptionManager.__init__(self, link)
+        self.flush_window = flush_window
+        self.max_rate = max_rate
+        self.pending = {}
+        self.last_sent = {}
+        self.messages = 0
+        self.updates = 0
+        self.coalesced = 0
+        self._flush_call = None
+        # Monotonic time the scheduled flush runs at
+        self._flush_at = None
+
+    @staticmethod
+    def replace(link, flush_window=0.0, max_rate=0.0):
+        """
+        Install a BatchingSubscriptionManager on the responder of a link,
+        keeping the subscriptions made so far.
+        :return: The new manager.
+        """
+        old = link.responder.subscription_manager
+        manager = BatchingSubscriptionManager(link, flush_window, max_rate)
+        manager.path_subs = old.path_subs
+        manager.sids_path = old.sids_path
+        link.responder.subscription_manager = manager
+        return manager
+
+    def remove_value_sub(self, sid):
+        LocalSubscriptionManager.remove_value_sub(self, sid)
+        self.pending.pop(sid, None)
+        self.last_sent.pop(sid, None)
+
+    def send_value_update(self, node):
+        sub = self.path_subs.get(node.path)
+        if sub is None:
+            return
+        value = node.value
+        now = monotonic()
+        for sid in sub.sid_qos:
+            if not self.link.active and sub.sid_qos[sid] > 0:
+                self.link.storage.store(sub, value)
+            if sid in self.pending:
+                self.coalesced += 1
+            else:
+                self.schedule(self.due(sid, now + self.flush_window))
+            self.pending[sid] = [sid, value.value, value.updated_at.isoformat()]
+
+    def due(self, sid, earliest):
+        """
+        Monotonic time the rate limit of a subscription allows its next update
+        at, no earlier than earliest.
+        """
+        last = self.last_sent.get(sid)
+        if self.max_rate > 0 and last is not None:
+            return max(earliest, last + 1.0 / self.max_rate)
+        return earliest
+
+    def schedule(self, at):
+        """
+        Flush at a monotonic time, unless a flush is scheduled before then.
+        """
+        if self._flush_call is not None:
+            if self._flush_at <= at:
+                return
+            self._flush_call.cancel()
+        self._flush_at = at
+        self._flush_call = reactor.callLater(max(0.0, at - monotonic()), self.flush)
+
+    def flush(self):
+        """
+        Send the pending updates that their rate limit allows in one message.
+        """
+        self._flush_call = None
+        self._flush_at = None
+        now = monotonic()
+        updates = []
+        next_due = None
+        for sid in list(self.pending):
+            due = self.due(sid, now)
+            if due > now:
+                next_due = due if next_due is None else min(next_due, due)
+                continue
+            if self.max_rate > 0:
+                self.last_sent[sid] = now
+            updates.append(self.pending.pop(sid))
+        if updates and self.link.wsp is not None:
+            self.link.wsp.sendMessage({
+                "responses": [
+                    {
+                        "rid": 0,
+                        "updates": updates
+                    }
+                ]
+            })
+            self.messages += 1
+            self.updates += len(updates)
+        if next_due is not None:
+            self.schedule(next_due)
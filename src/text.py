@@ -0,0 +1,129 @@
+from array import array
+from collections import OrderedDict
+import string
+from threading import Lock
+
+from framebuffer import FRAME_PIXELS, INDEX_MAPS, FrameStrip, frame_bytes, pack_pixel
+
+WHITE = [255, 255, 255]
+
+
+class GlyphAtlas(object):
+    """
+    Text characters as lists of columns, each column an 8 bit mask of its
+    lit pixels, with the empty columns around the character trimmed.
+    """
+
+    def __init__(self, backend):
+        """
+        :param backend: Backend to load the character pixels from.
+        """
+        self.backend = backend
+        self.glyphs = {}
+
+    def preload(self, characters=string.printable):
+        """
+        Load characters up front, others are loaded the first time they are
+        used.
+        """
+        for s in characters:
+            self.get(s)
+
+    def get(self, s):
+        glyph = self.glyphs.get(s)
+        if glyph is None:
+            char = self.backend.trim_whitespace(self.backend.get_char_pixels(s))
+            glyph = []
+            for start in range(0, len(char), 8):
+                mask = 0
+                for bit, pixel in enumerate(char[start:start + 8]):
+                    if pixel == WHITE:
+                        mask |= 1 << bit
+                glyph.append(mask)
+            self.glyphs[s] = glyph
+        return glyph
+
+
+class MessageRenderer(object):
+    """
+    Renders scrolling messages into FrameStrips and keeps the most
+    recently used ones in a bounded cache.
+    """
+
+    def __init__(self, backend, cache_size=32):
+        """
+        :param backend: Backend to load the character pixels from.
+        :param cache_size: Number of rendered messages to keep.
+        """
+        self.atlas = GlyphAtlas(backend)
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def render(self, text_string, text_colour, back_colour, rotation):
+        """
+        Get the strip of a message, from the cache if possible.
+        :param text_string: Message.
+        :param text_colour: [R,G,B] of the text.
+        :param back_colour: [R,G,B] of the background, None to leave it
+        transparent.
+        :param rotation: LED matrix rotation the message is shown with.
+        :return: FrameStrip.
+        """
+        key = (text_string, tuple(text_colour), tuple(back_colour) if back_colour is not None else None, rotation)
+        with self._lock:
+            strip = self._cache.pop(key, None)
+            if strip is not None:
+                self.hits += 1
+                self._cache[key] = strip
+                return strip
+        strip = self._render(text_string, text_colour, back_colour, rotation)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = strip
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return strip
+
+    def _render(self, text_string, text_colour, back_colour, rotation):
+        # Columns of the message, with a screen of padding on both sides and
+        # an empty column between letters
+        columns = [0] * 8
+        for s in text_string:
+            columns.extend(self.atlas.get(s))
+            columns.append(0)
+        columns.extend([0] * 8)
+
+        fg = pack_pixel(*text_colour)
+        bg = pack_pixel(*back_colour) if back_colour is not None else 0
+        # Text assets are rotated right through 90 degrees, so draw rotated
+        # left through 90 degrees, the columns of the text are the rows
+        index_map = INDEX_MAPS[(rotation - 90) % 360]
+        packed_columns = []
+        for mask in columns:
+            packed_columns.append([fg if mask >> bit & 1 else bg for bit in range(8)])
+
+        count = len(columns) - 8
+        frames = array("H", [0] * (count * FRAME_PIXELS))
+        for i in range(count):
+            offset = i * FRAME_PIXELS
+            k = 0
+            for column in packed_columns[i:i + 8]:
+                for pixel in column:
+                    frames[offset + index_map[k]] = pixel
+                    k += 1
+        coverage = None
+        if back_colour is None:
+            # Only the lit pixels of the text cover what is below
+            coverage = bytearray(count * FRAME_PIXELS)
+            for i in range(count):
+                offset = i * FRAME_PIXELS
+                k = 0
+                for mask in columns[i:i + 8]:
+                    for bit in range(8):
+                        if mask >> bit & 1:
+                            coverage[offset + index_map[k]] = 255
+                        k += 1
+        return FrameStrip(bytearray(frame_bytes(frames)), count, coverage)
@@ -0,0 +1,207 @@
+import ctypes
+import ctypes.util
+import time
+
+from twisted.internet import reactor
+
+CLOCK_MONOTONIC = 1
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+def _clock_gettime():
+    # Python 2 has no time.monotonic, read CLOCK_MONOTONIC through libc
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        clock_gettime = libc.clock_gettime
+    except (OSError, AttributeError):
+        return time.time
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+
+    def monotonic():
+        ts = _Timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+            return time.time()
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+
+    return monotonic
+
+
+try:
+    from time import monotonic
+except ImportError:
+    monotonic = _clock_gettime()
+
+
+def to_monotonic(timestamp):
+    """
+    Convert a wall clock timestamp to the monotonic clock.
+    """
+    return monotonic() + (timestamp - time.time())
+
+
+SKIP = "skip"
+CATCH_UP = "catch_up"
+STRETCH = "stretch"
+OVERRUN_POLICIES = (SKIP, CATCH_UP, STRETCH)
+
+# Runs a catch up policy makes at most before it starts over from now
+MAX_CATCH_UP = 10
+
+# Longest step Event.wait polls in on Python 2
+EVENT_RESOLUTION = 0.05
+
+
+class Schedule(object):
+    """
+    Absolute deadlines of a fixed rate task on the monotonic clock. Every
+    deadline is the previous one plus the interval, not the end of the last
+    run plus the interval, so the time a run takes does not add up into
+    drift. When a run ends past the next deadline the overrun policy
+    decides what happens to the deadlines that were missed:
+    - skip: leave them out and stay in phase with the original deadlines.
+    - catch_up: run them back to back until back on time.
+    - stretch: start over from the end of the run, shifting the phase.
+    """
+
+    def __init__(self, interval, policy=SKIP, ticks=None):
+        """
+        :param interval: Seconds between runs.
+        :param policy: One of OVERRUN_POLICIES.
+        :param ticks: TickTimer to record the jitter, overruns and skipped
+        runs in.
+        """
+        if policy not in OVERRUN_POLICIES:
+            raise ValueError("Invalid overrun policy %s, expected one of %s" % (policy, ", ".join(OVERRUN_POLICIES)))
+        self.interval = check_interval(interval)
+        self.policy = policy
+        self.ticks = ticks
+        self.due = None
+        self.last = None
+
+    def start(self, now=None):
+        """
+        Make the first run due now.
+        """
+        self.due = monotonic() if now is None else now
+        self.last = None
+
+    def begin(self, now=None):
+        """
+        Record the start of the run that was due.
+        :return: Time the run was due.
+        """
+        now = monotonic() if now is None else now
+        due = self.due
+        if self.ticks is not None and self.last is not None:
+            self.ticks.tick(due, now, self.interval)
+        self.last = due
+        return due
+
+    def advance(self, now=None):
+        """
+        Move to the deadline after the run that just ended.
+        :param now: Time the run ended.
+        :return: Next deadline.
+        """
+        now = monotonic() if now is None else now
+        due = self.due + self.interval
+        if due < now:
+            missed = int((now - due) / self.interval)
+            if self.policy == SKIP:
+                due += (missed + 1) * self.interval
+                if self.ticks is not None:
+                    self.ticks.skipped += missed + 1
+            elif self.policy == STRETCH or missed >= MAX_CATCH_UP:
+                due = now
+        self.due = due
+        return due
+
+    def set_interval(self, interval):
+        """
+        Change the interval, applied to the deadline of the next run.
+        :raises ValueError: When the interval is not a positive number.
+        """
+        interval = check_interval(interval)
+        if self.due is not None and self.last is not None:
+            self.due = self.last + interval
+        self.interval = interval
+
+    def delay(self, now=None):
+        """
+        :return: Seconds until the next run is due, 0 when it is overdue.
+        """
+        return max(0.0, self.due - (monotonic() if now is None else now))
+
+
+def sleep_until(due, wake=None):
+    """
+    Sleep until the monotonic time due, or until wake is set.
+    :param wake: Event that ends the sleep early.
+    """
+    while True:
+        delay = due - monotonic()
+        if delay <= 0 or (wake is not None and wake.is_set()):
+            return
+        if wake is None or delay <= EVENT_RESOLUTION:
+            # Event.wait polls on Python 2, far too coarse for the last stretch
+            time.sleep(delay)
+            return
+        wake.wait(delay - EVENT_RESOLUTION)
+
+
+def check_interval(interval):
+    if isinstance(interval, bool) or not isinstance(interval, (int, float)) or not interval > 0:
+        raise ValueError("Interval must be a positive number of seconds, got %r" % (interval,))
+    return float(interval)
+
+
+class PeriodicTask(object):
+    """
+    Calls a function on the reactor at the deadlines of a Schedule.
+    """
+
+    def __init__(self, function, interval, policy=SKIP, ticks=None):
+        """
+        :param function: Function to call, without arguments.
+        :param interval: Seconds between calls.
+        :param policy: One of OVERRUN_POLICIES.
+        :param ticks: TickTimer to record the jitter and overruns in.
+        """
+        self.function = function
+        self.schedule = Schedule(interval, policy, ticks)
+        self.running = False
+        self._call = None
+
+    def start(self, delay=0.0):
+        self.stop()
+        self.running = True
+        self.schedule.start(monotonic() + delay)
+        self._call = reactor.callLater(delay, self._run)
+
+    def stop(self):
+        self.running = False
+        if self._call is not None and self._call.active():
+            self._call.cancel()
+        self._call = None
+
+    def set_interval(self, interval):
+        """
+        Change the interval, moving a pending call to the new deadline.
+        :raises ValueError: When the interval is not a positive number.
+        """
+        self.schedule.set_interval(interval)
+        if self._call is not None and self._call.active():
+            self._call.reset(self.schedule.delay())
+
+    def _run(self):
+        self._call = None
+        self.schedule.begin()
+        try:
+            self.function()
+        finally:
+            if self.running:
+                self.schedule.advance()
+                self._call = reactor.callLater(self.schedule.delay(), self._run)
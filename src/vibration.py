@@ -0,0 +1,162 @@
+from collections import namedtuple
+import cmath
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_RATE = 500.0
+DEFAULT_WINDOW_SIZE = 256
+DEFAULT_BANDS = "0-10,10-50,50-100,100-250"
+
+MAX_WINDOW_SIZE = 8192
+MAX_BANDS = 16
+
+Vibration = namedtuple("Vibration", ("timestamp", "sample_rate", "rms", "peak", "crest_factor",
+                                     "frequency", "band_energy"))
+
+
+def parse_bands(text):
+    """
+    Parse frequency bands written as "low-high" pairs in Hz separated by
+    commas, like "0-10,10-50".
+    :return: List of (low, high) tuples.
+    """
+    bands = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            low, high = [float(bound) for bound in part.split("-")]
+        except ValueError:
+            raise ValueError("Band %s must be written as low-high in Hz" % part)
+        if low < 0 or high <= low:
+            raise ValueError("Band %s must have 0 <= low < high" % part)
+        bands.append((low, high))
+    if len(bands) > MAX_BANDS:
+        raise ValueError("At most %d bands are supported" % MAX_BANDS)
+    return bands
+
+
+def window_size(size):
+    """
+    The largest power of two window size that is at most size, as the FFT
+    fallback is radix-2.
+    """
+    size = max(8, min(int(size), MAX_WINDOW_SIZE))
+    return 1 << (size.bit_length() - 1)
+
+
+def _fft(values):
+    # Iterative radix-2 FFT for when numpy is missing, len(values) must be
+    # a power of two
+    n = len(values)
+    bits = n.bit_length() - 1
+    out = [complex(values[int(format(i, "0%db" % bits)[::-1], 2)]) for i in range(n)]
+    size = 2
+    while size <= n:
+        step = cmath.exp(-2j * math.pi / size)
+        half = size // 2
+        for start in range(0, n, size):
+            w = 1
+            for k in range(start, start + half):
+                odd = out[k + half] * w
+                out[k + half] = out[k] - odd
+                out[k] += odd
+                w *= step
+        size *= 2
+    return out
+
+
+class VibrationAnalyser(object):
+    """
+    Collects the accelerometer samples of IMU capture blocks into windows
+    and reduces every full window to a Vibration summary. The signal is the
+    magnitude of the acceleration with its mean, gravity, removed, so it
+    does not depend on how the device is mounted. Band energies are the
+    mean square acceleration in g^2 within each band of a Hann windowed
+    spectrum, so over all bands they add up to the RMS squared.
+    """
+
+    def __init__(self, size=DEFAULT_WINDOW_SIZE, bands=None):
+        """
+        :param size: Samples per window, rounded down to a power of two.
+        :param bands: List of (low, high) bands in Hz.
+        """
+        self.size = window_size(size)
+        self.bands = bands if bands is not None else parse_bands(DEFAULT_BANDS)
+        self.windows = 0
+        self._times = []
+        self._values = []
+        n = self.size
+        if numpy is not None:
+            self._hann = numpy.hanning(n)
+        else:
+            self._hann = [0.5 - 0.5 * math.cos(2 * math.pi * i / (n - 1)) for i in range(n)]
+        self._hann_power = sum(w * w for w in self._hann)
+
+    def add(self, block):
+        """
+        Add the samples of a FusedBlock.
+        :return: List of Vibration summaries of the windows it completed.
+        """
+        if numpy is not None:
+            accel = block.raw[:, 0:3]
+            magnitudes = numpy.sqrt(numpy.einsum("ij,ij->i", accel, accel))
+        else:
+            magnitudes = [math.sqrt(row[0] * row[0] + row[1] * row[1] + row[2] * row[2]) for row in block.raw]
+        self._times.extend(block.times)
+        self._values.extend(magnitudes)
+        results = []
+        while len(self._values) >= self.size:
+            times, values = self._times[:self.size], self._values[:self.size]
+            del self._times[:self.size], self._values[:self.size]
+            results.append(self.analyse(times, values, block.timestamps[-1]))
+        return results
+
+    def analyse(self, times, values, timestamp):
+        """
+        :param times: Monotonic time of every sample.
+        :param values: Acceleration magnitude of every sample in g.
+        :param timestamp: Wall clock time of the window.
+        """
+        self.windows += 1
+        n = len(values)
+        elapsed = times[-1] - times[0]
+        sample_rate = (n - 1) / elapsed if elapsed > 0 else 0.0
+        if numpy is not None:
+            signal = numpy.asarray(values)
+            signal = signal - signal.mean()
+            rms = math.sqrt(float(numpy.dot(signal, signal)) / n)
+            peak = float(numpy.abs(signal).max())
+            spectrum = numpy.fft.rfft(signal * self._hann)
+            power = (spectrum.real ** 2 + spectrum.imag ** 2).tolist()
+        else:
+            mean = sum(values) / n
+            signal = [value - mean for value in values]
+            rms = math.sqrt(sum(value * value for value in signal) / n)
+            peak = max(abs(value) for value in signal)
+            spectrum = _fft([value * w for value, w in zip(signal, self._hann)])[:n // 2 + 1]
+            power = [c.real * c.real + c.imag * c.imag for c in spectrum]
+        # One-sided mean square per bin, by Parseval's theorem
+        scale = 2.0 / (n * self._hann_power)
+        power = [p * scale for p in power]
+        power[0] /= 2
+        power[-1] /= 2
+        resolution = sample_rate / n if n else 0.0
+        frequency = 0.0
+        if len(power) > 1 and resolution > 0:
+            frequency = max(range(1, len(power)), key=power.__getitem__) * resolution
+        band_energy = []
+        for low, high in self.bands:
+            energy = 0.0
+            if resolution > 0:
+                first = int(math.ceil(low / resolution))
+                last = min(len(power) - 1, int(math.ceil(high / resolution)) - 1)
+                energy = sum(power[first:last + 1]) if last >= first else 0.0
+            band_energy.append(energy)
+        return Vibration(timestamp, sample_rate, rms, peak, peak / rms if rms > 0 else 0.0,
+                         frequency, band_energy)
@@ -0,0 +1,95 @@
+from array import array
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import compositor
+from compositor import BACKGROUND, OVERLAY, STATUS, Compositor, blend_pixel, numpy
+from framebuffer import PIX_MAPS, pack_pixel
+
+RED = pack_pixel(255, 0, 0)
+BLUE = pack_pixel(0, 0, 255)
+
+
+class Backend(object):
+    def __init__(self):
+        self.frames = []
+
+    def write_frame(self, frame):
+        self.frames.append(frame)
+
+
+def random_compositor(rng):
+    """
+    Compositor with random frames, coverage and alpha on every layer.
+    """
+    merged = Compositor(Backend())
+    for layer in merged.layers:
+        layer.fill(array("H", [rng.randrange(65536) for _ in range(64)]),
+                   bytearray(rng.choice((0, 255, rng.randrange(256))) for _ in range(64)))
+        layer.alpha = rng.choice((1.0, rng.random()))
+    return merged
+
+
+class BlendPixelTest(unittest.TestCase):
+    def test_blend(self):
+        self.assertEqual(blend_pixel(RED, BLUE, 0.0), RED)
+        self.assertEqual(blend_pixel(RED, BLUE, 1.0), BLUE)
+        # 31 * 0.5 rounded half up on both channels
+        self.assertEqual(blend_pixel(RED, BLUE, 0.5), 16 << 11 | 16)
+
+
+class CompositorTest(unittest.TestCase):
+    def test_layers_from_the_bottom_up(self):
+        merged = Compositor(Backend())
+        merged.layer(BACKGROUND).fill(array("H", [RED] * 64))
+        self.assertEqual(merged.compose(), array("H", [RED] * 64))
+        merged.layer(OVERLAY).draw_pixels([(0, 0, BLUE)], PIX_MAPS[0])
+        frame = merged.compose()
+        self.assertEqual(frame[PIX_MAPS[0][0][0]], BLUE)
+        self.assertEqual(frame.count(RED), 63)
+        merged.layer(OVERLAY).alpha = 0.5
+        self.assertEqual(merged.compose()[PIX_MAPS[0][0][0]], blend_pixel(RED, BLUE, 0.5))
+
+    def test_transparent_layers_are_hidden(self):
+        merged = Compositor(Backend())
+        status = merged.layer(STATUS)
+        self.assertFalse(status.visible)
+        status.draw_region(0, 0, 2, 1, [BLUE, BLUE], PIX_MAPS[0])
+        self.assertTrue(status.visible)
+        status.alpha = 0
+        self.assertFalse(status.visible)
+        status.alpha = 1.0
+        status.clear()
+        self.assertFalse(status.visible)
+        self.assertRaises(ValueError, status.draw_region, 7, 0, 2, 1, [BLUE, BLUE], PIX_MAPS[0])
+        self.assertRaises(ValueError, merged.layer, "top")
+
+    def test_unchanged_frames_are_not_written(self):
+        backend = Backend()
+        merged = Compositor(backend)
+        self.assertTrue(merged.flush())
+        self.assertFalse(merged.flush())
+        merged.layer(OVERLAY).draw_pixels([(1, 1, RED)], PIX_MAPS[0])
+        self.assertTrue(merged.flush())
+        self.assertEqual(len(backend.frames), 2)
+        self.assertEqual((merged.frames_composed, merged.frames_suppressed), (3, 1))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy_matches_python(self):
+        rng = random.Random(7)
+        composers = [random_compositor(rng) for _ in range(50)]
+        expected = [merged.compose() for merged in composers]
+        try:
+            compositor.numpy = None
+            actual = [merged.compose() for merged in composers]
+        finally:
+            compositor.numpy = numpy
+        self.assertEqual(actual, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
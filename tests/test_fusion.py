@@ -0,0 +1,178 @@
+import logging
+import math
+import os
+import random
+import sys
+from threading import Event
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from backend import SimulatedBackend, raw_imu
+from fusion import ComplementaryFilter, ImuCapture, measured_pose, numpy, quaternion
+
+POSE = (math.radians(10.0), math.radians(-20.0), math.radians(30.0))
+
+
+def still_samples(pose, count, rate=100.0, gyro=(0.0, 0.0, 0.0)):
+    """
+    Timestamps and raw samples of an IMU held at a pose.
+    """
+    sample = raw_imu(pose[0], pose[1], pose[2], gyro)
+    return [i / rate for i in range(count)], [sample] * count
+
+
+class PoseTest(unittest.TestCase):
+    def test_measured_pose(self):
+        sample = raw_imu(*POSE)
+        pose = measured_pose(*(sample[:3] + sample[6:]))
+        for angle, expected in zip(pose, POSE):
+            self.assertAlmostEqual(angle, expected)
+
+    def test_quaternion(self):
+        self.assertEqual(quaternion(0.0, 0.0, 0.0), (1.0, 0.0, 0.0, 0.0))
+        w, x, y, z = quaternion(0.0, 0.0, math.radians(90.0))
+        self.assertAlmostEqual(w, math.sqrt(0.5))
+        self.assertAlmostEqual(z, math.sqrt(0.5))
+        # Either side of the yaw wrap around
+        for yaw in (math.pi - 0.01, -math.pi + 0.01):
+            q = quaternion(0.1, 0.2, yaw)
+            self.assertGreaterEqual(q[0], 0.0)
+            self.assertAlmostEqual(sum(v * v for v in q), 1.0)
+
+
+class ComplementaryFilterTest(unittest.TestCase):
+    def test_holds_a_still_pose(self):
+        timestamps, raw = still_samples(POSE, 20)
+        poses = ComplementaryFilter()._filter_python(timestamps, raw)
+        for angle, expected in zip(poses[-1], POSE):
+            self.assertAlmostEqual(angle, expected)
+
+    def test_converges_to_the_measured_pose(self):
+        f = ComplementaryFilter(time_constant=0.1)
+        timestamps, raw = still_samples((0.0, 0.0, 0.0), 1)
+        f._filter_python(timestamps, raw)
+        timestamps, raw = still_samples(POSE, 200)
+        poses = f._filter_python([t + 0.01 for t in timestamps], raw)
+        for angle, expected in zip(poses[-1], POSE):
+            self.assertAlmostEqual(angle, expected, 3)
+
+    def test_integrates_the_gyroscope(self):
+        # A slow filter follows the rates, not the still measured pose
+        f = ComplementaryFilter(time_constant=100.0)
+        timestamps, raw = still_samples((0.0, 0.0, 0.0), 101, gyro=(0.0, 0.0, 0.5))
+        poses = f._filter_python(timestamps, raw)
+        self.assertAlmostEqual(poses[-1][2], 0.5, 2)
+
+    def test_reset(self):
+        f = ComplementaryFilter()
+        f._filter_python(*still_samples(POSE, 2))
+        f.reset()
+        self.assertIsNone(f.pose)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy_matches_python(self):
+        timestamps, raw = still_samples(POSE, 10, gyro=(0.1, -0.2, 0.3))
+        python, vectorised = ComplementaryFilter(), ComplementaryFilter()
+        for block in range(3):
+            times = [t + block * 0.1 for t in timestamps]
+            expected = python._filter_python(times, raw)
+            actual = vectorised.filter(times, raw)
+            for pose, wanted in zip(actual, expected):
+                for angle, expected_angle in zip(pose, wanted):
+                    self.assertAlmostEqual(angle, expected_angle, 9)
+        quaternions = vectorised.quaternions(actual)
+        for q, pose in zip(quaternions, actual):
+            for v, expected in zip(q, quaternion(*pose)):
+                self.assertAlmostEqual(v, expected)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy_matches_python_with_uneven_spacing(self):
+        # Samples late and early around 100 Hz, as an overrunning capture
+        # delivers them, while the device turns
+        rng = random.Random(3)
+        python, vectorised = ComplementaryFilter(0.2), ComplementaryFilter(0.2)
+        now = 0.0
+        for block in range(5):
+            times, raw = [], []
+            for i in range(10):
+                now += rng.choice((0.002, 0.01, 0.01, 0.035))
+                yaw = 0.5 * now
+                times.append(now)
+                raw.append(raw_imu(0.1, -0.2, yaw, (0.0, 0.0, 0.5 + rng.uniform(-0.1, 0.1))))
+            expected = python._filter_python(times, raw)
+            actual = vectorised.filter(times, raw)
+            for pose, wanted in zip(actual, expected):
+                for angle, expected_angle in zip(pose, wanted):
+                    self.assertAlmostEqual(angle, expected_angle, 9)
+
+
+class ImuCaptureTest(unittest.TestCase):
+    def test_capture_is_the_only_reader(self):
+        backend = SimulatedBackend()
+        blocks = []
+        done = Event()
+
+        def callback(block):
+            blocks.append(block)
+            if len(blocks) == 2:
+                done.set()
+
+        capture = ImuCapture(backend, callback, rate=200.0, block_duration=0.05)
+        capture.configure(enabled=True)
+        capture.start()
+        self.assertTrue(done.wait(5))
+        capture.stop()
+        capture.join(5)
+        self.assertEqual([len(block) for block in blocks[:2]], [10, 10])
+        self.assertEqual(len(blocks[0].euler), 10)
+        self.assertEqual(len(blocks[0].quaternions), 10)
+        self.assertEqual(backend.reads["imu"], capture.samples)
+        self.assertEqual(capture.stale, 0)
+        self.assertFalse(capture.capturing)
+        self.assertIsNone(capture.latest)
+
+    def test_failing_callback_does_not_end_the_capture(self):
+        blocks = []
+        done = Event()
+
+        def callback(block):
+            blocks.append(block)
+            if len(blocks) == 1:
+                raise ValueError("analysis failed")
+            done.set()
+
+        capture = ImuCapture(SimulatedBackend(), callback, rate=200.0, block_duration=0.05)
+        capture.logger = logging.getLogger("test_fusion")
+        capture.logger.disabled = True
+        capture.configure(enabled=True)
+        capture.start()
+        self.assertTrue(done.wait(5))
+        capture.stop()
+        capture.join(5)
+        self.assertGreaterEqual(len(blocks), 2)
+
+    def test_stale_reads_are_skipped(self):
+        # Read twice as fast as the IMU delivers new samples
+        backend = SimulatedBackend(imu_rate=100.0)
+        blocks = []
+        done = Event()
+
+        def callback(block):
+            blocks.append(block)
+            done.set()
+
+        capture = ImuCapture(backend, callback, rate=200.0, block_duration=0.05)
+        capture.configure(enabled=True)
+        capture.start()
+        self.assertTrue(done.wait(5))
+        capture.stop()
+        capture.join(5)
+        self.assertEqual(len(blocks[0]), 10)
+        # The stale reads in between are counted, not captured
+        self.assertGreater(capture.stale, 0)
+        self.assertEqual(backend.reads["imu"], capture.samples + capture.stale)
+
+
+if __name__ == "__main__":
+    unittest.main()
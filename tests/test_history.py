@@ -0,0 +1,90 @@
+import math
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from history import History, RingBuffer
+
+
+def expected_stats(samples, window):
+    """
+    Min, max, mean and standard deviation of the samples in the window
+    ending at the last one, computed from scratch.
+    """
+    cutoff = samples[-1][0] - window
+    values = [value for timestamp, value in samples if timestamp >= cutoff]
+    mean = sum(values) / len(values)
+    stddev = math.sqrt(sum((value - mean) ** 2 for value in values) / len(values))
+    return min(values), max(values), mean, stddev
+
+
+class RingBufferTest(unittest.TestCase):
+    def test_keeps_the_last_samples(self):
+        buf = RingBuffer(4)
+        for i in range(10):
+            self.assertEqual(buf.append(float(i), i * 10.0), i)
+        self.assertEqual(len(buf), 4)
+        self.assertEqual(buf.first, 6)
+        self.assertEqual([buf.value(seq) for seq in range(buf.first, buf.total)], [60.0, 70.0, 80.0, 90.0])
+
+    def test_find(self):
+        buf = RingBuffer(8)
+        for i in range(12):
+            buf.append(i * 2.0, 0.0)
+        self.assertEqual(buf.find(0.0), 4)
+        self.assertEqual(buf.find(13.0), 7)
+        self.assertEqual(buf.find(14.0), 7)
+        self.assertEqual(buf.find(100.0), 12)
+
+
+class HistoryTest(unittest.TestCase):
+    def test_rolling_stats_match_the_window(self):
+        rng = random.Random(1)
+        history = History(capacity=64, window=5.0)
+        samples = []
+        timestamp = 1000.0
+        for _ in range(500):
+            timestamp += rng.uniform(0.05, 0.5)
+            value = rng.gauss(20.0, 3.0)
+            samples.append((timestamp, value))
+            history.record("/temperature", timestamp, value)
+            stats = history.stats("/temperature")
+            # Only the samples still in the buffer can be in the window
+            expected = expected_stats(samples[-64:], 5.0)
+            for actual, wanted in zip((stats.min, stats.max, stats.mean, stats.stddev), expected):
+                self.assertAlmostEqual(actual, wanted, 6)
+
+    def test_set_window_rebuilds(self):
+        history = History(window=10.0)
+        for i in range(20):
+            history.record("/pressure", float(i), float(i))
+        history.set_window("/pressure", 2.0)
+        stats = history.stats("/pressure")
+        self.assertEqual((stats.count, stats.min, stats.max), (3, 17.0, 19.0))
+
+    def test_unknown_series(self):
+        history = History()
+        self.assertIsNone(history.stats("/humidity"))
+        self.assertEqual(history.query("/humidity"), [])
+
+    def test_query_range_and_paging(self):
+        history = History()
+        for i in range(10):
+            history.record("/compass", float(i), i * 2.0)
+        self.assertEqual(history.query("/compass", 3.0, 5.0), [[3.0, 6.0], [4.0, 8.0], [5.0, 10.0]])
+        self.assertEqual(history.query("/compass", offset=8), [[8.0, 16.0], [9.0, 18.0]])
+        self.assertEqual(history.query("/compass", limit=2), [[0.0, 0.0], [1.0, 2.0]])
+
+    def test_query_buckets(self):
+        history = History()
+        for i in range(10):
+            history.record("/humidity", float(i), float(i))
+        self.assertEqual(history.query("/humidity", interval=4), [[0.0, 1.5], [4.0, 5.5], [8.0, 8.5]])
+        self.assertEqual(history.query("/humidity", interval=4, offset=1, limit=1), [[4.0, 5.5]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+from array import array
+import base64
+import binascii
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from framebuffer import pack_pixel
+from pixels import BASE64_RGB565, BASE64_RGB888, HEX, JSON, PixelFormatError, decode_frames, decode_pixels, \
+    pack_pixel_list, rgb
+
+PIXELS = [[(i * 4) % 256, 255 - i, (i * 37) % 256] for i in range(64)]
+PACKED = array("H", [pack_pixel(*pixel) for pixel in PIXELS])
+RGB888 = bytes(bytearray(value for pixel in PIXELS for value in pixel))
+
+
+class RgbTest(unittest.TestCase):
+    def test_rgb(self):
+        self.assertEqual(rgb("ff8000"), (255, 128, 0))
+        self.assertEqual(rgb("0A0b0C"), (10, 11, 12))
+        self.assertRaises(KeyError, rgb, "zz0000")
+
+
+class DecodePixelsTest(unittest.TestCase):
+    def test_json(self):
+        self.assertEqual(decode_pixels(json.dumps(PIXELS)), PACKED)
+
+    def test_hex(self):
+        self.assertEqual(decode_pixels(binascii.hexlify(RGB888).decode(), HEX), PACKED)
+
+    def test_base64_rgb888(self):
+        self.assertEqual(decode_pixels(base64.b64encode(RGB888).decode(), BASE64_RGB888), PACKED)
+
+    def test_base64_rgb565_is_little_endian(self):
+        data = bytearray()
+        for value in PACKED:
+            data.extend((value & 0xFF, value >> 8))
+        self.assertEqual(decode_pixels(base64.b64encode(bytes(data)).decode(), BASE64_RGB565), PACKED)
+
+    def test_region(self):
+        self.assertEqual(decode_pixels(json.dumps(PIXELS[:6]), JSON, 3, 2), PACKED[:6])
+
+    def test_invalid(self):
+        invalid = (
+            ("[", JSON),
+            (json.dumps(PIXELS[:63]), JSON),
+            (json.dumps(PIXELS[:63] + [[256, 0, 0]]), JSON),
+            (json.dumps(PIXELS[:63] + [[0, 0]]), JSON),
+            (json.dumps(PIXELS[:63] + [["red", 0, 0]]), JSON),
+            ("zz" * 192, HEX),
+            ("00" * 191, HEX),
+            (base64.b64encode(RGB888).decode(), BASE64_RGB565),
+            ("", "RGB")
+        )
+        for pixels, pixel_format in invalid:
+            self.assertRaises(PixelFormatError, decode_pixels, pixels, pixel_format)
+
+    def test_pack_pixel_list(self):
+        self.assertEqual(pack_pixel_list(PIXELS, 64), PACKED)
+        self.assertRaises(PixelFormatError, pack_pixel_list, PIXELS, 63)
+        self.assertRaises(PixelFormatError, pack_pixel_list, "pixels", 64)
+
+
+class DecodeFramesTest(unittest.TestCase):
+    def test_json(self):
+        count, packed = decode_frames(json.dumps([PIXELS, PIXELS[::-1]]))
+        self.assertEqual(count, 2)
+        self.assertEqual(packed, PACKED + PACKED[::-1])
+
+    def test_hex(self):
+        count, packed = decode_frames(binascii.hexlify(RGB888 * 3).decode(), HEX)
+        self.assertEqual(count, 3)
+        self.assertEqual(packed, PACKED * 3)
+
+    def test_base64(self):
+        count, packed = decode_frames(base64.b64encode(RGB888 * 2).decode(), BASE64_RGB888)
+        self.assertEqual(count, 2)
+        self.assertEqual(packed, PACKED * 2)
+
+    def test_invalid(self):
+        self.assertRaises(PixelFormatError, decode_frames, "[]")
+        self.assertRaises(PixelFormatError, decode_frames, json.dumps([PIXELS, PIXELS[:10]]))
+        self.assertRaises(PixelFormatError, decode_frames, "00" * 100, HEX)
+
+
+if __name__ == "__main__":
+    unittest.main()
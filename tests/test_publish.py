@@ -0,0 +1,88 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from publish import Deadband, Publisher
+
+
+class Node(object):
+    def __init__(self, path, subscribed=True):
+        self.path = path
+        self.subscribed = subscribed
+        self.values = []
+
+    def is_subscribed(self):
+        return self.subscribed
+
+    def set_value(self, value):
+        self.values.append(value)
+
+
+def published(deadband, samples):
+    """
+    Feed (value, time) samples through a deadband.
+    :return: Values it published.
+    """
+    values = []
+    for value, now in samples:
+        if deadband.should_publish(value, now):
+            deadband.published(value, now)
+            values.append(value)
+    return values
+
+
+class DeadbandTest(unittest.TestCase):
+    def test_publishes_changes_only(self):
+        samples = [(1.0, 0), (1.0, 1), (2.0, 2), (2.0, 3), (1.0, 4)]
+        self.assertEqual(published(Deadband(), samples), [1.0, 2.0, 1.0])
+
+    def test_absolute(self):
+        samples = [(10.0, 0), (10.4, 1), (10.6, 2), (10.2, 3), (11.2, 4)]
+        self.assertEqual(published(Deadband(absolute=0.5), samples), [10.0, 10.6, 11.2])
+
+    def test_percent(self):
+        samples = [(100.0, 0), (101.0, 1), (103.0, 2), (104.0, 3)]
+        self.assertEqual(published(Deadband(percent=2.0), samples), [100.0, 103.0])
+
+    def test_min_interval(self):
+        samples = [(1.0, 0.0), (2.0, 0.5), (3.0, 1.0), (4.0, 1.5)]
+        self.assertEqual(published(Deadband(min_interval=1.0), samples), [1.0, 3.0])
+
+    def test_max_interval_heartbeat(self):
+        samples = [(5.0, 0), (5.0, 1), (5.0, 2), (5.0, 3), (5.0, 4)]
+        self.assertEqual(published(Deadband(absolute=1.0, max_interval=2.0), samples), [5.0, 5.0, 5.0])
+
+    def test_configure(self):
+        deadband = Deadband()
+        deadband.configure(1.0, 2.0, 3.0, 4.0)
+        self.assertEqual((deadband.absolute, deadband.percent, deadband.min_interval, deadband.max_interval),
+                         (1.0, 2.0, 3.0, 4.0))
+
+
+class PublisherTest(unittest.TestCase):
+    def test_counts(self):
+        publisher = Publisher()
+        node = Node("/temperature")
+        publisher.deadband(node).configure(0.5, 0.0, 0.0, 0.0)
+        for now, value in enumerate((20.0, 20.1, 21.0)):
+            publisher.publish(node, value, now)
+        self.assertEqual(node.values, [20.0, 21.0])
+        self.assertEqual((publisher.published, publisher.suppressed), (2, 1))
+
+    def test_unsubscribed_nodes_are_skipped(self):
+        publisher = Publisher()
+        node = Node("/humidity", subscribed=False)
+        self.assertFalse(publisher.publish(node, 1.0, 0))
+        self.assertEqual(node.values, [])
+        self.assertEqual((publisher.published, publisher.suppressed), (0, 0))
+
+    def test_deadband_per_path(self):
+        publisher = Publisher()
+        self.assertIs(publisher.deadband(Node("/a")), publisher.deadband(Node("/a")))
+        self.assertIsNot(publisher.deadband(Node("/a")), publisher.deadband(Node("/b")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from backend import ReplayBackend
+from recording import HEADER, RECORD, Recorder, SampleLog, read_log, segment_paths
+from stick import SenseStick
+
+# Room for three records per segment
+SEGMENT_SIZE = len(HEADER) + 3 * RECORD.size
+
+
+class RecordingTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def record(self, values, segment_size=SEGMENT_SIZE, max_segments=8):
+        recorder = Recorder(self.directory, segment_size, max_segments)
+        for i, value in enumerate(values):
+            recorder.record_value("/temperature", 100.0 + i, value)
+        recorder.close()
+        return recorder
+
+    def test_round_trip(self):
+        recorder = Recorder(self.directory)
+        recorder.record_value("/humidity", 10.0, 45.5)
+        recorder.record_stick(11.0, SenseStick.KEY_UP, SenseStick.STATE_PRESS)
+        recorder.close()
+        self.assertEqual(list(read_log(self.directory)), [
+            (10.0, 1, 0, 0, 45.5),
+            (11.0, 10, SenseStick.STATE_PRESS, SenseStick.KEY_UP, 0.0)
+        ])
+
+    def test_segments_roll_over(self):
+        recorder = self.record(range(10))
+        self.assertEqual(recorder.records, 10)
+        paths = segment_paths(self.directory)
+        self.assertEqual([os.path.basename(path) for path in paths],
+                         ["samples-%d.log" % i for i in range(1, 5)])
+        # The last segment is truncated to what was written
+        self.assertEqual(os.path.getsize(paths[-1]), len(HEADER) + RECORD.size)
+        self.assertEqual([record[4] for record in read_log(self.directory)], list(range(10)))
+
+    def test_oldest_segments_are_deleted(self):
+        self.record(range(10), max_segments=2)
+        self.assertEqual(len(segment_paths(self.directory)), 2)
+        self.assertEqual([record[4] for record in read_log(self.directory)], [6.0, 7.0, 8.0, 9.0])
+
+    def test_recording_continues_after_existing_segments(self):
+        self.record(range(4))
+        self.record(range(4, 6))
+        self.assertEqual([record[4] for record in read_log(self.directory)], list(range(6)))
+
+    def test_rejects_segments_without_room(self):
+        self.assertRaises(ValueError, Recorder, self.directory, len(HEADER))
+
+    def test_sample_log(self):
+        recorder = Recorder(self.directory)
+        recorder.record_value("/temperature", 10.0, 20.0)
+        recorder.record_value("/temperature", 12.0, 22.0)
+        recorder.record_stick(15.0, SenseStick.KEY_ENTER, SenseStick.STATE_RELEASE)
+        recorder.close()
+        log = SampleLog(self.directory)
+        self.assertEqual((log.start, log.end), (10.0, 15.0))
+        self.assertTrue(log.has("/temperature"))
+        self.assertFalse(log.has("/pressure"))
+        self.assertEqual([log.value_at("/temperature", t) for t in (5.0, 10.0, 11.9, 12.0, 30.0)],
+                         [20.0, 20.0, 20.0, 22.0, 22.0])
+        self.assertEqual(log.value_at("/pressure", 11.0), 0.0)
+        self.assertEqual(log.stick_events, [(15.0, SenseStick.KEY_ENTER, SenseStick.STATE_RELEASE)])
+
+    def test_empty_log(self):
+        Recorder(self.directory).close()
+        self.assertRaises(ValueError, SampleLog, self.directory)
+
+    def test_replay_needs_a_log(self):
+        self.assertRaises(ValueError, ReplayBackend, None)
+        self.assertRaises(ValueError, ReplayBackend, os.path.join(self.directory, "missing"))
+        self.assertRaises(ValueError, ReplayBackend, self.directory)
+        self.record([20.0])
+        self.assertRaises(ValueError, ReplayBackend, self.directory, speed=0)
+        backend = ReplayBackend(self.directory)
+        backend.open()
+        self.assertEqual(backend.temperature, 20.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from framebuffer import pack_pixel
+from rules import MAX_RULES, RuleError, RuleSet, compile_rule, parse_color
+from stick import SenseStick
+
+
+class Display(object):
+    """
+    Records the drawing calls of the actions.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name,) + args)
+
+
+class Device(object):
+    def __init__(self):
+        self.display = Display()
+        self.animations = {}
+        self.root = None
+
+
+def rule(when, do=None, otherwise=None):
+    spec = {"when": when, "do": do if do is not None else {"action": "fill", "color": "#ff0000"}}
+    if otherwise is not None:
+        spec["else"] = otherwise
+    return json.dumps(spec)
+
+
+class ParseColorTest(unittest.TestCase):
+    def test_formats(self):
+        self.assertEqual(parse_color("#102030"), [16, 32, 48])
+        self.assertEqual(parse_color("102030"), [16, 32, 48])
+        self.assertEqual(parse_color([1, 2, 3]), [1, 2, 3])
+        self.assertEqual(parse_color(0x102030), [16, 32, 48])
+
+    def test_invalid(self):
+        for color in ("#1020", "#gggggg", [1, 2], [1, 2, 256], True, -1, None):
+            self.assertRaises(RuleError, parse_color, color)
+
+
+class CompileRuleTest(unittest.TestCase):
+    def test_invalid(self):
+        device = Device()
+        invalid = (
+            "{",
+            json.dumps({"do": {"action": "clear"}}),
+            json.dumps({"when": {"path": "/temperature", "above": 30}}),
+            rule({"path": "temperature", "above": 30}),
+            rule({"path": "/temperature"}),
+            rule({"path": "/temperature", "above": "30"}),
+            rule({"key": "middle"}),
+            rule({"key": "up", "state": "HELD"}),
+            rule({"key": "up"}, {"action": "explode"}),
+            rule({"key": "up"}, {"action": "set_pixel", "x": 8, "y": 0}),
+            rule({"key": "up"}, {"action": "fill", "layer": "top"}),
+            rule({"key": "up"}, {"action": "set_pixels", "x": 4, "width": 8, "pixels": []}),
+            rule({"key": "up"}, {"action": "set_pixels", "width": 1, "height": 1, "pixels": [[0, 0]]}),
+            rule({"key": "up"}, {"action": "show_message"})
+        )
+        for text in invalid:
+            self.assertRaises(RuleError, compile_rule, "rule", text, device)
+
+    def test_threshold_with_hysteresis(self):
+        device = Device()
+        compiled = compile_rule("hot", rule({"path": "/temperature", "above": 30, "hysteresis": 1},
+                                            otherwise={"action": "clear"}), device)
+        self.assertEqual(compiled.source, "/temperature")
+        ran = [len(compiled.evaluate(value)) for value in (20, 31, 32, 29.5, 31, 29, 28, 31)]
+        self.assertEqual(ran, [0, 1, 0, 0, 0, 1, 0, 1])
+        self.assertEqual(compiled.fired, 2)
+
+    def test_below(self):
+        compiled = compile_rule("cold", rule({"path": "/temperature", "below": 10}), Device())
+        self.assertEqual([len(compiled.evaluate(value)) for value in (12, 9, 8, 10, 9)], [0, 1, 0, 0, 1])
+
+    def test_set_pixels(self):
+        device = Device()
+        pixels = [[255, 0, 0], [0, 255, 0]]
+        action = {"action": "set_pixels", "x": 6, "y": 7, "width": 2, "height": 1, "pixels": pixels,
+                  "layer": "overlay"}
+        compile_rule("pixels", rule({"key": "up"}, action), device).actions[0]()
+        name, x, y, width, height, values, layer = device.display.calls[0]
+        self.assertEqual((name, x, y, width, height, layer), ("set_region", 6, 7, 2, 1, "overlay"))
+        self.assertEqual(list(values), [pack_pixel(*pixel) for pixel in pixels])
+
+
+class RuleSetTest(unittest.TestCase):
+    def test_dispatch(self):
+        device = Device()
+        rules, errors = RuleSet.compile({
+            "hot": rule({"path": "/temperature", "above": 30}),
+            "up": rule({"key": "up", "state": "UP"}, {"action": "clear", "layer": "overlay"}),
+            "broken": "{"
+        }, device)
+        self.assertEqual(list(errors), ["broken"])
+        self.assertEqual(rules.paths, frozenset(["/temperature"]))
+        rules.value("/humidity", 100)
+        rules.key(SenseStick.KEY_UP, "DOWN")
+        self.assertEqual(device.display.calls, [])
+        rules.value("/temperature", 31)
+        rules.key(SenseStick.KEY_UP, "UP")
+        self.assertEqual([call[0] for call in device.display.calls], ["set_pixels", "clear"])
+        self.assertEqual(device.display.calls[1], ("clear", "overlay"))
+
+    def test_rules_over_the_limit_are_dropped(self):
+        definitions = dict(("rule%03d" % i, rule({"key": "up"})) for i in range(MAX_RULES + 2))
+        logger = logging.getLogger("DSLink")
+        logger.disabled = True
+        try:
+            rules, errors = RuleSet.compile(definitions, Device())
+        finally:
+            logger.disabled = False
+        self.assertEqual(errors, {})
+        self.assertEqual([r.name for r in rules.rules], sorted(definitions)[:MAX_RULES])
+
+    def test_key_else_runs_on_the_opposite_state(self):
+        device = Device()
+        rules, _ = RuleSet.compile({"up": rule({"key": "up"}, otherwise={"action": "clear"})}, device)
+        for state in ("DOWN", "UP", "DOWN"):
+            rules.key(SenseStick.KEY_UP, state)
+        self.assertEqual([call[0] for call in device.display.calls], ["set_pixels", "clear", "set_pixels"])
+        self.assertEqual(rules.rules[0].fired, 2)
+
+    def test_failing_action_is_contained(self):
+        device = Device()
+        rules, _ = RuleSet.compile({"a": rule({"key": "button"}, [{"action": "set_value", "path": "/x"},
+                                                                  {"action": "stop_animation"}])}, device)
+        device.root = object()
+        rules.key(SenseStick.KEY_ENTER, "DOWN")
+        self.assertEqual(device.display.calls, [("stop_playing",)])
+
+
+if __name__ == "__main__":
+    unittest.main()
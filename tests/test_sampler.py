@@ -0,0 +1,130 @@
+import math
+import os
+import sys
+from threading import Event
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from backend import ImuReading, SimulatedBackend, orientation_degrees, raw_imu
+from fusion import ImuCapture
+from sampler import IMU_SENSORS, SENSORS, SensorSampler
+
+
+class FailingBackend(SimulatedBackend):
+    @property
+    def humidity(self):
+        raise IOError("I2C read failed")
+
+
+class FixedImuBackend(SimulatedBackend):
+    """
+    IMU held still at a pose, with a fused orientation that is off by a few
+    degrees.
+    """
+
+    def read_imu(self):
+        self._read("imu")
+        roll, pitch, yaw = math.radians(10.0), math.radians(-20.0), math.radians(30.0)
+        orientation = orientation_degrees(roll + 0.1, pitch + 0.1, yaw)
+        return ImuReading(orientation, orientation["yaw"], raw_imu(roll, pitch, yaw))
+
+
+class SensorSamplerTest(unittest.TestCase):
+    def test_sample_reads_every_sensor(self):
+        sampler = SensorSampler(SimulatedBackend())
+        readings = sampler.sample(SENSORS)
+        self.assertEqual(set(readings), set(SENSORS))
+        self.assertAlmostEqual(readings["temperature"].value, 25.0)
+        for sensor in ("gyroscope", "accelerometer"):
+            self.assertEqual(set(readings[sensor].value), {"pitch", "roll", "yaw"})
+
+    def test_imu_sensors_share_one_read(self):
+        backend = SimulatedBackend()
+        sampler = SensorSampler(backend)
+        sampler.sample(IMU_SENSORS)
+        sampler.sample(IMU_SENSORS)
+        self.assertEqual(backend.reads, {"imu": 2, "imu_config": 1})
+        self.assertEqual(sampler.latency["imu"].count, 2)
+
+    def test_accelerometer_is_tilt_from_gravity(self):
+        backend = FixedImuBackend()
+        readings = SensorSampler(backend).sample(IMU_SENSORS)
+        reading = backend.read_imu()
+        accelerometer = readings["accelerometer"].value
+        self.assertAlmostEqual(accelerometer["roll"], 10.0)
+        self.assertAlmostEqual(accelerometer["pitch"], 340.0)
+        self.assertEqual(accelerometer["yaw"], reading.orientation["yaw"])
+        self.assertEqual(readings["gyroscope"].value, reading.orientation)
+        self.assertEqual(readings["compass"].value, reading.compass)
+
+    def test_imu_is_served_from_the_capture(self):
+        backend = SimulatedBackend()
+        capture = ImuCapture(backend, lambda block: None)
+        sampler = SensorSampler(backend, capture=capture)
+        capture.capturing = True
+        self.assertEqual(sampler.sample(IMU_SENSORS), {})
+        reading = backend.read_imu()
+        capture.latest = (123.0, reading)
+        readings = sampler.sample(IMU_SENSORS)
+        self.assertEqual(backend.reads["imu"], 1)
+        self.assertEqual(readings["gyroscope"], (reading.orientation, 123.0))
+        self.assertEqual(readings["compass"], (reading.compass, 123.0))
+        capture.capturing = False
+        capture.latest = None
+        sampler.sample(IMU_SENSORS)
+        self.assertEqual(backend.reads["imu"], 2)
+
+    def test_snapshot_is_replaced(self):
+        sampler = SensorSampler(SimulatedBackend())
+        sampler.sample(["temperature"])
+        first = sampler.snapshot
+        sampler.sample(["pressure"])
+        self.assertEqual(set(first), {"temperature"})
+        self.assertEqual(set(sampler.snapshot), {"temperature", "pressure"})
+        self.assertIsNot(first, sampler.snapshot)
+
+    def test_failed_read_is_left_out(self):
+        sampler = SensorSampler(FailingBackend())
+        readings = sampler.sample(["temperature", "humidity"])
+        self.assertEqual(set(readings), {"temperature"})
+
+    def test_stale_imu_read_is_left_out(self):
+        backend = SimulatedBackend(imu_rate=0.001)
+        sampler = SensorSampler(backend)
+        sensors = IMU_SENSORS + ("temperature",)
+        self.assertEqual(set(sampler.sample(sensors)), set(sensors))
+        # No new sample for another thousand seconds
+        self.assertEqual(set(sampler.sample(sensors)), {"temperature"})
+        self.assertEqual(backend.reads["imu"], 2)
+
+    def test_configure_rejects_invalid_intervals(self):
+        sampler = SensorSampler(SimulatedBackend())
+        for interval in (0, -1, True, "1"):
+            self.assertRaises(ValueError, sampler.configure, "temperature", interval)
+        self.assertEqual(sampler.intervals["temperature"], 0.5)
+        sampler.configure("temperature", 2)
+        self.assertEqual(sampler.intervals["temperature"], 2.0)
+
+    def test_reads_only_enabled_sensors(self):
+        passes = []
+        done = Event()
+
+        def callback(readings):
+            passes.append(readings)
+            if len(passes) == 3:
+                done.set()
+
+        sampler = SensorSampler(SimulatedBackend(), callback)
+        sampler.configure("temperature", 0.01, True)
+        sampler.start()
+        try:
+            self.assertTrue(done.wait(5))
+        finally:
+            sampler.stop()
+        for readings in passes:
+            self.assertEqual(set(readings), {"temperature"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+from datetime import datetime
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from subscriptions import BatchingSubscriptionManager
+from timing import monotonic
+
+
+class Storage(object):
+    def read(self):
+        return {}
+
+    def get_updates(self, path, sid):
+        return None
+
+
+class Connection(object):
+    def __init__(self):
+        self.messages = []
+
+    def sendMessage(self, message):
+        self.messages.append(message)
+
+
+class Link(object):
+    def __init__(self):
+        self.active = True
+        self.storage = Storage()
+        self.wsp = Connection()
+
+
+class Value(object):
+    def __init__(self, value):
+        self.value = value
+        self.updated_at = datetime(2020, 1, 1)
+
+
+class Node(object):
+    def __init__(self, path):
+        self.path = path
+        self.value = None
+
+    def update_subscribers_values(self):
+        pass
+
+    def set_value(self, manager, value):
+        self.value = Value(value)
+        manager.send_value_update(self)
+
+
+class BatchingSubscriptionManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.link = Link()
+        self.nodes = [Node("/temperature"), Node("/humidity")]
+
+    def tearDown(self):
+        if self.manager._flush_call is not None:
+            self.manager._flush_call.cancel()
+
+    def create(self, flush_window=0.0, max_rate=0.0):
+        self.manager = BatchingSubscriptionManager(self.link, flush_window, max_rate)
+        for sid, node in enumerate(self.nodes, 1):
+            self.manager.add_value_sub(node, sid)
+        return self.manager
+
+    def sent(self):
+        """
+        :return: Sids and values of every message sent, oldest first.
+        """
+        return [[(update[0], update[1]) for update in message["responses"][0]["updates"]]
+                for message in self.link.wsp.messages]
+
+    def test_updates_are_batched_and_coalesced(self):
+        manager = self.create(flush_window=0.5)
+        temperature, humidity = self.nodes
+        temperature.set_value(manager, 20.0)
+        self.assertAlmostEqual(manager._flush_at - monotonic(), 0.5, 1)
+        temperature.set_value(manager, 21.0)
+        humidity.set_value(manager, 40.0)
+        manager.flush()
+        self.assertEqual(sorted(self.sent()[0]), [(1, 21.0), (2, 40.0)])
+        self.assertEqual((manager.messages, manager.updates, manager.coalesced), (1, 2, 1))
+        self.assertIsNone(manager._flush_call)
+
+    def test_held_back_subscription_does_not_delay_others(self):
+        manager = self.create(max_rate=1.0)
+        temperature, humidity = self.nodes
+        temperature.set_value(manager, 20.0)
+        manager.flush()
+        # Held back for a second by the rate limit
+        temperature.set_value(manager, 21.0)
+        held = manager._flush_call
+        self.assertAlmostEqual(manager._flush_at - monotonic(), 1.0, 1)
+        # Not limited, so the flush is brought forward
+        humidity.set_value(manager, 40.0)
+        self.assertFalse(held.active())
+        self.assertLess(manager._flush_at - monotonic(), 0.1)
+        manager.flush()
+        self.assertEqual(self.sent(), [[(1, 20.0)], [(2, 40.0)]])
+        self.assertEqual(list(manager.pending), [1])
+        self.assertAlmostEqual(manager._flush_at - monotonic(), 1.0, 1)
+
+    def test_remove_value_sub_drops_pending(self):
+        manager = self.create(flush_window=0.5)
+        self.nodes[0].set_value(manager, 20.0)
+        manager.remove_value_sub(1)
+        manager.flush()
+        self.assertEqual(self.link.wsp.messages, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
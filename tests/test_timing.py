@@ -0,0 +1,103 @@
+import os
+import sys
+from threading import Event
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from metrics import TickTimer
+from timing import CATCH_UP, MAX_CATCH_UP, SKIP, STRETCH, Schedule, check_interval, monotonic, sleep_until, \
+    to_monotonic
+
+
+def overrun(policy, ended, ticks=None):
+    """
+    Deadlines of a 1 s schedule started at 0 after a first run that ended
+    at a time, and after three more runs that each take no time.
+    """
+    schedule = Schedule(1.0, policy, ticks)
+    schedule.start(0.0)
+    schedule.begin(0.0)
+    deadlines = [schedule.advance(ended)]
+    for _ in range(3):
+        now = max(ended, schedule.due)
+        schedule.begin(now)
+        deadlines.append(schedule.advance(now))
+    return deadlines
+
+
+class ScheduleTest(unittest.TestCase):
+    def test_on_time(self):
+        self.assertEqual(overrun(SKIP, 0.2), [1.0, 2.0, 3.0, 4.0])
+
+    def test_skip_stays_in_phase(self):
+        ticks = TickTimer()
+        self.assertEqual(overrun(SKIP, 3.5, ticks), [4.0, 5.0, 6.0, 7.0])
+        self.assertEqual(ticks.skipped, 3)
+
+    def test_catch_up_runs_back_to_back(self):
+        self.assertEqual(overrun(CATCH_UP, 3.5), [1.0, 2.0, 3.0, 4.0])
+
+    def test_catch_up_starts_over_when_far_behind(self):
+        ended = 1.5 + MAX_CATCH_UP
+        self.assertEqual(overrun(CATCH_UP, ended), [ended, ended + 1, ended + 2, ended + 3])
+
+    def test_stretch_shifts_the_phase(self):
+        self.assertEqual(overrun(STRETCH, 3.5), [3.5, 4.5, 5.5, 6.5])
+
+    def test_ticks(self):
+        ticks = TickTimer()
+        schedule = Schedule(1.0, SKIP, ticks)
+        schedule.start(0.0)
+        for started in (0.5, 1.25, 2.0):
+            schedule.begin(started)
+            schedule.advance(started)
+        # The first run is not measured
+        self.assertEqual(ticks.overruns, 0)
+        # Started a whole interval after it was due
+        schedule.begin(4.0)
+        self.assertEqual(ticks.overruns, 1)
+
+    def test_set_interval(self):
+        schedule = Schedule(1.0)
+        schedule.set_interval(3)
+        self.assertEqual((schedule.interval, schedule.due), (3.0, None))
+        schedule.start(10.0)
+        schedule.begin(10.0)
+        schedule.set_interval(0.5)
+        self.assertEqual(schedule.due, 10.5)
+        self.assertEqual(schedule.advance(10.1), 11.0)
+        self.assertRaises(ValueError, schedule.set_interval, 0)
+        self.assertEqual(schedule.interval, 0.5)
+
+    def test_delay(self):
+        schedule = Schedule(1.0)
+        schedule.start(5.0)
+        self.assertEqual(schedule.delay(3.0), 2.0)
+        self.assertEqual(schedule.delay(6.0), 0.0)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, Schedule, 1.0, "later")
+        for interval in (0, -1, True, "1", None):
+            self.assertRaises(ValueError, check_interval, interval)
+        self.assertEqual(check_interval(2), 2.0)
+
+
+class ClockTest(unittest.TestCase):
+    def test_sleep_until(self):
+        start = monotonic()
+        sleep_until(start + 0.02)
+        self.assertGreaterEqual(monotonic() - start, 0.02)
+        wake = Event()
+        wake.set()
+        start = monotonic()
+        sleep_until(start + 10.0, wake)
+        self.assertLess(monotonic() - start, 1.0)
+
+    def test_to_monotonic(self):
+        self.assertAlmostEqual(to_monotonic(time.time() + 1.0) - monotonic(), 1.0, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import cmath
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import vibration
+from vibration import MAX_BANDS, VibrationAnalyser, _fft, numpy, parse_bands, window_size
+
+RATE = 500.0
+
+
+class Block(object):
+    """
+    The parts of a FusedBlock the analyser reads.
+    """
+
+    def __init__(self, times, raw):
+        self.times = times
+        self.timestamps = [1000.0 + t for t in times]
+        self.raw = numpy.array(raw) if vibration.numpy is not None else raw
+
+
+def shaking(count, frequency, amplitude=0.1, start=0):
+    """
+    Block of an IMU lying flat and shaken along z at a frequency in Hz.
+    """
+    times = [(start + i) / RATE for i in range(count)]
+    raw = [(0.0, 0.0, 1.0 + amplitude * math.sin(2 * math.pi * frequency * t)) + (0.0,) * 6 for t in times]
+    return Block(times, raw)
+
+
+class ParseBandsTest(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(parse_bands(" 0-10, 10-50.5,,"), [(0.0, 10.0), (10.0, 50.5)])
+        self.assertEqual(parse_bands(""), [])
+
+    def test_invalid(self):
+        for text in ("10", "a-b", "0-10-20", "10-5", "5-5", "-1-5"):
+            self.assertRaises(ValueError, parse_bands, text)
+        self.assertRaises(ValueError, parse_bands, ",".join("%d-%d" % (i, i + 1) for i in range(MAX_BANDS + 1)))
+
+    def test_window_size(self):
+        self.assertEqual([window_size(size) for size in (1, 8, 100, 256, 300, 100000)],
+                         [8, 8, 64, 256, 256, 8192])
+
+
+class FftTest(unittest.TestCase):
+    def test_matches_the_dft(self):
+        n = 32
+        values = [math.sin(i * 0.7) + 0.3 * math.cos(i * 2.1) + 0.1 * i for i in range(n)]
+        dft = [sum(values[j] * cmath.exp(-2j * math.pi * j * k / n) for j in range(n)) for k in range(n)]
+        for actual, expected in zip(_fft(values), dft):
+            self.assertAlmostEqual(abs(actual - expected), 0.0)
+
+
+class VibrationAnalyserTest(unittest.TestCase):
+    def analyse(self):
+        analyser = VibrationAnalyser(256)
+        self.assertEqual(analyser.add(shaking(200, 75.0)), [])
+        results = analyser.add(shaking(200, 75.0, start=200))
+        self.assertEqual(len(results), 1)
+        self.assertEqual(analyser.windows, 1)
+        self.assertEqual(len(analyser._values), 144)
+        return results[0]
+
+    def test_tone(self):
+        result = self.analyse()
+        self.assertAlmostEqual(result.sample_rate, RATE)
+        self.assertAlmostEqual(result.rms, 0.1 / math.sqrt(2), 3)
+        self.assertAlmostEqual(result.crest_factor, math.sqrt(2), 1)
+        self.assertLessEqual(abs(result.frequency - 75.0), RATE / 256)
+        # Nearly all of it in the 50-100 Hz band, and the bands add up to
+        # the mean square
+        self.assertGreater(result.band_energy[2], 0.99 * sum(result.band_energy))
+        self.assertAlmostEqual(sum(result.band_energy) / result.rms ** 2, 1.0, 2)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_fallback_matches_numpy(self):
+        expected = self.analyse()
+        try:
+            vibration.numpy = None
+            actual = self.analyse()
+        finally:
+            vibration.numpy = numpy
+        for name in ("sample_rate", "rms", "peak", "crest_factor", "frequency"):
+            self.assertAlmostEqual(getattr(actual, name), getattr(expected, name))
+        for energy, wanted in zip(actual.band_energy, expected.band_energy):
+            self.assertAlmostEqual(energy, wanted)
+
+
+if __name__ == "__main__":
+    unittest.main()